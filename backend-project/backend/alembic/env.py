@@ -27,7 +27,7 @@ if config.config_file_name is not None:
 # for 'autogenerate' support
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
-from sql_app.models import Base
+from sql_app_2.models import Base
 target_metadata = Base.metadata
 
 # other values from the config, defined by the needs of env.py,
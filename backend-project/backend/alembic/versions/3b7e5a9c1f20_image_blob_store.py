@@ -0,0 +1,39 @@
+"""image blob store columns
+
+Revision ID: 3b7e5a9c1f20
+Revises: d409bca2fc9d
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7e5a9c1f20'
+down_revision: Union[str, None] = 'd409bca2fc9d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    for table in ('original_images', 'interpreted_images'):
+        op.add_column(table, sa.Column('storage_key', sa.String(length=64), nullable=True))
+        op.add_column(table, sa.Column('mime_type', sa.String(length=50), nullable=True))
+        op.add_column(table, sa.Column('width', sa.Integer(), nullable=True))
+        op.add_column(table, sa.Column('height', sa.Integer(), nullable=True))
+        op.add_column(table, sa.Column('byte_size', sa.Integer(), nullable=True))
+        op.create_index(op.f(f'ix_{table}_storage_key'), table, ['storage_key'], unique=False)
+        op.alter_column(table, 'image', existing_type=mysql.MEDIUMTEXT(), nullable=True)
+
+
+def downgrade() -> None:
+    for table in ('original_images', 'interpreted_images'):
+        op.drop_index(op.f(f'ix_{table}_storage_key'), table_name=table)
+        op.drop_column(table, 'byte_size')
+        op.drop_column(table, 'height')
+        op.drop_column(table, 'width')
+        op.drop_column(table, 'mime_type')
+        op.drop_column(table, 'storage_key')
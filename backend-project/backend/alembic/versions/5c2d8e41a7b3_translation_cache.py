@@ -0,0 +1,38 @@
+"""translation cache
+
+Revision ID: 5c2d8e41a7b3
+Revises: 3b7e5a9c1f20
+Create Date: 2026-10-18 14:03:27.511842
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision: str = '5c2d8e41a7b3'
+down_revision: Union[str, None] = '3b7e5a9c1f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('translation_cache',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('text_hash', sa.String(length=64), nullable=True),
+    sa.Column('target_lang', sa.String(length=5), nullable=True),
+    sa.Column('model', sa.String(length=50), nullable=True),
+    sa.Column('source_text', mysql.MEDIUMTEXT(), nullable=True),
+    sa.Column('translated_text', mysql.MEDIUMTEXT(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('text_hash', 'target_lang', 'model', name='uq_translation_cache_key')
+    )
+    op.create_index(op.f('ix_translation_cache_text_hash'), 'translation_cache', ['text_hash'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_translation_cache_text_hash'), table_name='translation_cache')
+    op.drop_table('translation_cache')
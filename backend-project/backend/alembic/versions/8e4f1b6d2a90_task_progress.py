@@ -0,0 +1,35 @@
+"""task progress columns
+
+Revision ID: 8e4f1b6d2a90
+Revises: 5c2d8e41a7b3
+Create Date: 2026-10-18 16:41:05.207319
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '8e4f1b6d2a90'
+down_revision: Union[str, None] = '5c2d8e41a7b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('tasks', sa.Column('name', sa.String(length=100), nullable=True))
+    op.add_column('tasks', sa.Column('status', sa.String(length=20), nullable=True))
+    op.add_column('tasks', sa.Column('progress', sa.Integer(), nullable=True))
+    op.add_column('tasks', sa.Column('total', sa.Integer(), nullable=True))
+    op.add_column('tasks', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_tasks_name'), 'tasks', ['name'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_tasks_name'), table_name='tasks')
+    op.drop_column('tasks', 'updated_at')
+    op.drop_column('tasks', 'total')
+    op.drop_column('tasks', 'progress')
+    op.drop_column('tasks', 'status')
+    op.drop_column('tasks', 'name')
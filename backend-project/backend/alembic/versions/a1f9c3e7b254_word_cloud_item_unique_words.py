@@ -0,0 +1,67 @@
+"""unique words per word cloud
+
+Revision ID: a1f9c3e7b254
+Revises: 8e4f1b6d2a90
+Create Date: 2026-10-18 18:22:50.671934
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1f9c3e7b254'
+down_revision: Union[str, None] = '8e4f1b6d2a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# item table -> (link table, link column)
+TABLES = {
+    'mistake_word_cloud_items': ('mistake_word_cloud_item_generations', 'generation_id'),
+    'writing_word_cloud_items': ('writing_word_cloud_item_generations', 'generation_id'),
+    'user_chat_word_cloud_items': ('user_chat_word_cloud_item_chats', 'message_id'),
+    'assistant_chat_word_cloud_items': ('assistant_chat_word_cloud_item_chats', 'message_id'),
+}
+
+
+def upgrade() -> None:
+    for table, (link_table, link_column) in TABLES.items():
+        # merge duplicate (word_cloud_id, word) rows into the lowest id before adding the key
+        op.execute(f"""
+            CREATE TEMPORARY TABLE tmp_word_dups AS
+            SELECT d.id AS dup_id, k.keep_id
+            FROM {table} d
+            JOIN (
+                SELECT word_cloud_id, word, MIN(id) AS keep_id
+                FROM {table}
+                GROUP BY word_cloud_id, word
+                HAVING COUNT(*) > 1
+            ) k ON d.word_cloud_id = k.word_cloud_id AND d.word = k.word AND d.id <> k.keep_id
+        """)
+        op.execute(f"""
+            INSERT IGNORE INTO {link_table} ({link_column}, word_cloud_item_id)
+            SELECT l.{link_column}, t.keep_id
+            FROM {link_table} l JOIN tmp_word_dups t ON l.word_cloud_item_id = t.dup_id
+        """)
+        op.execute(f"""
+            DELETE l FROM {link_table} l JOIN tmp_word_dups t ON l.word_cloud_item_id = t.dup_id
+        """)
+        op.execute(f"""
+            UPDATE {table} k
+            JOIN (
+                SELECT t.keep_id, SUM(d.frequency) AS extra
+                FROM tmp_word_dups t JOIN {table} d ON d.id = t.dup_id
+                GROUP BY t.keep_id
+            ) s ON k.id = s.keep_id
+            SET k.frequency = k.frequency + s.extra
+        """)
+        op.execute(f"""
+            DELETE d FROM {table} d JOIN tmp_word_dups t ON d.id = t.dup_id
+        """)
+        op.execute("DROP TEMPORARY TABLE tmp_word_dups")
+        op.create_unique_constraint(f'uq_{table}_cloud_word', table, ['word_cloud_id', 'word'])
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_constraint(f'uq_{table}_cloud_word', table, type_='unique')
@@ -0,0 +1,53 @@
+"""composite indexes for the hot filters
+
+Revision ID: b7d2e9f4c613
+Revises: a1f9c3e7b254
+Create Date: 2026-10-18 20:05:13.418207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d2e9f4c613'
+down_revision: Union[str, None] = 'a1f9c3e7b254'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# name -> (table, columns); tests/test_query_plans.py checks the queries that use them
+INDEXES = {
+    'ix_rounds_leaderboard_completed': ('rounds', ['leaderboard_id', 'is_completed']),
+    'ix_rounds_player_leaderboard_completed': ('rounds', ['player_id', 'leaderboard_id', 'is_completed']),
+    'ix_rounds_program_completed': ('rounds', ['program_id', 'is_completed']),
+    'ix_generations_round_completed_score': ('generations', ['round_id', 'is_completed', 'total_score']),
+    'ix_school_leaderboards_school_course': ('school_leaderboards', ['school', 'course_id', 'leaderboard_id']),
+    'ix_leaderboards_public_published': ('leaderboards', ['is_public', 'published_at']),
+    'ix_messages_chat_sender': ('messages', ['chat_id', 'sender']),
+    'ix_user_actions_user_action': ('user_actions', ['user_id', 'action']),
+    'ix_user_actions_action': ('user_actions', ['action']),
+}
+
+
+def upgrade() -> None:
+    for name, (table, columns) in INDEXES.items():
+        op.create_index(name, table, columns, unique=False)
+
+
+# MySQL drops the index it created for a foreign key once another index starts with that
+# column, and refuses to drop the last index a foreign key can use
+FOREIGN_KEY_LEADING = {
+    'ix_rounds_leaderboard_completed',
+    'ix_rounds_player_leaderboard_completed',
+    'ix_rounds_program_completed',
+    'ix_generations_round_completed_score',
+    'ix_messages_chat_sender',
+    'ix_user_actions_user_action',
+}
+
+
+def downgrade() -> None:
+    for name, (table, columns) in reversed(INDEXES.items()):
+        if name in FOREIGN_KEY_LEADING:
+            op.create_index(op.f(f'ix_{table}_{columns[0]}'), table, [columns[0]], unique=False)
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,27 @@
+"""generations.total_score not null, so the score listing pages on the plain column
+
+Revision ID: c4e8a2f6d913
+Revises: f6b2d9a41c07
+Create Date: 2026-10-19 10:12:37.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8a2f6d913'
+down_revision: Union[str, None] = 'f6b2d9a41c07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # unscored rows already sorted as 0 through COALESCE
+    op.execute("UPDATE generations SET total_score = 0 WHERE total_score IS NULL")
+    op.alter_column('generations', 'total_score', existing_type=sa.Integer(), nullable=False, server_default='0')
+
+
+def downgrade() -> None:
+    op.alter_column('generations', 'total_score', existing_type=sa.Integer(), nullable=True, server_default=None)
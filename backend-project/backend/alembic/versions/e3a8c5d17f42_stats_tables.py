@@ -0,0 +1,76 @@
+"""summary tables for the stats endpoints
+
+Revision ID: e3a8c5d17f42
+Revises: b7d2e9f4c613
+Create Date: 2026-10-18 22:41:06.203514
+
+The tables start empty; fill them with tasks.reconcile_stats (see readme).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3a8c5d17f42'
+down_revision: Union[str, None] = 'b7d2e9f4c613'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def counter(name: str) -> sa.Column:
+    return sa.Column(name, sa.Integer(), server_default='0', nullable=False)
+
+
+def upgrade() -> None:
+    op.create_table('leaderboard_round_stats',
+    sa.Column('leaderboard_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('school', sa.String(length=100), nullable=False),
+    sa.Column('user_type', sa.String(length=25), nullable=False),
+    sa.Column('program_id', sa.Integer(), autoincrement=False, nullable=False),
+    counter('n_rounds'),
+    counter('n_generations'),
+    counter('score_sum'),
+    counter('max_score'),
+    counter('rank_a'),
+    counter('rank_b'),
+    counter('rank_c'),
+    counter('rank_d'),
+    counter('rank_e'),
+    counter('rank_f'),
+    sa.PrimaryKeyConstraint('leaderboard_id', 'school', 'user_type', 'program_id')
+    )
+    op.create_table('player_stats',
+    sa.Column('player_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('leaderboard_id', sa.Integer(), autoincrement=False, nullable=False),
+    counter('n_rounds'),
+    counter('n_generations'),
+    counter('score_sum'),
+    counter('max_score'),
+    sa.PrimaryKeyConstraint('player_id', 'leaderboard_id')
+    )
+    op.create_table('chat_stats',
+    sa.Column('chat_id', sa.Integer(), autoincrement=False, nullable=False),
+    counter('n_messages'),
+    counter('n_user_messages'),
+    counter('n_assistant_messages'),
+    counter('n_hints'),
+    counter('n_evaluations'),
+    sa.PrimaryKeyConstraint('chat_id')
+    )
+    op.create_table('school_user_stats',
+    sa.Column('school', sa.String(length=100), nullable=False),
+    sa.Column('course_id', sa.Integer(), autoincrement=False, nullable=False),
+    counter('n_users'),
+    counter('n_active_users'),
+    sa.PrimaryKeyConstraint('school', 'course_id')
+    )
+    op.create_index('ix_users_school_active', 'users', ['school', 'is_active'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_school_active', table_name='users')
+    op.drop_table('school_user_stats')
+    op.drop_table('chat_stats')
+    op.drop_table('player_stats')
+    op.drop_table('leaderboard_round_stats')
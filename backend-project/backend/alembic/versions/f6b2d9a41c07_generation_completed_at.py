@@ -0,0 +1,37 @@
+"""completion time watermark for the generation word clouds
+
+Revision ID: f6b2d9a41c07
+Revises: e3a8c5d17f42
+Create Date: 2026-10-18 23:32:48.915370
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6b2d9a41c07'
+down_revision: Union[str, None] = 'e3a8c5d17f42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('generations', sa.Column('completed_at', sa.DateTime(), nullable=True))
+    op.add_column('word_clouds', sa.Column('latest_completed_at', sa.DateTime(), nullable=True))
+    # the completion time of older generations is unknown; their creation time keeps the id order
+    op.execute("UPDATE generations SET completed_at = created_at WHERE is_completed = 1")
+    # carry the id watermark of the mistake and writing clouds over to the new order
+    op.execute(
+        "UPDATE word_clouds "
+        "JOIN leaderboard_analysis_word_clouds ON leaderboard_analysis_word_clouds.word_cloud_id = word_clouds.id "
+        "JOIN generations ON generations.id = word_clouds.latest_generation_id "
+        "SET word_clouds.latest_completed_at = generations.completed_at "
+        "WHERE leaderboard_analysis_word_clouds.type IN ('mistake', 'writing')"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('word_clouds', 'latest_completed_at')
+    op.drop_column('generations', 'completed_at')
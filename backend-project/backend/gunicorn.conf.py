@@ -0,0 +1,38 @@
+"""Multi-worker deployment of main:app.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+Round state lives in Redis (sql_app_2/dependencies/round_session.py), so a reconnecting
+socket may land on any worker. Every worker runs the FastAPI startup hooks itself.
+"""
+import multiprocessing, os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(multiprocessing.cpu_count(), 4))))
+# the workers inherit it; sql_app_2/database.py splits the connection pools between them
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# sockets are long-lived and evaluate waits for the image model, so the worker heartbeat
+# must outlast the slowest action rather than the slowest HTTP request
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "60"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# recycle workers now and then so per-process caches and pools do not grow without bound
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "*")
+reload = os.getenv("GUNICORN_RELOAD", "false").lower() in ("1", "true", "yes")
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOGLEVEL", "info")
+
+
+def child_exit(server, worker):
+    # prometheus_client multiprocess mode: forget the files of a worker that is gone
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,202 @@
+"""Timers, Prometheus histograms and optional OpenTelemetry spans.
+
+`span` (context manager) and `timed` (decorator, sync or async) time a block into
+`avery_operation_seconds{kind, name}`. They also open an OpenTelemetry span when
+`opentelemetry-api` is installed; spans are exported once `setup_tracing` has found
+`opentelemetry-sdk`, the OTLP exporter and OTEL_EXPORTER_OTLP_ENDPOINT. `kind` and `name`
+become metric labels, so keep them to a small set: model and task names, not ids.
+
+Spans are opened in three shared places:
+
+- every LLM call, in llm_scheduler
+- every Celery task, through the signals connected by `instrument_celery`
+- every database transaction, through the session events from `instrument_sessions`
+
+`memory_snapshot` runs tracemalloc for a short window on demand (see the admin router);
+it is off otherwise.
+"""
+import asyncio, functools, inspect, logging, os, time, tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Optional
+
+from prometheus_client import Histogram
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+try:
+    from opentelemetry import context as otel_context, trace
+except ImportError:
+    trace = None
+
+logger = logging.getLogger("instrumentation")
+
+OPERATION_SECONDS = Histogram(
+    "avery_operation_seconds", "Duration of LLM calls, Celery tasks, DB transactions and timed code",
+    ["kind", "name"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160),
+)
+
+MEMORY_SNAPSHOT_MAX_SECONDS = float(os.getenv("MEMORY_SNAPSHOT_MAX_SECONDS", "60"))
+
+
+def _tracer():
+    return trace.get_tracer("avery") if trace is not None else None
+
+
+def setup_tracing(service_name: str) -> bool:
+    """Export spans over OTLP when the SDK is installed and OTEL_EXPORTER_OTLP_ENDPOINT is set."""
+    if trace is None or not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return False
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning("OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk or the OTLP exporter is missing")
+        return False
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    return True
+
+
+@contextmanager
+def span(name: str, kind: str = "code", **attributes):
+    """Time the block; yields the OpenTelemetry span, or None without opentelemetry."""
+    tracer = _tracer()
+    start = time.perf_counter()
+    try:
+        with (tracer.start_as_current_span(f"{kind} {name}", attributes=attributes) if tracer else nullcontext()) as current:
+            yield current
+    finally:
+        OPERATION_SECONDS.labels(kind, name).observe(time.perf_counter() - start)
+
+
+def timed(name: Optional[str] = None, kind: str = "code"):
+    def decorator(fn):
+        label = name or fn.__qualname__
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(label, kind):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(label, kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class OpenSpan:
+    """A span whose start and end happen in different callbacks (signals, session events).
+
+    With `activate`, spans opened until `end` become its children; `end` must then run in
+    the same thread or task.
+    """
+
+    def __init__(self, name: str, kind: str, activate: bool = False, **attributes):
+        self.name = name
+        self.kind = kind
+        tracer = _tracer()
+        self.span = tracer.start_span(f"{kind} {name}", attributes=attributes) if tracer else None
+        self._token = otel_context.attach(trace.set_span_in_context(self.span)) if activate and self.span else None
+        self.start = time.perf_counter()
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        OPERATION_SECONDS.labels(self.kind, self.name).observe(time.perf_counter() - self.start)
+        if self._token is not None:
+            otel_context.detach(self._token)
+        if self.span is not None:
+            if error is not None:
+                self.span.record_exception(error)
+                self.span.set_status(trace.Status(trace.StatusCode.ERROR, str(error)))
+            self.span.end()
+
+
+def _after_begin(session, transaction, connection):
+    if "transaction_span" not in session.info:
+        session.info["transaction_span"] = OpenSpan("transaction", "db")
+
+
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None and "transaction_span" in session.info:
+        session.info.pop("transaction_span").end()
+
+
+def instrument_sessions() -> None:
+    """One span per outermost transaction of every Session (AsyncSession runs one inside)."""
+    if not event.contains(Session, "after_begin", _after_begin):
+        event.listen(Session, "after_begin", _after_begin)
+        event.listen(Session, "after_transaction_end", _after_transaction_end)
+
+
+def instrument_celery(service_name: str = "avery-worker") -> None:
+    from celery import signals
+
+    open_spans = {}
+
+    @signals.worker_process_init.connect(weak=False)
+    def setup_worker_tracing(**kwargs):
+        # the exporter's thread does not survive the fork, so each pool process sets up its own
+        setup_tracing(service_name)
+
+    @signals.task_prerun.connect(weak=False)
+    def start_task_span(task_id=None, task=None, **kwargs):
+        open_spans[task_id] = OpenSpan(task.name, "task", activate=True, task_id=task_id)
+
+    @signals.task_postrun.connect(weak=False)
+    def end_task_span(task_id=None, **kwargs):
+        current = open_spans.pop(task_id, None)
+        if current is not None:
+            current.end()
+
+    @signals.task_failure.connect(weak=False)
+    def fail_task_span(task_id=None, exception=None, **kwargs):
+        # task_postrun still follows and ends the span
+        current = open_spans.get(task_id)
+        if current is not None and current.span is not None:
+            current.span.record_exception(exception)
+            current.span.set_status(trace.Status(trace.StatusCode.ERROR, str(exception)))
+
+
+_snapshot_lock = asyncio.Lock()
+
+
+def _compare(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, top: int) -> list:
+    return [
+        {
+            "where": str(stat.traceback),
+            "size_diff": stat.size_diff,
+            "size": stat.size,
+            "count_diff": stat.count_diff,
+            "count": stat.count,
+        }
+        for stat in after.compare_to(before, "lineno")[:top]
+    ]
+
+
+async def memory_snapshot(seconds: float, top: int = 20, frames: int = 1) -> list:
+    """Allocation growth by line over a window of `seconds`, biggest first.
+
+    tracemalloc slows every allocation while it runs, so it is started here and stopped
+    again, unless something else had already started it.
+    """
+    if _snapshot_lock.locked():
+        raise RuntimeError("A memory snapshot is already running")
+    seconds = min(seconds, MEMORY_SNAPSHOT_MAX_SECONDS)
+    async with _snapshot_lock:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(frames)
+        try:
+            before = await asyncio.to_thread(tracemalloc.take_snapshot)
+            await asyncio.sleep(seconds)
+            after = await asyncio.to_thread(tracemalloc.take_snapshot)
+        finally:
+            if started:
+                tracemalloc.stop()
+        return await asyncio.to_thread(_compare, before, after, top)
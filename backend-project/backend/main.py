@@ -10,6 +10,16 @@ app = FastAPI()
 
 app.mount("/sqlapp2", subapi_2)
 
+# Starlette does not send lifespan events to mounted apps, so run the sub-app's hooks here
+@app.on_event("startup")
+async def startup_subapi_2() -> None:
+    await subapi_2.router.startup()
+
+
+@app.on_event("shutdown")
+async def shutdown_subapi_2() -> None:
+    await subapi_2.router.shutdown()
+
 
 
 
@@ -0,0 +1,111 @@
+"""Write-behind buffer for `user_actions`.
+
+Routes and the round WebSocket log an action per request. `record` stamps the row and
+puts it on an in-process queue; one task per worker writes the queue with a multi-row
+INSERT every USER_ACTION_FLUSH_MS or USER_ACTION_BATCH_SIZE rows, whichever comes first.
+A full queue makes `record` wait (backpressure) instead of growing without bound.
+Rows still queued are written by `stop`, which runs on shutdown. A failed batch is logged
+and dropped: this is telemetry and must not fail the request that produced it.
+"""
+import asyncio, datetime, logging, os, zoneinfo
+from typing import List, Optional
+
+from . import crud_async, schemas
+from .database import AsyncSessionLocal2
+
+logger = logging.getLogger(__name__)
+
+JST = zoneinfo.ZoneInfo("Asia/Tokyo")
+
+USER_ACTION_BATCH_SIZE = int(os.getenv("USER_ACTION_BATCH_SIZE", "500"))
+USER_ACTION_FLUSH_MS = int(os.getenv("USER_ACTION_FLUSH_MS", "200"))
+USER_ACTION_QUEUE_SIZE = int(os.getenv("USER_ACTION_QUEUE_SIZE", "20000"))
+
+_STOP = object()
+
+
+class UserActionBuffer:
+    def __init__(self, batch_size: int, flush_ms: int, maxsize: int):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_ms / 1000
+        self.maxsize = maxsize
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._carry: List[dict] = []
+
+    def start(self) -> None:
+        # the queue belongs to the running loop, so it is created here and not at import;
+        # a new loop (TestClient runs one per request) takes over rows left in the old queue
+        loop = asyncio.get_running_loop()
+        if self._worker is not None and not self._worker.done() and self._loop is loop:
+            return
+        pending, self._carry = self._carry, []
+        while self._queue is not None and not self._queue.empty():
+            row = self._queue.get_nowait()
+            if row is not _STOP:
+                pending.append(row)
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=max(self.maxsize, len(pending)))
+        for row in pending:
+            self._queue.put_nowait(row)
+        self._worker = asyncio.create_task(self._run())
+
+    async def record(self, user_action: schemas.UserActionBase) -> None:
+        row = user_action.model_dump()
+        if row.get("responded_at") is None:
+            row["responded_at"] = datetime.datetime.now(tz=JST)
+        self.start()
+        await self._queue.put(row)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            row = await self._queue.get()
+            if row is _STOP:
+                return
+            batch = [row]
+            deadline = loop.time() + self.flush_seconds
+            stopping = False
+            try:
+                while len(batch) < self.batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        row = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    if row is _STOP:
+                        stopping = True
+                        break
+                    batch.append(row)
+            except asyncio.CancelledError:
+                # the loop is closing; leave the batch to the worker of the next loop
+                self._carry = batch
+                raise
+            await self._write(batch)
+            if stopping:
+                return
+
+    async def _write(self, rows: List[dict]) -> None:
+        try:
+            async with AsyncSessionLocal2() as adb:
+                await crud_async.create_user_actions(adb, rows)
+        except Exception as e:
+            logger.error(f"Dropped {len(rows)} user actions: {e}")
+
+    async def stop(self) -> None:
+        """Write everything queued so far; later `record` calls start a new worker."""
+        if self._worker is None or self._worker.done() or self._loop is not asyncio.get_running_loop():
+            return
+        await self._queue.put(_STOP)
+        await self._worker
+        self._worker = None
+
+
+user_actions = UserActionBuffer(
+    batch_size=USER_ACTION_BATCH_SIZE,
+    flush_ms=USER_ACTION_FLUSH_MS,
+    maxsize=USER_ACTION_QUEUE_SIZE,
+)
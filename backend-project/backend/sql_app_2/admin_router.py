@@ -2,12 +2,14 @@ import logging.config
 from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form, responses, Security, status, Request
 from sqlalchemy.orm import Session
 import pandas as pd
+import os
 import util
+import instrumentation
 
 from . import crud, schemas
 from .database import SessionLocal2, engine2
 
-from .dependencies import wordcloud, sentence, openai_chatbot
+from .dependencies import wordcloud, sentence, openai_chatbot, blob_store
 from .dependencies.gen_image import generate_interpretion
 from collections import Counter
 
@@ -43,7 +45,7 @@ async def test_frequency(
         raise HTTPException(status_code=400, detail="Text is required")
     
     # translate text if necessary
-    translated_text = wordcloud.translate_text(text, target_lang=lang)
+    translated_text = wordcloud.translate_text(text, target_lang=lang, db=db)
     
     # Calculate frequency
     frequency = wordcloud.cal_frequency(translated_text)
@@ -76,7 +78,7 @@ async def generate_descriptions(
     
     t = generateDescription2(
         leaderboard_id=leaderboard_id,
-        image=db_original_image.image,
+        image=blob_store.load_image_base64(db_original_image),
         story=story,
         model_name="gpt-4o-mini"
     )
@@ -122,10 +124,10 @@ async def test_generate_evaluation(
         raise HTTPException(status_code=404, detail="Leaderboard not found")
     db_original_image = crud.get_original_image(db, image_id=db_leaderboard.original_image_id)
 
-    evaluation = cb.get_short_result(
+    evaluation = await cb.aget_short_result(
         sentence=sentence,
         correct_sentence=sentence,
-        base64_image=db_original_image.image,
+        image=db_original_image,
         grammar_errors="",
         spelling_errors="",
         descriptions=[]
@@ -144,4 +146,24 @@ async def get_writing_traces(
     db: Session = Depends(get_db)
 ):
     traces = crud.get_writing_traces(db, generation_id=generation_id)
-    return traces
\ No newline at end of file
+    return traces
+
+@router.get("/memory_snapshot", tags=["Admin", "Profiling"])
+async def memory_snapshot(
+    seconds: float = 10,
+    top: int = 20,
+    frames: int = 1,
+):
+    """
+    Trace allocations of this worker for `seconds` and return the lines that grew the most.
+    """
+    try:
+        stats = await instrumentation.memory_snapshot(seconds=seconds, top=top, frames=frames)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {
+        "pid": os.getpid(),
+        "seconds": min(seconds, instrumentation.MEMORY_SNAPSHOT_MAX_SECONDS),
+        "stats": stats,
+    }
+
@@ -0,0 +1,233 @@
+"""Word cloud building shared by the analysis router and the Celery worker."""
+import datetime, os, zoneinfo
+from collections import Counter
+from typing import Callable, Literal, Optional
+
+from sqlalchemy.orm import Session
+
+from . import crud, schemas
+from .dependencies import wordcloud, sentence
+
+JST = zoneinfo.ZoneInfo("Asia/Tokyo")
+
+WORD_CLOUD_CHUNK_SIZE = int(os.getenv("WORD_CLOUD_CHUNK_SIZE", "200"))
+CLOUD_TYPES = ('mistake', 'writing', 'user_chat', 'assistant_chat')
+
+
+def get_frequency(
+        cloud_type: Literal['mistake', 'writing', 'user_chat', 'assistant_chat'],
+        sources,
+        lang: Literal['ja', 'en'] = 'en',
+        latest_generation_msg_id: int = 0,
+        db: Session = None
+):
+    """Word frequencies for (generation, round) pairs, or for messages when cloud_type is a chat cloud."""
+    max_message_id = 0
+    max_generation_id = 0
+    frequencies = []
+    generation_token = {}
+    if cloud_type == 'mistake':
+
+        # collect every text first so translations are looked up and requested in batches
+        error_texts = []
+        for db_generation, db_round in sources:
+
+            if db_generation.id <= latest_generation_msg_id:
+                continue
+            max_generation_id = max(max_generation_id, db_generation.id)
+            if db_generation.grammar_errors:
+                error_texts.append((
+                    db_generation.id,
+                    ' '.join([grammar_error.explanation for grammar_error in sentence.str_to_list(db_generation.grammar_errors)])
+                ))
+            if db_generation.spelling_errors:
+                error_texts.append((
+                    db_generation.id,
+                    ' '.join([spelling_error.correction for spelling_error in sentence.str_to_list(db_generation.spelling_errors)])
+                ))
+
+        translated_texts = wordcloud.translate_texts(
+            [text for _, text in error_texts],
+            target_lang=lang,
+            db=db,
+        )
+        text_frequencies = wordcloud.cal_frequencies(translated_texts, lang=lang)
+        for (generation_id, _), frequency in zip(error_texts, text_frequencies):
+            generation_token[generation_id] = {**generation_token.get(generation_id, {}), **frequency}
+            frequencies.append(frequency)
+
+    elif cloud_type == 'writing':
+
+        new_generations = [
+            db_generation for db_generation, db_round in sources
+            if db_generation.id > latest_generation_msg_id
+        ]
+        text_frequencies = wordcloud.cal_frequencies(
+            [db_generation.sentence for db_generation in new_generations],
+            lang=lang,
+        )
+        for db_generation, frequency in zip(new_generations, text_frequencies):
+            max_generation_id = max(max_generation_id, db_generation.id)
+            generation_token[db_generation.id] = frequency
+            frequencies.append(frequency)
+    elif cloud_type in ('user_chat', 'assistant_chat'):
+
+        db_messages = [msg for msg in sources if msg.id > latest_generation_msg_id]
+        max_message_id = max([msg.id for msg in db_messages], default=0)
+
+        translated_texts = wordcloud.translate_texts(
+            [msg.content.replace('\n', '') for msg in db_messages],
+            target_lang=lang,
+            db=db,
+        )
+        text_frequencies = wordcloud.cal_frequencies(translated_texts, lang=lang)
+        for msg, frequency in zip(db_messages, text_frequencies):
+            generation_token[msg.id] = frequency
+            frequencies.append(frequency)
+    sum_frequency = sum((Counter(freq) for freq in frequencies), Counter())
+
+    output = {
+        'frequency': sum_frequency,
+        'max_generation_id': max_generation_id if '_chat' not in cloud_type else None,
+        'max_message_id': max_message_id,
+        'generation_token': generation_token
+    }
+    return output
+
+def description_words(db: Session, leaderboard_id: int) -> set:
+    """Words of the leaderboard's model descriptions; they are greyed out in the clouds."""
+    descriptions = crud.get_description(db, leaderboard_id=leaderboard_id)
+    words = set()
+    for frequency in wordcloud.cal_frequencies([des.content for des in descriptions], lang='en'):
+        words.update(frequency)
+    return words
+
+def word_cloud_task_name(program_id: int, cloud_type: str, lang: str) -> str:
+    return f"word_cloud:{program_id}:{cloud_type}:{lang}"
+
+def get_or_create_word_cloud(
+        db: Session,
+        leaderboard_id: int,
+        program_id: int,
+        cloud_type: Literal['mistake', 'writing', 'user_chat', 'assistant_chat'],
+        lang: Literal['ja', 'en'] = 'en'
+):
+    db_leaderboard_analysis = crud.read_leaderboard_analysis(
+        db=db,
+        leaderboard_id=leaderboard_id,
+        program_id=program_id,
+    )
+    if not db_leaderboard_analysis:
+        db_leaderboard_analysis = crud.create_leaderboard_analysis(
+            db=db,
+            leaderboard_analysis=schemas.LeaderboardAnalysisCreate(
+                program_id=program_id,
+                leaderboard_id=leaderboard_id,
+            )
+        )
+    db_leaderboard_wordcloud = crud.read_leaderboard_analysis_word_cloud(
+        db=db,
+        leaderboard_analysis_id=db_leaderboard_analysis.id,
+        cloud_type=cloud_type,
+        lang=lang,
+        require_num=1
+    )
+    if db_leaderboard_wordcloud:
+        return crud.read_word_cloud(db=db, id=db_leaderboard_wordcloud.word_cloud_id)
+
+    db_word_cloud = crud.create_word_cloud(
+        db=db,
+        cloud_type=cloud_type,
+        word_cloud=schemas.WordCloudCreate(
+            last_updated=datetime.datetime.now(tz=JST),
+            latest_generation_id=0,
+            items=[],
+        )
+    )
+    crud.create_leaderboard_analysis_word_cloud(
+        db=db,
+        leaderboard_analysis_word_cloud=schemas.LeaderboardAnalysis_WordCloudCreate(
+            leaderboard_analysis_id=db_leaderboard_analysis.id,
+            word_cloud_id=db_word_cloud.id,
+            type=cloud_type,
+            lang=lang,
+        )
+    )
+    return db_word_cloud
+
+def refresh_word_cloud(
+        db: Session,
+        leaderboard_id: int,
+        program_id: int,
+        cloud_type: Literal['mistake', 'writing', 'user_chat', 'assistant_chat'],
+        lang: Literal['ja', 'en'] = 'en',
+        on_progress: Optional[Callable[[int, int], None]] = None
+):
+    """Add everything newer than the cloud's watermark, one chunk at a time.
+
+    Items, links and the watermark (latest_generation_id, and latest_completed_at for the
+    generation clouds) of a chunk are written in one transaction, so an interrupted build
+    resumes from its last chunk without double counting.
+    """
+    db_word_cloud = get_or_create_word_cloud(db, leaderboard_id, program_id, cloud_type, lang)
+    is_chat = '_chat' in cloud_type
+    latest_id = db_word_cloud.latest_generation_id or 0
+    latest_completed_at = None if is_chat else db_word_cloud.latest_completed_at
+    total = crud.count_word_cloud_sources(
+        db, cloud_type, leaderboard_id, program_id,
+        after_id=latest_id,
+        after_completed_at=latest_completed_at,
+    )
+    done = 0
+    if on_progress:
+        on_progress(done, total)
+    if total == 0:
+        return db_word_cloud
+
+    greyed_words = description_words(db, leaderboard_id)
+    while True:
+        sources = crud.get_word_cloud_sources(
+            db, cloud_type, leaderboard_id, program_id,
+            after_id=latest_id,
+            after_completed_at=latest_completed_at,
+            limit=WORD_CLOUD_CHUNK_SIZE,
+        )
+        if not sources:
+            break
+        # every source is past the watermark; a late completion may have a lower id than it
+        dict_frequency = get_frequency(
+            cloud_type=cloud_type,
+            sources=sources,
+            lang=lang,
+            db=db
+        )
+        if is_chat:
+            latest_id = sources[-1].id
+        else:
+            latest_id, latest_completed_at = sources[-1][0].id, sources[-1][0].completed_at
+
+        db_word_cloud = crud.update_word_cloud(
+            db=db,
+            cloud_type=cloud_type,
+            word_cloud=schemas.WordCloudUpdate(
+                id=db_word_cloud.id,
+                last_updated=datetime.datetime.now(tz=JST),
+                latest_generation_id=latest_id,
+                latest_completed_at=latest_completed_at,
+                items=[
+                    schemas.WordCloudItemCreate(
+                        word=word,
+                        frequency=count,
+                        color="959695" if word in greyed_words else "ffffff"
+                    ) for word, count in dict_frequency['frequency'].items()
+                ],
+            ),
+            generation_token=dict_frequency['generation_token'],
+        )
+
+        done += len(sources)
+        if on_progress:
+            on_progress(min(done, total), total)
+        if len(sources) < WORD_CLOUD_CHUNK_SIZE:
+            break
+    return db_word_cloud
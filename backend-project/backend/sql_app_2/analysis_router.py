@@ -1,17 +1,18 @@
 import logging.config
 from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form, responses, Security, status, Request
 from sqlalchemy.orm import Session
-import time, os, datetime, shutil, tempfile, zipfile, zoneinfo, asyncio, re
+import time, os, shutil, tempfile, zipfile, asyncio, re
 import pandas as pd
 
 from . import crud, schemas
 from .database import SessionLocal2, engine2
 
 from .dependencies import wordcloud, sentence
-from collections import Counter
+from .analysis import word_cloud_task_name
+from tasks import request_word_cloud_refresh
 
 from typing import Tuple, List, Annotated, Optional, Union, Literal
-from datetime import timezone, timedelta
+from datetime import timezone
 from contextlib import asynccontextmanager
 import logging
 
@@ -27,6 +28,8 @@ router = APIRouter(
     prefix="/analysis",
 )
 
+WORD_CLOUD_STREAM_PAGE = int(os.getenv("WORD_CLOUD_STREAM_PAGE", "100"))
+
 @router.post("/test_frequency", tags=["analysis"])
 async def test_frequency(
     text: str = Form(...),
@@ -40,7 +43,7 @@ async def test_frequency(
         raise HTTPException(status_code=400, detail="Text is required")
     
     # translate text if necessary
-    translated_text = wordcloud.translate_text(text, target_lang=lang)
+    translated_text = wordcloud.translate_text(text, target_lang=lang, db=db)
     
     # Calculate frequency
     frequency = wordcloud.cal_frequency(translated_text)
@@ -78,111 +81,6 @@ async def read_generations(
 
     return generations
 
-def get_frequency(
-        cloud_type: Literal['mistake', 'writing', 'user_chat', 'assistant_chat'],
-        db_generations_rounds,
-        lang: Literal['ja', 'en'] = 'en',
-        latest_generation_msg_id: int = 0,
-        request: Request = None
-):
-    if current_user := getattr(request.state, 'current_user', None):
-        if not current_user.is_admin:
-            raise HTTPException(status_code=403, detail="Not enough permissions")
-    max_message_id = 0
-    frequencies = []
-    generation_token = {}
-    if cloud_type == 'mistake':
-        
-        for db_generation, db_round in db_generations_rounds:
-            
-            if db_generation.id <= latest_generation_msg_id:
-                continue
-            if db_generation.grammar_errors:
-                grammar_errors = wordcloud.translate_text(
-                    text=' '.join([grammar_error.explanation for grammar_error in sentence.str_to_list(db_generation.grammar_errors)]),
-                    target_lang=lang,
-                )
-                
-                frequency = wordcloud.cal_frequency(
-                    text=grammar_errors,
-                    lang=lang,
-                )
-                generation_token[db_generation.id] = frequency
-                frequencies.append(frequency)
-            if db_generation.spelling_errors:
-                spelling_errors = wordcloud.translate_text(
-                    text=' '.join([spelling_error.correction for spelling_error in sentence.str_to_list(db_generation.spelling_errors)]),
-                    target_lang=lang,
-                )
-                
-                frequency = wordcloud.cal_frequency(
-                    text=spelling_errors,
-                    lang=lang,
-                )
-                generation_token[db_generation.id]={**generation_token[db_generation.id], **frequency}
-                frequencies.append(frequency)
-
-    elif cloud_type == 'writing':
-
-        for db_generation, db_round in db_generations_rounds:
-            if db_generation.id <= latest_generation_msg_id:
-                continue
-            frequency = wordcloud.cal_frequency(
-                text=db_generation.sentence,
-                lang=lang,
-            )
-            generation_token[db_generation.id] = frequency
-            frequencies.append(frequency)
-    elif cloud_type == 'user_chat':
-
-        for round in db_generations_rounds:
-            for msg in round.chat.messages:
-                if msg.id <= latest_generation_msg_id:
-                    continue
-                
-                if msg.sender == 'user':
-                    max_message_id = max([max_message_id, msg.id])
-                    msg_content = wordcloud.translate_text(
-                        text=msg.content.replace('\n', ''),
-                        target_lang=lang,
-                    )
-                    frequency = wordcloud.cal_frequency(
-                        text=msg_content,
-                        lang=lang,
-                    )
-                    generation_token[msg.id] = frequency
-                    frequencies.append(frequency)
-    elif cloud_type == 'assistant_chat':
-
-        for round in db_generations_rounds:
-            for msg in round.chat.messages:
-                if msg.id <= latest_generation_msg_id:
-                    continue
-                if not (msg.is_hint or msg.is_evaluation):
-                    continue
-                if msg.sender == 'assistant':
-                    max_message_id = max([max_message_id, msg.id])
-                    msg_content = wordcloud.translate_text(
-                        text=msg.content.replace('\n', ''),
-                        target_lang=lang,
-                    )
-                    frequency = wordcloud.cal_frequency(
-                        text=msg_content,
-                        lang=lang,
-                    )
-                    generation_token[msg.id] = frequency
-                    frequencies.append(frequency)
-    sum_frequency = sum((Counter(freq) for freq in frequencies), Counter())
-
-    max_generation_id = db_generations_rounds[0][0].id if '_chat' not in cloud_type else None
-    output = {
-        'frequency': sum_frequency,
-        'max_generation_id': max_generation_id,
-        'max_message_id': max_message_id,
-        'generation_token': generation_token
-    }
-    return output
-
 @router.get("/leaderboards/{leaderboard_id}/{program_name}", tags=["analysis"])
 async def read_word_cloud(
     leaderboard_id: int,
@@ -223,7 +121,7 @@ async def read_word_cloud(
         db=db,
         program_id=db_program.id,
         leaderboard_id=leaderboard_id,
-        limit=10000,
+        limit=1,
     )
 
     if not db_generations and '_chat' not in cloud_type:
@@ -235,7 +133,7 @@ async def read_word_cloud(
         db=db,
         leaderboard_id=leaderboard_id,
         program_id=db_program.id,
-        limit=10000,
+        limit=1,
     )
     if not db_rounds:
         raise HTTPException(status_code=404, detail="No rounds found for the leaderboard and program")
@@ -248,225 +146,20 @@ async def read_word_cloud(
         require_num=1
     )
 
-    descriptions = crud.get_description(db, leaderboard_id=leaderboard_id)
-    description_frequency = wordcloud.cal_frequency(
-        text=' '.join([des.content for des in descriptions]),
-        lang='en'
-    )
-
-    if db_leaderboard_wordcloud:
-        # Calculate frequency of each word
-        db_word_cloud = crud.read_word_cloud(
-            db=db,
-            id=db_leaderboard_wordcloud.word_cloud_id,
-        )
-
-        # Check if new generation before updating word cloud
-        if cloud_type in ['writing', 'mistake'] and db_word_cloud.latest_generation_id < db_generations[0][0].id:
-            generations_frequency = crud.get_generations(db=db, program_id=db_program.id, leaderboard_id=leaderboard_id, skip=db_word_cloud.latest_generation_id)
-            dict_frequency = get_frequency(
-                cloud_type=cloud_type,
-                generations=generations_frequency,
-                lang=lang,
-                latest_generation_msg_id=db_word_cloud.latest_generation_id
-            )
-
-            items = [schemas.WordCloudItemCreate(
-                word=word,
-                frequency=count,
-                color="959695" if word in description_frequency else "ffffff"
-            ) for word, count in dict_frequency['frequency'].items()]
-
-            # Update the word cloud with new items
-            word_cloud_update = schemas.WordCloudUpdate(
-                id=db_word_cloud.id,
-                last_updated=datetime.datetime.now(tz=zoneinfo.ZoneInfo("Asia/Tokyo")),
-                latest_generation_id=dict_frequency['max_message_id'] if '_chat' in cloud_type else dict_frequency['max_generation_id'],
-                items=items,
-            )
-
-            db_word_cloud = crud.update_word_cloud(
-                db=db,
-                cloud_type=cloud_type,
-                word_cloud=word_cloud_update,
-            )
-
-            for gen in dict_frequency['generation_token']:
-                for dict_word, count in dict_frequency['generation_token'][gen].items():
-                    word_cloud_item = crud.get_word_cloud_item_by_word(
-                        db=db,
-                        word=dict_word,
-                        word_cloud_id=db_word_cloud.id,
-                        cloud_type=cloud_type
-                    )
-                    crud.create_word_cloud_item_generation(
-                    db=db,
-                    cloud_type=cloud_type,
-                    word_cloud_item_id=word_cloud_item.id,
-                    generation_or_message_id=gen
-                    )
-        elif cloud_type in ['user_chat', 'assistant_chat']:
-            tokyo_tz = zoneinfo.ZoneInfo("Asia/Tokyo")
-            current_time = datetime.datetime.now(tz=tokyo_tz)
-            if db_word_cloud.last_updated.tzinfo is None:
-                db_word_cloud.last_updated = db_word_cloud.last_updated.replace(tzinfo=tokyo_tz)
-            
-            # Only update if the last updated time is more than 1 minute ago
-            if db_word_cloud.last_updated < current_time - timedelta(minutes=1):
-                dict_frequency = get_frequency(
-                    cloud_type=cloud_type,
-                    db_generations_rounds=db_rounds,
-                    lang=lang,
-                    latest_generation_msg_id=db_word_cloud.latest_generation_id
-                )
-
-                items = [
-                    schemas.WordCloudItemCreate(
-                        word=word,
-                        frequency=count,
-                        color="959695" if word in description_frequency else "ffffff"
-                    ) for word, count in dict_frequency['frequency'].items()
-                ]
-
-                # Update the word cloud with new items
-                word_cloud_update = schemas.WordCloudUpdate(
-                    id=db_word_cloud.id,
-                    last_updated=datetime.datetime.now(tz=zoneinfo.ZoneInfo("Asia/Tokyo")),
-                    latest_generation_id=dict_frequency['max_message_id'] if '_chat' in cloud_type else dict_frequency['max_generation_id'],
-                    items=items,
-                )
-
-                db_word_cloud = crud.update_word_cloud(
-                    db=db,
-                    cloud_type=cloud_type,
-                    word_cloud=word_cloud_update,
-                )
-
-                for msg in dict_frequency['generation_token']:
-                    for dict_word, count in dict_frequency['generation_token'][msg].items():
-                        word_cloud_item = crud.get_word_cloud_item_by_word(
-                            db=db,
-                            word=dict_word,
-                            word_cloud_id=db_word_cloud.id,
-                            cloud_type=cloud_type
-                        )
-                        crud.create_word_cloud_item_generation(
-                            db=db,
-                            cloud_type=cloud_type,
-                            word_cloud_item_id=word_cloud_item.id,
-                            generation_or_message_id=msg
-                        )
-            
-        db_leaderboard_analysis = crud.read_leaderboard_analysis(
-            db=db,
+    # Clouds are built by tasks.build_word_cloud and kept up to date by submissions,
+    # so reads only start the first build and otherwise return the last finished cloud
+    if not db_leaderboard_wordcloud:
+        await asyncio.to_thread(
+            request_word_cloud_refresh,
             leaderboard_id=leaderboard_id,
             program_id=db_program.id,
-        )
-    elif cloud_type in ['writing', 'mistake']:
-        dict_frequency = get_frequency(
             cloud_type=cloud_type,
-            db_generations_rounds=db_generations,
             lang=lang,
-            latest_generation_msg_id=0
-        )
-        items = [
-            schemas.WordCloudItemCreate(
-                word=word,
-                frequency=count,
-                color="959695" if word in description_frequency else "ffffff"
-            ) for word, count in dict_frequency['frequency'].items()
-        ]
-
-        # Create the word cloud
-        db_word_cloud = crud.create_word_cloud(
-            db=db,
-            cloud_type=cloud_type,
-            word_cloud=schemas.WordCloudCreate(
-                last_updated=datetime.datetime.now(
-                    tz=zoneinfo.ZoneInfo("Asia/Tokyo")
-                ),
-                latest_generation_id=dict_frequency['max_generation_id'],
-                items=items,
-            )
+            countdown=0,
         )
 
-        for gen in dict_frequency['generation_token']:
-            for dict_word, count in dict_frequency['generation_token'][gen].items():
-                word_cloud_item = crud.get_word_cloud_item_by_word(
-                    db=db,
-                    word=dict_word,
-                    word_cloud_id=db_word_cloud.id,
-                    cloud_type=cloud_type
-                )
-                crud.create_word_cloud_item_generation(
-                    db=db,
-                    cloud_type=cloud_type,
-                    word_cloud_item_id=word_cloud_item.id,
-                    generation_or_message_id=gen
-                )
-
-        db_leaderboard_wordcloud = crud.create_leaderboard_analysis_word_cloud(
-            db=db,
-            leaderboard_analysis_word_cloud=schemas.LeaderboardAnalysis_WordCloudCreate(
-                leaderboard_analysis_id=db_leaderboard_analysis.id,
-                word_cloud_id=db_word_cloud.id,
-                type=cloud_type,
-                lang=lang,
-            )
-        )
-    elif cloud_type in ['user_chat', 'assistant_chat']:
-        dict_frequency = get_frequency(
-            cloud_type=cloud_type,
-            db_generations_rounds=db_rounds,
-            lang=lang,
-            latest_generation_msg_id=0
-        )
-        items = [
-            schemas.WordCloudItemCreate(
-                word=word,
-                frequency=count,
-                color="959695" if word in description_frequency else "ffffff"
-            ) for word, count in dict_frequency['frequency'].items()
-        ]
-
-        # Create the word cloud
-        db_word_cloud = crud.create_word_cloud(
-            db=db,
-            cloud_type=cloud_type,
-            word_cloud=schemas.WordCloudCreate(
-                last_updated=datetime.datetime.now(
-                    tz=zoneinfo.ZoneInfo("Asia/Tokyo")
-                ),
-                latest_generation_id=dict_frequency['max_message_id'],
-                items=items,
-            )
-        )
+    descriptions = crud.get_description(db, leaderboard_id=leaderboard_id)
 
-        for msg in dict_frequency['generation_token']:
-            for dict_word, count in dict_frequency['generation_token'][msg].items():
-                word_cloud_item = crud.get_word_cloud_item_by_word(
-                    db=db,
-                    word=dict_word,
-                    word_cloud_id=db_word_cloud.id,
-                    cloud_type=cloud_type
-                )
-                crud.create_word_cloud_item_generation(
-                    db=db,
-                    cloud_type=cloud_type,
-                    word_cloud_item_id=word_cloud_item.id,
-                    generation_or_message_id=msg
-                )
-
-        db_leaderboard_wordcloud = crud.create_leaderboard_analysis_word_cloud(
-            db=db,
-            leaderboard_analysis_word_cloud=schemas.LeaderboardAnalysis_WordCloudCreate(
-                leaderboard_analysis_id=db_leaderboard_analysis.id,
-                word_cloud_id=db_word_cloud.id,
-                type=cloud_type,
-                lang=lang,
-            )
-        )
-    
     db_leaderboard = crud.get_leaderboard(
         db=db,
         leaderboard_id=leaderboard_id
@@ -534,8 +227,30 @@ async def read_word_cloud(
         writing_word_cloud_id=writing_word_cloud_id,
         user_chat_word_cloud_id=user_chat_word_cloud_id,
         assistant_chat_word_cloud_id=assistant_chat_word_cloud_id,
+        word_cloud_tasks=[
+            schemas.TaskProgress.model_validate(db_task, from_attributes=True)
+            for db_task in crud.get_active_tasks(
+                db,
+                leaderboard_id=leaderboard_id,
+                name_prefix=word_cloud_task_name(db_program.id, cloud_type, lang)
+            )
+        ],
     )
 
+@router.get("/tasks/{task_id}", tags=["analysis"], response_model=schemas.TaskProgress)
+async def read_task_progress(
+    task_id: str,
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    if current_user := getattr(request.state, 'current_user', None):
+        if not current_user.is_admin:
+            raise HTTPException(status_code=403, detail="Not enough permissions")
+    db_task = crud.get_task(db, task_id=task_id)
+    if db_task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return db_task
+
 @router.delete("/word_cloud/{word_cloud_id}", tags=["analysis"])
 async def delete_word_cloud(
     word_cloud_id: int,
@@ -558,142 +273,44 @@ async def delete_word_cloud(
         content={"message": "Word cloud deleted successfully"}
     )
 
-@router.post("/get_word_cloud_items", tags=["analysis"], response_model=list[Union[schemas.WordCloudItemAnalysis, schemas.ChatWordCloudAnalysis]])
-async def get_word_cloud_items(
-    word_cloud_id: int,
-    cloud_type: Literal['mistake', 'writing', 'user_chat', 'assistant_chat'],
-    db: Session = Depends(get_db),
-    request: Request = None
-):
-    if current_user := getattr(request.state, 'current_user', None):
-        if not current_user.is_admin:
-            raise HTTPException(status_code=403, detail="Not enough permissions")
-    if cloud_type == 'mistake':
-        mistake_word_cloud_items = [
-            schemas.WordCloudItemAnalysis(
-                id=item.id,
-                word=item.word,
-                frequency=item.frequency,
-                color=item.color,
-                generations=[
-                    schemas.GenerationItemAnalysis(
-                        id=gen.id,
-                        user=schemas.UserAnalysis(
-                            id=gen.round.player.id,
-                            profiles=schemas.UserProfileOut(
-                                display_name=gen.round.player.display_name,
-                            )
-                        ),
-                        round_id=gen.round_id,
-                        sentence=gen.sentence,
-                        correct_sentence=gen.correct_sentence,
-                        mistakes=[
-                            schemas.MistakeItemAnalysis(
-                                **vars(mistake)
-                            ) for mistake in sentence.str_to_list(gen.grammar_errors)
-                        ]+
-                        [
-                            schemas.MistakeItemAnalysis(
-                                extracted_text=mistake.word,
-                                correction=mistake.correction,
-                                explanation=''
-                            ) for mistake in sentence.str_to_list(gen.spelling_errors)
-                        ]
-                    ) 
-                    for gen in crud.get_generations_by_ids(
-                        db=db,
-                        generation_ids=[
-                            k.generation_id
-                            for k in
-                            crud.get_word_cloud_item_generation(
-                            db=db,
-                            cloud_type='mistake',
-                            word_cloud_item_id=item.id)
-                        ]
-                    )
-                ]
-            )
-            for item in crud.read_word_cloud(
-                    db=db,
-                    id=word_cloud_id
-                ).mistake_word_cloud_items
+def _generation_item_analysis(gen, with_mistakes: bool) -> schemas.GenerationItemAnalysis:
+    mistakes = []
+    if with_mistakes:
+        mistakes = [
+            schemas.MistakeItemAnalysis(
+                **mistake.model_dump()
+            ) for mistake in sentence.str_to_list(gen.grammar_errors)
+        ]+[
+            schemas.MistakeItemAnalysis(
+                extracted_text=mistake.word,
+                correction=mistake.correction,
+                explanation=''
+            ) for mistake in sentence.str_to_list(gen.spelling_errors)
         ]
-        return mistake_word_cloud_items
-    elif cloud_type == 'writing':
-        writing_word_cloud_items = [
-            schemas.WordCloudItemAnalysis(
-                id=item.id,
-                word=item.word,
-                frequency=item.frequency,
-                color=item.color,
-                generations=[
-                    schemas.GenerationItemAnalysis(
-                        id=gen.id,
-                        user=schemas.UserAnalysis(
-                            id=gen.round.player.id,
-                            profiles=schemas.UserProfileOut(
-                                display_name=gen.round.player.display_name,
-                            )
-                        ),
-                        round_id=gen.round_id,
-                        sentence=gen.sentence,
-                        correct_sentence=gen.correct_sentence,
-                        mistakes=[]
-                    ) for gen in crud.get_generations_by_ids(
-                        db=db,
-                        generation_ids=[
-                            k.generation_id
-                            for k in
-                            crud.get_word_cloud_item_generation(
-                                db=db,
-                                cloud_type='writing',
-                                word_cloud_item_id=item.id)]
-                        )
-                ]
-            )
-            for item in crud.read_word_cloud(
-                    db=db,
-                    id=word_cloud_id
-                ).writing_word_cloud_items
-        ]
-        return writing_word_cloud_items
-    elif cloud_type == 'user_chat':
-        user_chat_word_cloud_items = [
-            schemas.ChatWordCloudAnalysis(
-                id=item.id,
-                word=item.word,
-                frequency=item.frequency,
-                color=item.color,
-                chat_messages=[
-                    schemas.ChatMessageAnalysis(
-                        id=msg.id,
-                        chat_id=msg.chat_id,
-                        sender=msg.sender,
-                        content=msg.content,
-                        created_at=msg.created_at,
-                    )
-                    for msg in crud.get_chat_messages_by_ids(
-                        db=db,
-                        message_ids=[
-                            k.message_id
-                            for k in
-                            crud.get_word_cloud_item_generation(
-                                db=db,
-                                cloud_type='user_chat',
-                                word_cloud_item_id=item.id
-                            )
-                        ]
-                    )
-                ]
+    player = gen.round.player
+    return schemas.GenerationItemAnalysis(
+        id=gen.id,
+        user=schemas.UserAnalysis(
+            id=player.id,
+            profiles=schemas.UserProfileOut(
+                display_name=player.display_name,
             )
-            for item in crud.read_word_cloud(
-                    db=db,
-                    id=word_cloud_id
-                ).user_chat_word_cloud_items
-        ]
-        return user_chat_word_cloud_items
-    elif cloud_type == 'assistant_chat':
-        assistant_chat_word_cloud_items = [
+        ) if player else None,
+        round_id=gen.round_id,
+        sentence=gen.sentence,
+        correct_sentence=gen.correct_sentence,
+        mistakes=mistakes
+    )
+
+def _word_cloud_items_analysis(db: Session, cloud_type: str, items: list) -> list:
+    """Attach generations or messages to a page of items with a single query."""
+    sources = crud.get_word_cloud_item_sources(
+        db=db,
+        cloud_type=cloud_type,
+        word_cloud_item_ids=[item.id for item in items]
+    )
+    if cloud_type in ('user_chat', 'assistant_chat'):
+        return [
             schemas.ChatWordCloudAnalysis(
                 id=item.id,
                 word=item.word,
@@ -707,31 +324,80 @@ async def get_word_cloud_items(
                         content=msg.content,
                         created_at=msg.created_at,
                     )
-                    for msg in crud.get_chat_messages_by_ids(
-                        db=db,
-                        message_ids=[
-                            k.message_id
-                            for k in
-                            crud.get_word_cloud_item_generation(
-                                db=db,
-                                cloud_type='assistant_chat',
-                                word_cloud_item_id=item.id
-                            )
-                        ]
-                    )
+                    for msg in sources[item.id]
                 ]
             )
-            for item in crud.read_word_cloud(
-                    db=db,
-                    id=word_cloud_id
-                ).assistant_chat_word_cloud_items
+            for item in items
         ]
-        return assistant_chat_word_cloud_items
-    else:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid cloud type"
+
+    # a generation usually appears under many words; convert (and parse its mistakes) once
+    generations = {}
+    for item in items:
+        for gen in sources[item.id]:
+            if gen.id not in generations:
+                generations[gen.id] = _generation_item_analysis(gen, with_mistakes=cloud_type == 'mistake')
+    return [
+        schemas.WordCloudItemAnalysis(
+            id=item.id,
+            word=item.word,
+            frequency=item.frequency,
+            color=item.color,
+            generations=[generations[gen.id] for gen in sources[item.id]]
         )
+        for item in items
+    ]
+
+def _stream_word_cloud_items(cloud_type: str, word_cloud_id: int, skip: int, limit: Optional[int]):
+    # own session: the request's session is closed once the endpoint returns
+    db = SessionLocal2()
+    try:
+        sent = 0
+        while limit is None or sent < limit:
+            page_size = WORD_CLOUD_STREAM_PAGE if limit is None else min(WORD_CLOUD_STREAM_PAGE, limit - sent)
+            items = crud.get_word_cloud_items(db, cloud_type, word_cloud_id, skip=skip + sent, limit=page_size)
+            for item in _word_cloud_items_analysis(db, cloud_type, items):
+                yield item.model_dump_json() + "\n"
+            sent += len(items)
+            if len(items) < page_size:
+                break
+    finally:
+        db.close()
+
+@router.post("/get_word_cloud_items", tags=["analysis"], response_model=list[Union[schemas.WordCloudItemAnalysis, schemas.ChatWordCloudAnalysis]])
+async def get_word_cloud_items(
+    word_cloud_id: int,
+    cloud_type: Literal['mistake', 'writing', 'user_chat', 'assistant_chat'],
+    skip: int = 0,
+    limit: Optional[int] = None,
+    stream: bool = False,
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    """
+    Items of a word cloud, most frequent first, with the generations or messages they came from.
+
+    Use skip/limit to page through large clouds, or stream=true to receive NDJSON (one item per line).
+    """
+    if current_user := getattr(request.state, 'current_user', None):
+        if not current_user.is_admin:
+            raise HTTPException(status_code=403, detail="Not enough permissions")
+    if crud.read_word_cloud(db=db, id=word_cloud_id) is None:
+        raise HTTPException(status_code=404, detail="Word cloud not found")
+
+    if stream:
+        return responses.StreamingResponse(
+            _stream_word_cloud_items(cloud_type, word_cloud_id, skip, limit),
+            media_type="application/x-ndjson"
+        )
+
+    items = crud.get_word_cloud_items(
+        db=db,
+        cloud_type=cloud_type,
+        word_cloud_id=word_cloud_id,
+        skip=skip,
+        limit=limit
+    )
+    return _word_cloud_items_analysis(db, cloud_type, items)
 
 @router.post("/word_cloud/{word_cloud_item_id}/color")
 async def update_word_cloud_item_color(
@@ -0,0 +1,74 @@
+"""Caches shared by the REST routes, the round socket and crud (see dependencies/shared_cache).
+
+Leaderboard lists and stats are tagged with the school and course they were filtered by.
+A change to a leaderboard only drops the entries its School_Leaderboard links can appear in.
+Images are cached per process by main; `invalidate_images` reaches every API worker, also
+when the change comes from the Celery worker.
+"""
+import os
+from typing import Iterable, List, Optional, Tuple
+
+from . import schemas
+from .dependencies import shared_cache
+from .dependencies.shared_cache import SharedCache
+
+LEADERBOARD_CACHE_TTL = int(os.getenv("LEADERBOARD_CACHE_TTL", "15"))
+LEADERBOARD_CACHE_MAXSIZE = int(os.getenv("LEADERBOARD_CACHE_MAXSIZE", "128"))
+LEADERBOARD_STATS_CACHE_TTL = int(os.getenv("LEADERBOARD_STATS_CACHE_TTL", str(LEADERBOARD_CACHE_TTL)))
+LEADERBOARD_STATS_CACHE_MAXSIZE = int(os.getenv("LEADERBOARD_STATS_CACHE_MAXSIZE", "128"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "10"))
+USER_CACHE_MAXSIZE = int(os.getenv("USER_CACHE_MAXSIZE", "2048"))
+
+ALL = "__all__"
+IMAGES = "images"
+
+leaderboard_cache = SharedCache(
+    "leaderboards",
+    List[Tuple[schemas.LeaderboardOut, schemas.SchoolOut]],
+    ttl=LEADERBOARD_CACHE_TTL,
+    maxsize=LEADERBOARD_CACHE_MAXSIZE,
+)
+leaderboard_stats_cache = SharedCache(
+    "leaderboard_stats",
+    schemas.LeaderboardsStats,
+    ttl=LEADERBOARD_STATS_CACHE_TTL,
+    maxsize=LEADERBOARD_STATS_CACHE_MAXSIZE,
+)
+user_cache = SharedCache(
+    "users",
+    schemas.User,
+    ttl=USER_CACHE_TTL,
+    maxsize=USER_CACHE_MAXSIZE,
+)
+
+
+def scope(school_name: Optional[str], course_id: Optional[int]) -> str:
+    """Tag of a leaderboard query; crud treats an empty school or course as no filter."""
+    return f"{school_name or ALL}|{course_id or ALL}"
+
+
+def link_scopes(school: str, course_id: Optional[int]) -> List[str]:
+    """Tags of every query a School_Leaderboard(school, course_id) row can show up in."""
+    scopes = [scope(school, None), scope(None, None)]
+    if course_id:
+        scopes += [scope(school, course_id), scope(None, course_id)]
+    return scopes
+
+
+def invalidate_leaderboards(links: Iterable) -> None:
+    """`links` are School_Leaderboard rows or (school, course_id) pairs."""
+    tags = set()
+    for link in links:
+        school, course_id = link if isinstance(link, tuple) else (link.school, link.course_id)
+        tags.update(link_scopes(school, course_id))
+    leaderboard_cache.invalidate(tags=tags)
+    leaderboard_stats_cache.invalidate(tags=tags)
+
+
+def invalidate_user(username: str) -> None:
+    user_cache.invalidate(keys=[username])
+
+
+def invalidate_images(kind: str, owner_ids: Iterable[int]) -> None:
+    """`kind` is "original" (owners are leaderboard ids) or "interpreted" (generation ids)."""
+    shared_cache.invalidate(IMAGES, keys=[(kind, owner_id) for owner_id in owner_ids])
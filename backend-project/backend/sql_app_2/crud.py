@@ -1,7 +1,9 @@
-from sqlalchemy.orm import Session, selectinload
-from sqlalchemy import or_, and_
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import or_, and_, func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 
-from . import models, schemas
+from . import caches, models, queries, schemas, stats
+from .dependencies import blob_store, openai_chatbot
 
 from typing import List, Optional, Literal, Union
 import datetime
@@ -22,22 +24,27 @@ def get_user_by_lti(db: Session, lti_user_id: str, school: str):
     return db.query(models.User).filter(models.User.lti_user_id == lti_user_id).filter(models.User.school == school).first()
 
 def get_users_stats(db: Session):
-    n_users = db.query(models.User).count()
-    n_active_users = db.query(models.User).filter(models.User.is_active == True).count()
+    n_users, n_active_users = db.query(
+        func.coalesce(func.sum(models.SchoolUserStats.n_users), 0),
+        func.coalesce(func.sum(models.SchoolUserStats.n_active_users), 0),
+    ).filter(models.SchoolUserStats.course_id == 0).one()
     return {
-        "n_users": n_users,
-        "n_active_users": n_active_users
+        "n_users": int(n_users),
+        "n_active_users": int(n_active_users)
     }
 
 def get_users_stats_by_school(db: Session, school: str, course_id: int = None):
-    n_users = db.query(models.User).filter(models.User.school == school).count()
-    n_active_users = db.query(models.User).filter(models.User.school == school).filter(models.User.is_active == True).count()
-    n_course_users = db.query(models.User).\
-        join(models.CourseUser, models.User.id == models.CourseUser.user_id).\
-            filter(models.User.school == school).\
-                filter(models.CourseUser.course_id == course_id)\
-                    .count() if course_id else n_users
-    
+    rows = {
+        row.course_id: row for row in db.query(models.SchoolUserStats).
+        filter(models.SchoolUserStats.school == school).
+        filter(models.SchoolUserStats.course_id.in_([0, course_id or 0]))
+    }
+    school_row = rows.get(0)
+    n_users = school_row.n_users if school_row else 0
+    n_active_users = school_row.n_active_users if school_row else 0
+    course_row = rows.get(course_id)
+    n_course_users = (course_row.n_users if course_row else 0) if course_id else n_users
+
     return {
         "n_users": n_users,
         "n_active_users": n_active_users,
@@ -81,6 +88,8 @@ def create_random_user(db: Session, user: schemas.UserCreate):
     )
 
     db.add(db_user)
+    db.flush()
+    stats.execute(db, stats.school_users(db_user.school))
     db.commit()
     db.refresh(db_user)
 
@@ -113,6 +122,8 @@ def create_public_user(db: Session, user: schemas.UserCreate):
     )
 
     db.add(db_user)
+    db.flush()
+    stats.execute(db, stats.school_users(db_user.school))
     db.commit()
     db.refresh(db_user)
 
@@ -150,16 +161,31 @@ def create_user_lti(db: Session, user: schemas.UserLti):
     )
 
     db.add(db_user)
+    db.flush()
+    stats.execute(db, stats.school_users(db_user.school))
     db.commit()
     db.refresh(db_user)
 
     return db_user
 
+def _refresh_user_stats(db: Session, school: Optional[str], course_ids: List[int]):
+    stats.execute(db, stats.school_users(school))
+    for course_id in course_ids:
+        stats.execute(db, stats.school_users(school, course_id))
+
 def update_user(db: Session, user: schemas.UserUpdate):
+    # columns rather than the User row, which bulk_update_mappings leaves stale in the session
+    school_of = db.query(models.User.school).filter(models.User.id == user.id)
+    old_school = school_of.scalar()
     db.bulk_update_mappings(models.User, [user.model_dump()])
+    db.flush()
+    new_school = school_of.scalar()
+    course_ids = stats.user_courses(db, user.id)
+    # a user moved between schools leaves the old school's counts behind
+    for school in {old_school, new_school}:
+        _refresh_user_stats(db, school, course_ids)
     db.commit()
-    db_user = db.query(models.User).filter(models.User.id == user.id).first()
-    return db_user
+    return db.query(models.User).filter(models.User.id == user.id).first()
 
 def update_user_password(db: Session, user_id: int, new_password: str):
     db_user = db.query(models.User).filter(models.User.id == user_id).first()
@@ -175,7 +201,10 @@ def delete_user(db: Session, user_id: int):
         db.delete(db_user_profile)
         db.commit()
     if db_user:
+        course_ids = stats.user_courses(db, db_user.id)
         db.delete(db_user)
+        db.flush()
+        _refresh_user_stats(db, db_user.school, course_ids)
         db.commit()
     return db_user
 
@@ -189,44 +218,24 @@ def get_leaderboards(
         published_at_end: datetime.datetime = None,
         is_public: bool = True,
         created_by_id: Optional[int] = None,
+        before: Optional[list] = None,
+        after: Optional[list] = None,
 ):
-    query = db.query(
-        models.Leaderboard,
-        models.School_Leaderboard
-    ).join(
-        models.Leaderboard,
-        models.Leaderboard.id == models.School_Leaderboard.leaderboard_id
-    ).options(
-        selectinload(models.Leaderboard.scene),
-        selectinload(models.Leaderboard.story),
-        selectinload(models.Leaderboard.created_by),
-        selectinload(models.Leaderboard.vocabularies),
-        selectinload(models.Leaderboard.original_image),
-    )
-
-    if school_name:
-        query = query.filter(models.School_Leaderboard.school == school_name)
-    if course_id:
-        query = query.filter(models.School_Leaderboard.course_id == course_id)
-    if is_public is not None:
-        query = query.filter(models.Leaderboard.is_public == is_public)
-    if created_by_id is not None:
-        query = query.filter(models.Leaderboard.created_by_id == created_by_id)
-    if published_at_start is not None:
-        query = query.filter(models.Leaderboard.published_at >= published_at_start)
     if published_at_end is None:
         if published_at_start and published_at_start.tzinfo:
             published_at_end = datetime.datetime.now(tz=published_at_start.tzinfo)
         else:
             published_at_end = datetime.datetime.now()
 
-    query = query.filter(models.Leaderboard.published_at <= published_at_end)
-
-    return query.\
-        order_by(models.Leaderboard.published_at.desc()).\
-        offset(skip).\
-        limit(limit).\
-        all()
+    stmt = queries.leaderboards(
+        school_name=school_name,
+        course_id=course_id,
+        published_at_start=published_at_start,
+        published_at_end=published_at_end,
+        is_public=is_public,
+        created_by_id=created_by_id,
+    )
+    return queries.page(db, stmt, queries.LEADERBOARD_ORDER, limit, skip, before, after)
 
 
 def get_leaderboards_stats(
@@ -403,6 +412,7 @@ def add_leaderboard_school(
         )
         db.add(db_school)
         db.commit()
+        caches.invalidate_leaderboards([(leaderboard.school, leaderboard.course_id)])
 
     return db_school
 
@@ -426,8 +436,10 @@ def remove_leaderboard_school(
 
     db_school = db_school.first()
     if db_school is not None:
+        link = (db_school.school, db_school.course_id)
         db.delete(db_school)
         db.commit()
+        caches.invalidate_leaderboards([link])
 
     return db_school
 
@@ -472,6 +484,7 @@ def add_leaderboard_vocab(
         )
         db.add(db_vocab)
         db.commit()
+        openai_chatbot.invalidate_hint_prompt(db_leaderboard.id)
 
     return db_leaderboard
 
@@ -505,6 +518,7 @@ def remove_leaderboard_vocab(
 
     db.delete(db_vocab)
     db.commit()
+    openai_chatbot.invalidate_hint_prompt(db_leaderboard.id)
 
     return db_leaderboard
 
@@ -525,6 +539,9 @@ def delete_leaderboard(db: Session, leaderboard_id: int):
     db_original_images = db.query(models.OriginalImage).filter(models.OriginalImage.id == db_leaderboard.original_image_id).all()
 
     db_rounds = db.query(models.Round).filter(models.Round.leaderboard_id == leaderboard_id).all()
+    generation_ids = [generation_id for (generation_id,) in db.query(models.Generation.id).
+                      join(models.Round, models.Generation.round_id == models.Round.id).
+                      filter(models.Round.leaderboard_id == leaderboard_id)]
 
     db_leaderboard_vocab = db.query(
         models.LeaderboardVocabulary
@@ -559,33 +576,63 @@ def delete_leaderboard(db: Session, leaderboard_id: int):
     if db_leaderboard:
         db.delete(db_leaderboard)
         db.commit()
+    caches.invalidate_leaderboards([(school.school, school.course_id) for school in db_school])
+    caches.invalidate_images("original", [leaderboard_id])
+    caches.invalidate_images("interpreted", generation_ids)
     return db_leaderboard
 
 def get_original_image(db: Session, image_id: int):
     return db.query(models.OriginalImage).filter(models.OriginalImage.id == image_id).first()
 
 def create_original_image(db: Session, image: schemas.ImageBase):
-    db_image = models.OriginalImage(**image.model_dump())
+    blob = blob_store.put_image_base64(image.image)
+    db_image = models.OriginalImage(
+        storage_key=blob.key,
+        mime_type=blob.mime_type,
+        width=blob.width,
+        height=blob.height,
+        byte_size=blob.byte_size,
+    )
     db.add(db_image)
     db.commit()
     db.refresh(db_image)
     return db_image
 
+def get_leaderboard_original_image(db: Session, leaderboard_id: int):
+    return db.query(models.OriginalImage).\
+        join(models.Leaderboard, models.Leaderboard.original_image_id == models.OriginalImage.id).\
+            filter(models.Leaderboard.id == leaderboard_id).first()
+
 def get_interpreted_image(db: Session, image_id: int):
     return db.query(models.InterpretedImage).filter(models.InterpretedImage.id == image_id).first()
 
 def create_interpreted_image(db: Session, image: schemas.ImageBase):
-    db_image = models.InterpretedImage(**image.model_dump())
+    blob = blob_store.put_image_base64(image.image)
+    db_image = models.InterpretedImage(
+        storage_key=blob.key,
+        mime_type=blob.mime_type,
+        width=blob.width,
+        height=blob.height,
+        byte_size=blob.byte_size,
+    )
     db.add(db_image)
     db.commit()
     db.refresh(db_image)
     return db_image
 
+def get_generation_interpreted_image(db: Session, generation_id: int):
+    return db.query(models.InterpretedImage).\
+        join(models.Generation, models.Generation.interpreted_image_id == models.InterpretedImage.id).\
+            filter(models.Generation.id == generation_id).first()
+
 def delete_interpreted_image(db: Session, image_id: int):
     db_image = db.query(models.InterpretedImage).filter(models.InterpretedImage.id == image_id).first()
     if db_image:
+        generation_ids = [generation_id for (generation_id,) in db.query(models.Generation.id).
+                          filter(models.Generation.interpreted_image_id == image_id)]
         db.delete(db_image)
         db.commit()
+        caches.invalidate_images("interpreted", generation_ids)
     return db_image
 
 def get_story(db: Session, story_id: int):
@@ -764,6 +811,10 @@ def create_course(db: Session, course: schemas.CourseBase):
 def get_courses_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 50):
     return db.query(models.CourseUser).filter(models.CourseUser.user_id == user_id).offset(skip).limit(limit).all()
 
+def _refresh_course_stats(db: Session, course_user: schemas.CourseUserBase):
+    school = db.query(models.User.school).filter(models.User.id == course_user.user_id).scalar()
+    stats.execute(db, stats.school_users(school, course_user.course_id))
+
 def add_course_user(db: Session, course_user: schemas.CourseUserBase):
     db_course_user = db.query(models.CourseUser).\
         filter(models.CourseUser.course_id == course_user.course_id).\
@@ -772,6 +823,8 @@ def add_course_user(db: Session, course_user: schemas.CourseUserBase):
     if db_course_user is None:
         db_course_user = models.CourseUser(**course_user.model_dump())
         db.add(db_course_user)
+        db.flush()
+        _refresh_course_stats(db, course_user)
         db.commit()
         db.refresh(db_course_user)
     return db_course_user
@@ -782,8 +835,9 @@ def delete_course_user(db: Session, course_user: schemas.CourseUserBase):
             filter(models.CourseUser.user_id == course_user.user_id).first()
     
     if db_course_user is not None:
-        db_course_user = models.CourseUser(**course_user.model_dump())
         db.delete(db_course_user)
+        db.flush()
+        _refresh_course_stats(db, course_user)
         db.commit()
     return db_course_user
 
@@ -798,25 +852,14 @@ def update_round_display_name(db: Session, round_update: schemas.RoundUpdateName
     db.refresh(db_round)
     return db_round
 
-def get_rounds(db: Session, skip: int = 0, limit: int = 100, player_id: int = None,is_completed: bool = True, leaderboard_id: int = None, program_id: int = None):
-    if program_id:
-        rounds = db.query(
-            models.Round,
-        ).\
-        filter(models.Round.program_id == program_id)
-    else:
-        rounds = db.query(
-            models.Round,
-        )
-
-    if leaderboard_id and player_id:
-        return rounds.filter(models.Round.is_completed == is_completed).filter(models.Round.leaderboard_id == leaderboard_id).filter(models.Round.player_id==player_id).order_by(models.Round.id.desc()).offset(skip).limit(limit).all()
-    elif leaderboard_id:
-        return rounds.filter(models.Round.is_completed == is_completed).filter(models.Round.leaderboard_id == leaderboard_id).order_by(models.Round.id.desc()).offset(skip).limit(limit).all()
-    elif player_id:
-        return rounds.filter(models.Round.is_completed == is_completed).filter(models.Round.player_id==player_id).order_by(models.Round.id.desc()).offset(skip).limit(limit).all()
-    else:
-        return rounds.filter(models.Round.is_completed == is_completed).order_by(models.Round.id.desc()).offset(skip).limit(limit).all()
+def get_rounds(db: Session, skip: int = 0, limit: int = 100, player_id: int = None,is_completed: bool = True, leaderboard_id: int = None, program_id: int = None, before: Optional[list] = None, after: Optional[list] = None):
+    stmt = queries.rounds(
+        player_id=player_id,
+        leaderboard_id=leaderboard_id,
+        program_id=program_id,
+        is_completed=is_completed,
+    )
+    return queries.page(db, stmt, queries.ROUND_ORDER, limit, skip, before, after, scalars=True)
 
 
 def get_rounds_full(
@@ -827,45 +870,18 @@ def get_rounds_full(
         leaderboard_id: int = None,
         program_id: int = None,
         school_name: str = None,
-        user_type: str = "student"
+        user_type: str = "student",
+        before: Optional[list] = None,
+        after: Optional[list] = None,
 ):
-
-    if school_name:
-        school_rounds = db.query(
-            models.Round,
-            models.User
-        ).\
-        filter(models.User.school == school_name).\
-        join(
-            models.Round,
-            models.Round.player_id == models.User.id
-        )
-    else:
-        school_rounds = db.query(
-            models.Round,
-            models.User
-        ).join(
-            models.Round,
-            models.Round.player_id == models.User.id
-        )
-
-    if program_id:
-        rounds = school_rounds.\
-        filter(models.Round.program_id == program_id)
-    else:
-        rounds = school_rounds
-
-    if user_type == "student":
-        rounds = rounds.filter(models.User.user_type == "student")
-
-    if leaderboard_id and player_id:
-        return rounds.filter(models.Round.leaderboard_id == leaderboard_id).filter(models.Round.player_id==player_id).order_by(models.Round.id.desc()).offset(skip).limit(limit).all()
-    elif leaderboard_id:
-        return rounds.filter(models.Round.leaderboard_id == leaderboard_id).order_by(models.Round.id.desc()).offset(skip).limit(limit).all()
-    elif player_id:
-        return rounds.filter(models.Round.player_id==player_id).order_by(models.Round.id.desc()).offset(skip).limit(limit).all()
-    else:
-        return rounds.order_by(models.Round.id.desc()).offset(skip).limit(limit).all()
+    stmt = queries.rounds_with_players(
+        player_id=player_id,
+        leaderboard_id=leaderboard_id,
+        program_id=program_id,
+        school_name=school_name,
+        students_only=user_type == "student",
+    )
+    return queries.page(db, stmt, queries.ROUND_ORDER, limit, skip, before, after)
 
 def get_rounds_full_count(
         db: Session,
@@ -875,49 +891,58 @@ def get_rounds_full_count(
         school_name: str = None,
         user_type: str = "student"
 ):
+    stmt = queries.count_rounds_with_players(
+        player_id=player_id,
+        leaderboard_id=leaderboard_id,
+        program_id=program_id,
+        school_name=school_name,
+        students_only=user_type == "student",
+    )
+    return db.execute(stmt).scalar_one()
 
-    if school_name:
-        school_rounds = db.query(
-            models.Round,
-            models.User
-        ).\
-        filter(models.User.school == school_name).\
-        join(
-            models.Round,
-            models.Round.player_id == models.User.id
-        )
-    else:
-        school_rounds = db.query(
-            models.Round,
-            models.User
-        ).join(
-            models.Round,
-            models.Round.player_id == models.User.id
-        )
-
-    if program_id:
-        rounds = school_rounds.\
-        filter(models.Round.program_id == program_id)
-    else:
-        rounds = school_rounds
-
-    if user_type == "student":
-        rounds = rounds.filter(models.User.user_type == "student")
+def _leaderboard_stats(n_rounds, n_generations, score_sum, max_score, ranks) -> dict:
+    return {
+        "n_rounds": int(n_rounds or 0),
+        "n_generations": int(n_generations or 0),
+        "average_score": int(score_sum) / int(n_generations) if n_generations else None,
+        "max_score": int(max_score or 0),
+        "rank_distribution": None if ranks is None else {rank: int(count or 0) for rank, count in zip(stats.RANKS, ranks)},
+    }
 
-    if leaderboard_id and player_id:
-        return rounds.filter(models.Round.leaderboard_id == leaderboard_id).filter(models.Round.player_id==player_id).count()
-    elif leaderboard_id:
-        return rounds.filter(models.Round.leaderboard_id == leaderboard_id).count()
-    elif player_id:
-        return rounds.filter(models.Round.player_id==player_id).count()
-    else:
-        return rounds.count()
+def get_leaderboard_round_stats(db: Session, leaderboard_id: int, school_name: str = None, user_type: str = None):
+    """Rounds and completed generations of a leaderboard, by players of `school_name` and `user_type` when given."""
+    table = models.LeaderboardRoundStats
+    ranks = [getattr(table, f"rank_{rank.lower()}") for rank in stats.RANKS]
+    query = db.query(
+        func.sum(table.n_rounds),
+        func.sum(table.n_generations),
+        func.sum(table.score_sum),
+        func.max(table.max_score),
+        *[func.sum(column) for column in ranks],
+    ).filter(table.leaderboard_id == leaderboard_id)
+    if school_name:
+        query = query.filter(table.school == school_name)
+    if user_type:
+        query = query.filter(table.user_type == user_type)
+    n_rounds, n_generations, score_sum, max_score, *rank_counts = query.one()
+    return _leaderboard_stats(n_rounds, n_generations, score_sum, max_score, rank_counts)
+
+def get_player_stats(db: Session, player_id: int, leaderboard_id: int):
+    db_player_stats = db.get(models.PlayerStats, (player_id, leaderboard_id))
+    if db_player_stats is None:
+        return _leaderboard_stats(0, 0, 0, 0, None)
+    return _leaderboard_stats(
+        db_player_stats.n_rounds,
+        db_player_stats.n_generations,
+        db_player_stats.score_sum,
+        db_player_stats.max_score,
+        None,
+    )
 
 def create_round(db: Session, leaderboard_id:int, user_id: int, created_at: datetime.datetime, model_name: str="gpt-4o-mini", program_id: Optional[int]=None):
     db_chat=models.Chat()
     db.add(db_chat)
-    db.commit()
-    db.refresh(db_chat)
+    db.flush()
     if program_id:
         db_round = models.Round(
             player_id=user_id,
@@ -937,175 +962,18 @@ def create_round(db: Session, leaderboard_id:int, user_id: int, created_at: date
         )
 
     db.add(db_round)
+    stats.execute(db, stats.round_started(user_id, leaderboard_id, program_id))
     db.commit()
-    db.refresh(db_round)
     return db_round
 
 def get_generation(db: Session, generation_id: int):
     return db.query(models.Generation).filter(models.Generation.id == generation_id).first()
 
-def get_generations(db: Session, program_id: int=None, skip: int = 0, limit: int = 100, player_id: int = None, leaderboard_id: int = None, order_by: str = "id"):
-    if program_id is not None:
-        if order_by == "id":
-            if leaderboard_id and player_id:
-                generations = db.query(
-                    models.Generation,
-                    models.Round
-                ).\
-                join(models.Round, models.Generation.round_id == models.Round.id).\
-                filter(models.Round.leaderboard_id == leaderboard_id).\
-                filter(models.Round.player_id == player_id).\
-                filter(models.Generation.is_completed == True).\
-                order_by(models.Generation.id.desc()).offset(skip).limit(limit).all()
-            elif leaderboard_id:
-                generations = db.query(
-                    models.Generation,
-                    models.Round
-                ).\
-                join(models.Round, models.Generation.round_id == models.Round.id).\
-                filter(models.Round.leaderboard_id == leaderboard_id).\
-                filter(models.Round.program_id == program_id).\
-                filter(models.Generation.is_completed == True).\
-                order_by(models.Generation.id.desc()).offset(skip).limit(limit).all()
-            elif player_id:
-                generations = db.query(
-                    models.Generation,
-                    models.Round
-                ).\
-                join(models.Round, models.Generation.round_id == models.Round.id).\
-                filter(models.Round.player_id == player_id).\
-                filter(models.Generation.is_completed == True).\
-                order_by(models.Generation.id.desc()).offset(skip).limit(limit).all()
-            else:
-                generations = db.query(
-                    models.Generation,
-                    models.Round
-                ).\
-                join(models.Round, models.Generation.round_id == models.Round.id).\
-                filter(models.Round.program_id == program_id).\
-                filter(models.Generation.is_completed == True).\
-                order_by(models.Generation.id.desc()).offset(skip).limit(limit).all()
-
-        elif order_by == "total_score":
-            if leaderboard_id and player_id:
-                generations = db.query(
-                    models.Generation,
-                    models.Round
-                ).\
-                join(models.Round, models.Generation.round_id == models.Round.id).\
-                filter(models.Round.leaderboard_id == leaderboard_id).\
-                filter(models.Round.player_id == player_id).\
-                filter(models.Generation.is_completed == True).\
-                order_by(models.Generation.total_score.desc()).offset(skip).limit(limit).all()
-            elif leaderboard_id:
-                generations = db.query(
-                    models.Generation,
-                    models.Round
-                ).\
-                join(models.Round, models.Generation.round_id == models.Round.id).\
-                filter(models.Round.leaderboard_id == leaderboard_id).\
-                filter(models.Round.program_id == program_id).\
-                filter(models.Generation.is_completed == True).\
-                order_by(models.Generation.total_score.desc()).offset(skip).limit(limit).all()
-            elif player_id:
-                generations = db.query(
-                    models.Generation,
-                    models.Round
-                ).\
-                join(models.Round, models.Generation.round_id == models.Round.id).\
-                filter(models.Round.player_id == player_id).\
-                filter(models.Generation.is_completed == True).\
-                order_by(models.Generation.total_score.desc()).offset(skip).limit(limit).all()
-            else:
-                generations = db.query(
-                    models.Generation,
-                    models.Round
-                ).\
-                join(models.Round, models.Generation.round_id == models.Round.id).\
-                filter(models.Round.program_id == program_id).\
-                filter(models.Generation.is_completed == True).\
-                order_by(models.Generation.total_score.desc()).offset(skip).limit(limit).all()
-        else:
-            raise ValueError("Invalid order_by value")
-        return generations
-    if order_by == "id":
-        if leaderboard_id and player_id:
-            generations = db.query(
-                models.Generation,
-                models.Round
-            ).\
-            join(models.Round, models.Generation.round_id == models.Round.id).\
-            filter(models.Round.leaderboard_id == leaderboard_id).\
-            filter(models.Round.player_id == player_id).\
-            filter(models.Generation.is_completed == True).\
-            order_by(models.Generation.id.desc()).offset(skip).limit(limit).all()
-        elif leaderboard_id:
-            generations = db.query(
-                models.Generation,
-                models.Round
-            ).\
-            join(models.Round, models.Generation.round_id == models.Round.id).\
-            filter(models.Round.leaderboard_id == leaderboard_id).\
-            filter(models.Generation.is_completed == True).\
-            order_by(models.Generation.id.desc()).offset(skip).limit(limit).all()
-        elif player_id:
-            generations = db.query(
-                models.Generation,
-                models.Round
-            ).\
-            join(models.Round, models.Generation.round_id == models.Round.id).\
-            filter(models.Round.player_id == player_id).\
-            filter(models.Generation.is_completed == True).\
-            order_by(models.Generation.id.desc()).offset(skip).limit(limit).all()
-        else:
-            generations = db.query(
-                models.Generation,
-                models.Round
-            ).\
-            join(models.Round, models.Generation.round_id == models.Round.id).\
-            filter(models.Generation.is_completed == True).\
-            order_by(models.Generation.id.desc()).offset(skip).limit(limit).all()
-
-    elif order_by == "total_score":
-        if leaderboard_id and player_id:
-            generations = db.query(
-                models.Generation,
-                models.Round
-            ).\
-            join(models.Round, models.Generation.round_id == models.Round.id).\
-            filter(models.Round.leaderboard_id == leaderboard_id).\
-            filter(models.Round.player_id == player_id).\
-            filter(models.Generation.is_completed == True).\
-            order_by(models.Generation.total_score.desc()).offset(skip).limit(limit).all()
-        elif leaderboard_id:
-            generations = db.query(
-                models.Generation,
-                models.Round
-            ).\
-            join(models.Round, models.Generation.round_id == models.Round.id).\
-            filter(models.Round.leaderboard_id == leaderboard_id).\
-            filter(models.Generation.is_completed == True).\
-            order_by(models.Generation.total_score.desc()).offset(skip).limit(limit).all()
-        elif player_id:
-            generations = db.query(
-                models.Generation,
-                models.Round
-            ).\
-            join(models.Round, models.Generation.round_id == models.Round.id).\
-            filter(models.Round.player_id == player_id).\
-            filter(models.Generation.is_completed == True).\
-            order_by(models.Generation.total_score.desc()).offset(skip).limit(limit).all()
-        else:
-            generations = db.query(
-                models.Generation,
-                models.Round
-            ).\
-            join(models.Round, models.Generation.round_id == models.Round.id).\
-            filter(models.Generation.is_completed == True).\
-            order_by(models.Generation.total_score.desc()).offset(skip).limit(limit).all()
-    else:
+def get_generations(db: Session, program_id: int=None, skip: int = 0, limit: int = 100, player_id: int = None, leaderboard_id: int = None, order_by: str = "id", before: Optional[list] = None, after: Optional[list] = None):
+    if order_by not in queries.GENERATION_ORDERS:
         raise ValueError("Invalid order_by value")
-    return generations
+    stmt = queries.generations(player_id=player_id, leaderboard_id=leaderboard_id, program_id=program_id)
+    return queries.page(db, stmt, queries.GENERATION_ORDERS[order_by], limit, skip, before, after)
 
 def get_generations_by_ids(db: Session, generation_ids: List[int]):
     if not generation_ids:
@@ -1113,19 +981,17 @@ def get_generations_by_ids(db: Session, generation_ids: List[int]):
     return db.query(models.Generation).filter(models.Generation.id.in_(generation_ids)).all()
 
 def create_generation(db: Session, round_id: int, generation: schemas.GenerationCreate):
-    db_round = db.query(models.Round).filter(models.Round.id == round_id).first()
+    db_round = db.get(models.Round, round_id)
 
     db_generation = models.Generation(
         **generation.model_dump()
     )
     db.add(db_generation)
-    db.commit()
-    db.refresh(db_generation)
+    db.flush()
 
     db_round.last_generation_id = db_generation.id
 
     db.commit()
-    db.refresh(db_round)
     return db_generation
 
 def update_generation0(db: Session, generation: schemas.GenerationCreate, generation_id: int):
@@ -1149,14 +1015,22 @@ def update_generation2(db: Session, generation: schemas.GenerationInterpretation
         raise ValueError("Generation not found")
     db_generation.interpreted_image_id = generation.interpreted_image_id
     db.commit()
+    caches.invalidate_images("interpreted", [generation.id])
     db.refresh(db_generation)
     return db_generation
 
 def update_generation3(db: Session, generation: schemas.GenerationComplete):
-
-    db.bulk_update_mappings(models.Generation, [generation.model_dump(exclude_none=True)])
+    values = generation.model_dump(exclude_none=True)
+    db_generation = db.get(models.Generation, values.pop("id"))
+    if values.get("is_completed") and db_generation.completed_at is None:
+        values["completed_at"] = datetime.datetime.now()
+    before, after = stats.generation_updated(db_generation, values)
+    stats.execute(db, before)
+    for key, value in values.items():
+        setattr(db_generation, key, value)
+    db.flush()
+    stats.execute(db, after)
     db.commit()
-    db_generation = db.query(models.Generation).filter(models.Generation.id == generation.id).first()
     return db_generation
 
 def update_generation_duration(db: Session, generation_id: int, duration: int):
@@ -1218,27 +1092,21 @@ def create_message(db: Session, message: schemas.MessageBase, chat_id: int):
     )
     db_message.chat_id = chat_id
     db.add(db_message)
+    stats.execute(db, stats.messages_added(chat_id, [db_message]))
     db.commit()
-    db.refresh(db_message)
 
-    db_chat = db.query(models.Chat).filter(models.Chat.id == chat_id).first()
-    db_chat.messages.append(db_message)
-    db.commit()
-    db.refresh(db_chat)
+    db_chat = db.get(models.Chat, chat_id)
     return {"message": db_message, "chat": db_chat}
 
 def get_chat_messages_by_ids(db: Session, message_ids: List[int]):
     return db.query(models.Message).filter(models.Message.id.in_(message_ids)).all()
 
 def get_chat_stats(db: Session, chat_id: int):
-    n_messages = db.query(models.Message).filter(models.Message.chat_id == chat_id).count()
-    n_user_messages = db.query(models.Message).filter(models.Message.chat_id == chat_id).filter(models.Message.sender == "user").count()
-    n_assistant_messages = db.query(models.Message).filter(models.Message.chat_id == chat_id).filter(models.Message.sender == "assistant").count()
-    return {
-        "n_messages": n_messages,
-        "n_user_messages": n_user_messages,
-        "n_assistant_messages": n_assistant_messages
-    }
+    db_chat_stats = db.get(models.ChatStats, chat_id)
+    if db_chat_stats is None:
+        # a chat without messages has no row yet
+        return schemas.ChatStats()
+    return schemas.ChatStats.model_validate(db_chat_stats, from_attributes=True)
 
 def get_vocabulary(db: Session, vocabulary: str, part_of_speech: str=None):
     if part_of_speech is None:
@@ -1329,6 +1197,7 @@ def create_leaderboard_vocabulary(
     db.add(db_leaderboard_vocabulary)
     db.commit()
     db.refresh(db_leaderboard_vocabulary)
+    openai_chatbot.invalidate_hint_prompt(leaderboard_id)
     return db_leaderboard_vocabulary
 
 def get_goodoriginal(db: Session, player_id: int, original_id: int):
@@ -1374,6 +1243,12 @@ def create_task(db: Session, task: schemas.Task):
     db_task = models.Task(
         id = task.id,
         generation_id = task.generation_id,
+        leaderboard_id = task.leaderboard_id,
+        name = task.name,
+        status = task.status,
+        progress = task.progress,
+        total = task.total,
+        updated_at = datetime.datetime.now(),
     )
     db.add(db_task)
     db.commit()
@@ -1391,6 +1266,24 @@ def get_tasks(db: Session, generation_id: Optional[int] = None, leaderboard_id:
     else:
         return db.query(models.Task).all()
 
+def update_task(db: Session, task: schemas.TaskUpdate):
+    db_task = db.query(models.Task).filter(models.Task.id == task.id).first()
+    if db_task is None:
+        return None
+    for key, value in task.model_dump(exclude_none=True).items():
+        setattr(db_task, key, value)
+    db_task.updated_at = datetime.datetime.now()
+    db.commit()
+    return db_task
+
+def get_active_tasks(db: Session, leaderboard_id: int, name_prefix: Optional[str] = None):
+    query = db.query(models.Task).\
+        filter(models.Task.leaderboard_id == leaderboard_id).\
+        filter(models.Task.status.in_(['pending', 'started']))
+    if name_prefix:
+        query = query.filter(models.Task.name.like(f"{name_prefix}%"))
+    return query.all()
+
 def delete_task(db: Session, task_id: int):
     db_task = db.query(models.Task).filter(models.Task.id == task_id).first()
     if db_task:
@@ -1423,7 +1316,8 @@ def get_error_task(db: Session, group_type: str):
 
     if group_type == 'no_interpretation':
         image_group = db.query(models.InterpretedImage).\
-            filter(or_(models.InterpretedImage.image == None,
+            filter(or_(and_(models.InterpretedImage.image == None,
+                            models.InterpretedImage.storage_key == None),
                        models.InterpretedImage.generation == None)).\
                 all()
         return image_group
@@ -1522,11 +1416,11 @@ def read_user_action(
         limit: int = 100
 ):
     if user_id and action_type:
-        return db.query(models.User_Action).filter(models.User_Action.user_id == user_id).filter(models.User_Action.action_type == action_type).offset(skip).limit(limit).all()
+        return db.query(models.User_Action).filter(models.User_Action.user_id == user_id).filter(models.User_Action.action == action_type).offset(skip).limit(limit).all()
     elif user_id:
         return db.query(models.User_Action).filter(models.User_Action.user_id == user_id).offset(skip).limit(limit).all()
     elif action_type:
-        return db.query(models.User_Action).filter(models.User_Action.action_type == action_type).offset(skip).limit(limit).all()
+        return db.query(models.User_Action).filter(models.User_Action.action == action_type).offset(skip).limit(limit).all()
     else:
         return db.query(models.User_Action).offset(skip).limit(limit).all()
 
@@ -1544,6 +1438,80 @@ def get_writing_traces(db: Session, generation_id: int):
     return db.query(models.WritingTrace).filter(models.WritingTrace.generation_id == generation_id).all()
 
 # CRUD operations for analytics
+
+# cloud type -> (item model, item-generation/message link model, link column)
+WORD_CLOUD_TABLES = {
+    'mistake': (models.MistakeWordCloudItem, models.MistakeWordCloudItemGeneration, 'generation_id'),
+    'writing': (models.WritingWordCloudItem, models.WritingWordCloudItemGeneration, 'generation_id'),
+    'user_chat': (models.UserChatWordCloudItem, models.UserChatWordCloudItemChat, 'message_id'),
+    'assistant_chat': (models.AssistantChatWordCloudItem, models.AssistantChatWordCloudItemChat, 'message_id'),
+}
+WORD_CLOUD_UPSERT_CHUNK = 500
+
+def _chunked(rows: list, size: int = WORD_CLOUD_UPSERT_CHUNK):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+def upsert_word_cloud_items(
+        db: Session,
+        cloud_type: Literal['mistake', 'writing', 'user_chat', 'assistant_chat'],
+        word_cloud_id: int,
+        items: List[schemas.WordCloudItemCreate],
+):
+    """Add frequencies with one INSERT ... ON DUPLICATE KEY UPDATE per chunk; does not commit.
+
+    New words get their color, existing words keep theirs (teachers may have recolored them).
+    """
+    item_model = WORD_CLOUD_TABLES[cloud_type][0]
+    rows = [
+        dict(word=item.word, frequency=item.frequency, color=item.color, word_cloud_id=word_cloud_id)
+        for item in items
+    ]
+    for chunk in _chunked(rows):
+        stmt = mysql_insert(item_model).values(chunk)
+        stmt = stmt.on_duplicate_key_update(frequency=item_model.frequency + stmt.inserted.frequency)
+        db.execute(stmt)
+
+def get_word_cloud_item_ids(
+        db: Session,
+        cloud_type: Literal['mistake', 'writing', 'user_chat', 'assistant_chat'],
+        word_cloud_id: int,
+        words: List[str],
+):
+    """Map words to item ids in one query per chunk, matching the column's case-insensitive collation."""
+    item_model = WORD_CLOUD_TABLES[cloud_type][0]
+    ids = {}
+    for chunk in _chunked(list(set(words))):
+        rows = db.query(item_model.id, item_model.word).\
+            filter(item_model.word_cloud_id == word_cloud_id).\
+            filter(item_model.word.in_(chunk)).all()
+        for item_id, word in rows:
+            ids[word.casefold()] = item_id
+    return {word: ids[word.casefold()] for word in words if word.casefold() in ids}
+
+def create_word_cloud_item_links(
+        db: Session,
+        cloud_type: Literal['mistake', 'writing', 'user_chat', 'assistant_chat'],
+        word_cloud_id: int,
+        generation_token: dict,
+):
+    """Bulk INSERT IGNORE the item-generation (or item-message) links; does not commit.
+
+    `generation_token` maps a generation or message id to the words found in it.
+    """
+    _, link_model, link_column = WORD_CLOUD_TABLES[cloud_type]
+    words = [word for tokens in generation_token.values() for word in tokens]
+    word_ids = get_word_cloud_item_ids(db, cloud_type, word_cloud_id, words)
+    rows = [
+        {link_column: source_id, "word_cloud_item_id": word_ids[word]}
+        for source_id, tokens in generation_token.items()
+        for word in tokens
+        if word in word_ids
+    ]
+    for chunk in _chunked(rows):
+        db.execute(mysql_insert(link_model).prefix_with("IGNORE"), chunk)
+    return len(rows)
+
 def create_word_cloud(
         db: Session,
         cloud_type: Literal['mistake', 'writing', 'user_chat', 'assistant_chat'],
@@ -1554,49 +1522,10 @@ def create_word_cloud(
         last_updated=word_cloud.last_updated,
     )
     db.add(db_word_cloud)
+    db.flush()
+    upsert_word_cloud_items(db, cloud_type, db_word_cloud.id, word_cloud.items)
     db.commit()
     db.refresh(db_word_cloud)
-    if cloud_type == 'mistake':
-        for item in word_cloud.items:
-            db_word_cloud_item = models.MistakeWordCloudItem(
-                word=item.word,
-                frequency=item.frequency,
-                color=item.color,
-                word_cloud_id=db_word_cloud.id,
-            )
-            db.add(db_word_cloud_item)
-            db.commit()
-    elif cloud_type == 'writing':
-        for item in word_cloud.items:
-            db_word_cloud_item = models.WritingWordCloudItem(
-                word=item.word,
-                frequency=item.frequency,
-                color=item.color,
-                word_cloud_id=db_word_cloud.id,
-            )
-            db.add(db_word_cloud_item)
-            db.commit()
-    elif cloud_type == 'user_chat':
-        for item in word_cloud.items:
-            db_word_cloud_item = models.UserChatWordCloudItem(
-                word=item.word,
-                frequency=item.frequency,
-                color=item.color,
-                word_cloud_id=db_word_cloud.id,
-            )
-            db.add(db_word_cloud_item)
-            db.commit()
-    elif cloud_type == 'assistant_chat':
-        for item in word_cloud.items:
-            db_word_cloud_item = models.AssistantChatWordCloudItem(
-                word=item.word,
-                frequency=item.frequency,
-                color=item.color,
-                word_cloud_id=db_word_cloud.id,
-            )
-            db.add(db_word_cloud_item)
-            db.commit()
-    db.refresh(db_word_cloud)
     return db_word_cloud
 
 def create_word_cloud_item_generation(
@@ -1688,6 +1617,51 @@ def get_word_cloud_item_by_word(
         return db.query(models.AssistantChatWordCloudItem).filter(models.AssistantChatWordCloudItem.word == word, models.AssistantChatWordCloudItem.word_cloud_id == word_cloud_id).first()
     return None
 
+def get_word_cloud_items(
+        db: Session,
+        cloud_type: Literal['mistake', 'writing', 'user_chat', 'assistant_chat'],
+        word_cloud_id: int,
+        skip: int = 0,
+        limit: Optional[int] = None
+):
+    """Items of one cloud, most frequent first."""
+    item_model = WORD_CLOUD_TABLES[cloud_type][0]
+    query = db.query(item_model).\
+        filter(item_model.word_cloud_id == word_cloud_id).\
+        order_by(item_model.frequency.desc(), item_model.id).\
+        offset(skip)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+def get_word_cloud_item_sources(
+        db: Session,
+        cloud_type: Literal['mistake', 'writing', 'user_chat', 'assistant_chat'],
+        word_cloud_item_ids: List[int]
+):
+    """Generations (with round and player) or messages of many items in one query.
+
+    Returns {item id: [generation or message, ...]}.
+    """
+    _, link_model, link_column = WORD_CLOUD_TABLES[cloud_type]
+    sources = {item_id: [] for item_id in word_cloud_item_ids}
+    if not word_cloud_item_ids:
+        return sources
+    if link_column == 'generation_id':
+        rows = db.query(link_model.word_cloud_item_id, models.Generation).\
+            join(models.Generation, models.Generation.id == link_model.generation_id).\
+            options(joinedload(models.Generation.round).joinedload(models.Round.player)).\
+            filter(link_model.word_cloud_item_id.in_(word_cloud_item_ids)).\
+            order_by(models.Generation.id).all()
+    else:
+        rows = db.query(link_model.word_cloud_item_id, models.Message).\
+            join(models.Message, models.Message.id == link_model.message_id).\
+            filter(link_model.word_cloud_item_id.in_(word_cloud_item_ids)).\
+            order_by(models.Message.id).all()
+    for item_id, source in rows:
+        sources[item_id].append(source)
+    return sources
+
 def get_word_cloud_item_generation(
         db: Session,
         cloud_type: Literal['mistake', 'writing', 'user_chat', 'assistant_chat'],
@@ -1706,78 +1680,20 @@ def get_word_cloud_item_generation(
 def update_word_cloud(
         db: Session,
         cloud_type: Literal['mistake', 'writing', 'user_chat', 'assistant_chat'],
-        word_cloud: schemas.WordCloudUpdate
+        word_cloud: schemas.WordCloudUpdate,
+        generation_token: Optional[dict] = None
 ):
-    db.bulk_update_mappings(models.WordCloud, [word_cloud.model_dump(exclude_none=True)])
+    """Apply one refresh in a single transaction: watermark, item frequencies and links."""
+    values = word_cloud.model_dump(exclude_none=True, exclude={"id", "items"})
+    if values:
+        db.query(models.WordCloud).\
+            filter(models.WordCloud.id == word_cloud.id).\
+            update(values, synchronize_session=False)
+    upsert_word_cloud_items(db, cloud_type, word_cloud.id, word_cloud.items)
+    if generation_token:
+        create_word_cloud_item_links(db, cloud_type, word_cloud.id, generation_token)
     db.commit()
-    db_word_cloud = db.query(models.WordCloud).filter(models.WordCloud.id == word_cloud.id).first()
-
-    if cloud_type == 'mistake':
-        for item in word_cloud.items:
-            db_word_cloud_item = db.query(models.MistakeWordCloudItem).filter(models.MistakeWordCloudItem.word_cloud_id == word_cloud.id).\
-            filter(models.MistakeWordCloudItem.word == item.word).first()
-            if db_word_cloud_item is None:
-                db_word_cloud_item = models.MistakeWordCloudItem(
-                    word=item.word,
-                    frequency=item.frequency,
-                    color=item.color,
-                    word_cloud_id=db_word_cloud.id,
-                )
-                db.add(db_word_cloud_item)
-                db.commit()
-            else:
-                db_word_cloud_item.frequency += item.frequency
-                db.commit()
-    elif cloud_type == 'writing':
-        for item in word_cloud.items:
-            db_word_cloud_item = db.query(models.WritingWordCloudItem).filter(models.WritingWordCloudItem.word_cloud_id == word_cloud.id).\
-            filter(models.WritingWordCloudItem.word == item.word).first()
-            if db_word_cloud_item is None:
-                db_word_cloud_item = models.WritingWordCloudItem(
-                    word=item.word,
-                    frequency=item.frequency,
-                    color=item.color,
-                    word_cloud_id=db_word_cloud.id,
-                )
-                db.add(db_word_cloud_item)
-                db.commit()
-            else:
-                db_word_cloud_item.frequency += item.frequency
-                db.commit()
-    elif cloud_type == 'user_chat':
-        for item in word_cloud.items:
-            db_word_cloud_item = db.query(models.UserChatWordCloudItem).filter(models.UserChatWordCloudItem.word_cloud_id == word_cloud.id).\
-            filter(models.UserChatWordCloudItem.word == item.word).first()
-            if db_word_cloud_item is None:
-                db_word_cloud_item = models.UserChatWordCloudItem(
-                    word=item.word,
-                    frequency=item.frequency,
-                    color=item.color,
-                    word_cloud_id=db_word_cloud.id,
-                )
-                db.add(db_word_cloud_item)
-                db.commit()
-            else:
-                db_word_cloud_item.frequency += item.frequency
-                db.commit()
-    elif cloud_type == 'assistant_chat':
-        for item in word_cloud.items:
-            db_word_cloud_item = db.query(models.AssistantChatWordCloudItem).filter(models.AssistantChatWordCloudItem.word_cloud_id == word_cloud.id).\
-            filter(models.AssistantChatWordCloudItem.word == item.word).first()
-            if db_word_cloud_item is None:
-                db_word_cloud_item = models.AssistantChatWordCloudItem(
-                    word=item.word,
-                    frequency=item.frequency,
-                    color=item.color,
-                    word_cloud_id=db_word_cloud.id,
-                )
-                db.add(db_word_cloud_item)
-                db.commit()
-            else:
-                db_word_cloud_item.frequency += item.frequency
-                db.commit()
-    db.refresh(db_word_cloud)
-    return db_word_cloud
+    return db.query(models.WordCloud).filter(models.WordCloud.id == word_cloud.id).first()
 
 def delete_word_cloud_item_generation(
         db: Session,
@@ -1871,6 +1787,65 @@ def read_leaderboard_analysis_word_cloud(
         return db_leaderboardanalysis_wordcloud.limit(require_num).all()
 
 
+def _word_cloud_source_query(
+        db: Session,
+        cloud_type: Literal['mistake', 'writing', 'user_chat', 'assistant_chat'],
+        leaderboard_id: int,
+        program_id: int,
+        after_id: int = 0,
+        after_completed_at: Optional[datetime.datetime] = None
+):
+    if cloud_type in ('mistake', 'writing'):
+        query = db.query(models.Generation, models.Round).\
+            join(models.Round, models.Generation.round_id == models.Round.id).\
+            filter(models.Round.leaderboard_id == leaderboard_id).\
+            filter(models.Round.program_id == program_id).\
+            filter(models.Generation.is_completed == True)
+        # by completion, not id: an older generation that completes late is still ahead of the watermark
+        if after_completed_at is not None:
+            query = query.filter(or_(
+                models.Generation.completed_at > after_completed_at,
+                and_(models.Generation.completed_at == after_completed_at, models.Generation.id > after_id),
+            ))
+        elif after_id:
+            query = query.filter(models.Generation.id > after_id)
+        return query.order_by(models.Generation.completed_at, models.Generation.id)
+    # messages are never edited, so they count as soon as they exist
+    query = db.query(models.Message).\
+        join(models.Round, models.Round.chat_history == models.Message.chat_id).\
+        filter(models.Round.leaderboard_id == leaderboard_id).\
+        filter(models.Round.program_id == program_id).\
+        filter(models.Message.id > after_id)
+    if cloud_type == 'user_chat':
+        query = query.filter(models.Message.sender == 'user')
+    else:
+        query = query.filter(models.Message.sender == 'assistant').\
+            filter(or_(models.Message.is_hint == True, models.Message.is_evaluation == True))
+    return query.order_by(models.Message.id)
+
+def get_word_cloud_sources(
+        db: Session,
+        cloud_type: Literal['mistake', 'writing', 'user_chat', 'assistant_chat'],
+        leaderboard_id: int,
+        program_id: int,
+        after_id: int = 0,
+        after_completed_at: Optional[datetime.datetime] = None,
+        limit: int = 500
+):
+    """Messages newer than `after_id`, or generations (with their rounds) completed after
+    (`after_completed_at`, `after_id`), oldest first."""
+    return _word_cloud_source_query(db, cloud_type, leaderboard_id, program_id, after_id, after_completed_at).limit(limit).all()
+
+def count_word_cloud_sources(
+        db: Session,
+        cloud_type: Literal['mistake', 'writing', 'user_chat', 'assistant_chat'],
+        leaderboard_id: int,
+        program_id: int,
+        after_id: int = 0,
+        after_completed_at: Optional[datetime.datetime] = None
+):
+    return _word_cloud_source_query(db, cloud_type, leaderboard_id, program_id, after_id, after_completed_at).order_by(None).count()
+
 def delete_word_cloud(
         db: Session,
         id: int
@@ -1943,4 +1918,32 @@ def update_word_cloud_item_color(
         db.commit()
         db.refresh(db_word_cloud_item)
         return db_word_cloud_item
-    return None
\ No newline at end of file
+    return None
+def get_translations(
+        db: Session,
+        text_hashes: List[str],
+        target_lang: str,
+        model: str
+):
+    if not text_hashes:
+        return {}
+    rows = db.query(models.TranslationCache.text_hash, models.TranslationCache.translated_text).\
+        filter(models.TranslationCache.text_hash.in_(text_hashes)).\
+        filter(models.TranslationCache.target_lang == target_lang).\
+        filter(models.TranslationCache.model == model).all()
+    return {text_hash: translated_text for text_hash, translated_text in rows}
+
+def create_translations(
+        db: Session,
+        translations: List[dict]
+):
+    # INSERT IGNORE: two workers translating the same text at once is harmless
+    if not translations:
+        return 0
+    stmt = mysql_insert(models.TranslationCache).prefix_with("IGNORE")
+    result = db.execute(stmt, [
+        {**translation, "created_at": datetime.datetime.now()}
+        for translation in translations
+    ])
+    db.commit()
+    return result.rowcount
@@ -0,0 +1,195 @@
+"""Async counterparts of the crud functions on the request and WebSocket hot path.
+
+They take an AsyncSession from AsyncSessionLocal2. Lazy loading is not available there, so
+every getter eager-loads the relationships its callers read, and `populate_existing` makes
+rows written by the Celery worker visible to a long-lived socket session. Images also get
+their deferred legacy `image` column, which blob_store reads for rows without a storage_key
+(it is NULL once migrate_images has moved a row).
+
+Writers flush once per logical step and commit once, with the summary rows of stats in the
+same transaction. The session does not expire on commit, so they return the objects they
+wrote instead of selecting them again.
+"""
+import datetime
+from typing import List, Optional
+
+from sqlalchemy import insert, inspect, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, undefer
+from sqlalchemy.orm.attributes import set_committed_value
+
+from . import caches, models, schemas, stats
+
+
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    return result.scalars().first()
+
+async def _execute(db: AsyncSession, statements) -> None:
+    for statement in statements:
+        await db.execute(statement)
+
+async def create_user_actions(db: AsyncSession, user_actions: List[dict]) -> None:
+    """One multi-row INSERT; rows are UserActionBase dumps (see action_buffer)."""
+    if not user_actions:
+        return
+    await db.execute(insert(models.User_Action), user_actions)
+    await db.commit()
+
+async def create_message(db: AsyncSession, message: schemas.MessageBase, chat_id: int):
+    return (await create_messages(db, [message], chat_id))[0]
+
+async def create_messages(db: AsyncSession, messages: List[schemas.MessageBase], chat_id: int):
+    db_messages = [models.Message(**message.model_dump(), chat_id=chat_id) for message in messages]
+    if db_messages:
+        db.add_all(db_messages)
+        await _execute(db, stats.messages_added(chat_id, db_messages))
+        await db.commit()
+    return db_messages
+
+def _generation_query():
+    return select(models.Generation).options(
+        selectinload(models.Generation.score),
+        selectinload(models.Generation.interpreted_image).options(undefer(models.InterpretedImage.image)),
+    ).execution_options(populate_existing=True)
+
+async def get_generation(db: AsyncSession, generation_id: int):
+    result = await db.execute(_generation_query().where(models.Generation.id == generation_id))
+    return result.scalars().first()
+
+def _new_generation(generation: schemas.GenerationCreate):
+    db_generation = models.Generation(**generation.model_dump())
+    # nothing can point at a new generation yet; mark the eager-loaded relationships as loaded
+    set_committed_value(db_generation, "score", None)
+    set_committed_value(db_generation, "interpreted_image", None)
+    return db_generation
+
+async def create_generation(db: AsyncSession, round_id: int, generation: schemas.GenerationCreate, db_round: Optional[models.Round] = None):
+    """Pass the caller's `db_round` to have its generations and last_generation_id kept current."""
+    db_generation = _new_generation(generation)
+    db.add(db_generation)
+    await db.flush()
+    if db_round is not None:
+        db_round.generations.append(db_generation)
+        db_round.last_generation_id = db_generation.id
+    else:
+        await db.execute(
+            update(models.Round).where(models.Round.id == round_id).values(last_generation_id=db_generation.id)
+        )
+    await db.commit()
+    return db_generation
+
+async def start_round(
+    db: AsyncSession,
+    leaderboard_id: int,
+    user_id: int,
+    created_at: datetime.datetime,
+    generation_created_at: datetime.datetime,
+    message: schemas.MessageBase,
+    model_name: str = "gpt-4o-mini",
+    program_id: Optional[int] = None,
+):
+    """Chat, round, empty first generation and welcome message in one transaction.
+
+    Returns the round reloaded with its relationships, the generation and the message.
+    """
+    db_chat = models.Chat()
+    db.add(db_chat)
+    await db.flush()
+    db_round = models.Round(
+        player_id=user_id,
+        chat_history=db_chat.id,
+        leaderboard_id=leaderboard_id,
+        model=model_name,
+        created_at=created_at,
+        program_id=program_id,
+    )
+    db.add(db_round)
+    await db.flush()
+    db_generation = _new_generation(schemas.GenerationCreate(
+        round_id=db_round.id,
+        sentence='',
+        generated_time=0,
+        created_at=generation_created_at,
+    ))
+    db_message = models.Message(**message.model_dump(), chat_id=db_chat.id)
+    db.add_all([db_generation, db_message])
+    await db.flush()
+    db_round.last_generation_id = db_generation.id
+    await _execute(db, stats.round_started(user_id, leaderboard_id, program_id))
+    await _execute(db, stats.messages_added(db_chat.id, [db_message]))
+    await db.commit()
+    return await get_round(db, db_round.id), db_generation, db_message
+
+async def _update_generation(db: AsyncSession, generation_id: int, **values):
+    # the socket already holds the generation, so this is usually an identity map hit
+    db_generation = await db.get(models.Generation, generation_id)
+    if db_generation is None:
+        raise ValueError("Generation not found")
+    if values.get("is_completed") and db_generation.completed_at is None:
+        values["completed_at"] = datetime.datetime.now()
+    before, after = stats.generation_updated(db_generation, values)
+    await _execute(db, before)
+    for key, value in values.items():
+        setattr(db_generation, key, value)
+    if after:
+        await db.flush()
+        await _execute(db, after)
+    await db.commit()
+    if inspect(db_generation).unloaded & {"score", "interpreted_image"}:
+        # through the eager query rather than refresh(), so the image column is loaded too
+        await get_generation(db, generation_id)
+    return db_generation
+
+async def update_generation0(db: AsyncSession, generation: schemas.GenerationCreate, generation_id: int):
+    return await _update_generation(
+        db, generation_id,
+        created_at=generation.created_at,
+        sentence=generation.sentence,
+    )
+
+async def update_generation1(db: AsyncSession, generation: schemas.GenerationCorrectSentence):
+    return await _update_generation(db, generation.id, correct_sentence=generation.correct_sentence)
+
+async def update_generation2(db: AsyncSession, generation: schemas.GenerationInterpretation):
+    db_generation = await _update_generation(db, generation.id, interpreted_image_id=generation.interpreted_image_id)
+    caches.invalidate_images("interpreted", [generation.id])
+    return db_generation
+
+async def update_generation3(db: AsyncSession, generation: schemas.GenerationComplete):
+    values = generation.model_dump(exclude_none=True)
+    return await _update_generation(db, values.pop("id"), **values)
+
+async def update_generation_duration(db: AsyncSession, generation_id: int, duration: int):
+    return await _update_generation(db, generation_id, duration=duration)
+
+async def get_round(db: AsyncSession, round_id: int):
+    result = await db.execute(
+        select(models.Round).
+        where(models.Round.id == round_id).
+        options(
+            selectinload(models.Round.leaderboard).selectinload(models.Leaderboard.original_image).options(undefer(models.OriginalImage.image)),
+            selectinload(models.Round.leaderboard).selectinload(models.Leaderboard.vocabularies),
+            selectinload(models.Round.generations),
+            selectinload(models.Round.program),
+        ).
+        execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
+async def update_round_display_name(db: AsyncSession, round_update: schemas.RoundUpdateName):
+    await db.execute(
+        update(models.Round).where(models.Round.id == round_update.id).values(display_name=round_update.display_name)
+    )
+    await db.commit()
+    db_round = await get_round(db, round_update.id)
+    if db_round is None:
+        raise ValueError("Round not found")
+    return db_round
+
+async def complete_round(db: AsyncSession, round_id: int, round: schemas.RoundComplete):
+    values = round.model_dump()
+    values.pop("id", None)
+    await db.execute(update(models.Round).where(models.Round.id == round_id).values(**values))
+    await db.commit()
+    return await get_round(db, round_id)
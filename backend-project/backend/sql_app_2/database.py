@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -7,11 +9,23 @@ import os
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 SQLALCHEMY_DATABASE_URL2 = os.getenv("DATABASE_URL2")
 
-POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "80"))
-MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "40"))
+# every gunicorn worker opens its own pools, so the default sizes are split between the
+# WEB_CONCURRENCY workers (gunicorn.conf.py exports it); explicit DB_* sizes are per process
+PROCESSES = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+def _per_process(total: int) -> str:
+    return str(max(1, total // PROCESSES))
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", _per_process(80)))
+MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", _per_process(40)))
 POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
 POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
 
+# the event loop's own pool; the sync pool stays for Celery, scripts and cold routes
+ASYNC_DB_DRIVER = os.getenv("ASYNC_DB_DRIVER", "aiomysql")
+ASYNC_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", _per_process(40)))
+ASYNC_MAX_OVERFLOW = int(os.getenv("ASYNC_DB_POOL_MAX_OVERFLOW", _per_process(20)))
+
 common_pool_kwargs = {
     "pool_size": POOL_SIZE,
     "max_overflow": MAX_OVERFLOW,
@@ -33,4 +47,21 @@ engine2 = create_engine(
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 SessionLocal2 = sessionmaker(autocommit=False, autoflush=False, bind=engine2)
 
+
+def _async_url(url: str):
+    """Same database through the asyncio driver, e.g. mysql+pymysql:// -> mysql+aiomysql://."""
+    url = make_url(url)
+    return url.set(drivername=f"{url.get_backend_name()}+{ASYNC_DB_DRIVER}")
+
+SQLALCHEMY_ASYNC_DATABASE_URL2 = os.getenv("ASYNC_DATABASE_URL2") or _async_url(SQLALCHEMY_DATABASE_URL2)
+
+async_engine2 = create_async_engine(
+    SQLALCHEMY_ASYNC_DATABASE_URL2,
+    **{**common_pool_kwargs, "pool_size": ASYNC_POOL_SIZE, "max_overflow": ASYNC_MAX_OVERFLOW},
+)
+
+# objects outlive their commit: lazy loads are not possible on an AsyncSession, so the
+# async crud functions eager-load what the handlers read
+AsyncSessionLocal2 = async_sessionmaker(async_engine2, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
\ No newline at end of file
@@ -0,0 +1,200 @@
+import base64, hashlib, io, os, tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Optional
+
+from PIL import Image
+
+BLOB_STORE_BACKEND = os.getenv("BLOB_STORE_BACKEND", "local")
+MEDIA_DIR = Path(os.getenv("MEDIA_DIR", "/static"))
+BLOB_LOCAL_SUBDIR = os.getenv("BLOB_LOCAL_SUBDIR", "blobs")
+BLOB_S3_BUCKET = os.getenv("BLOB_S3_BUCKET")
+BLOB_S3_ENDPOINT_URL = os.getenv("BLOB_S3_ENDPOINT_URL")
+BLOB_S3_PREFIX = os.getenv("BLOB_S3_PREFIX", "images/")
+
+
+@dataclass
+class BlobMeta:
+    key: str
+    mime_type: str
+    width: Optional[int]
+    height: Optional[int]
+    byte_size: int
+
+
+class LocalBlobStore:
+    """Content-addressed files under MEDIA_DIR/blobs/ab/cd/<sha256>."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key[2:4] / key
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).is_file()
+
+    def put(self, key: str, data: bytes, mime_type: str) -> None:
+        path = self._path(key)
+        if path.is_file():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write to a temp file in the same directory so the rename is atomic
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_name, path)
+        except Exception:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+
+    def get(self, key: str) -> bytes:
+        try:
+            return self._path(key).read_bytes()
+        except FileNotFoundError:
+            raise KeyError(key)
+
+    def delete(self, key: str) -> None:
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+
+class S3BlobStore:
+    """Any S3-compatible bucket (AWS S3, MinIO, R2...). Credentials come from the usual AWS_* variables."""
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, prefix: str = ""):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("BLOB_STORE_BACKEND=s3 requires boto3 to be installed")
+        if not bucket:
+            raise RuntimeError("BLOB_S3_BUCKET must be set when BLOB_STORE_BACKEND=s3")
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client_error = ClientError
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except self._client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put(self, key: str, data: bytes, mime_type: str) -> None:
+        if self.exists(key):
+            return
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self._object_key(key),
+            Body=data,
+            ContentType=mime_type,
+            CacheControl="public, max-age=31536000, immutable",
+        )
+
+    def get(self, key: str) -> bytes:
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        except self._client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                raise KeyError(key)
+            raise
+        return obj["Body"].read()
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+
+_store = None
+_store_lock = Lock()
+
+def get_blob_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if BLOB_STORE_BACKEND == "s3":
+                    _store = S3BlobStore(
+                        bucket=BLOB_S3_BUCKET,
+                        endpoint_url=BLOB_S3_ENDPOINT_URL,
+                        prefix=BLOB_S3_PREFIX,
+                    )
+                elif BLOB_STORE_BACKEND == "local":
+                    _store = LocalBlobStore(MEDIA_DIR / BLOB_LOCAL_SUBDIR)
+                else:
+                    raise RuntimeError(f"Unknown BLOB_STORE_BACKEND: {BLOB_STORE_BACKEND}")
+    return _store
+
+def content_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def sniff_mime_type(data: bytes) -> str:
+    """Cheap magic-number check, used when a row has no stored mime type."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+def describe_image(data: bytes):
+    """Return (mime_type, width, height); falls back to the magic-number sniff for unreadable data."""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            mime_type = Image.MIME.get(img.format) or sniff_mime_type(data)
+            return mime_type, img.width, img.height
+    except Exception:
+        return sniff_mime_type(data), None, None
+
+def _strip_data_url(image_str: str) -> str:
+    if "base64," in image_str:
+        return image_str.split("base64,", 1)[1]
+    return image_str
+
+def put_image(data: bytes) -> BlobMeta:
+    key = content_key(data)
+    mime_type, width, height = describe_image(data)
+    get_blob_store().put(key, data, mime_type)
+    return BlobMeta(
+        key=key,
+        mime_type=mime_type,
+        width=width,
+        height=height,
+        byte_size=len(data),
+    )
+
+def put_image_base64(image_str: str) -> BlobMeta:
+    return put_image(base64.b64decode(_strip_data_url(image_str)))
+
+def load_image_bytes(db_image) -> Optional[bytes]:
+    """Read an OriginalImage/InterpretedImage row, falling back to the legacy base64 column."""
+    if db_image is None:
+        return None
+    if db_image.storage_key:
+        return get_blob_store().get(db_image.storage_key)
+    if db_image.image:
+        return base64.b64decode(_strip_data_url(db_image.image))
+    return None
+
+def load_image_base64(db_image) -> Optional[str]:
+    if db_image is None:
+        return None
+    if not db_image.storage_key:
+        return db_image.image
+    data = load_image_bytes(db_image)
+    return base64.b64encode(data).decode("utf-8")
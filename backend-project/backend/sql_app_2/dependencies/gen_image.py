@@ -1,121 +1,107 @@
-from openai import OpenAI
 import urllib.request 
 
-from google import genai
 from google.genai import types
 from PIL import Image
 from io import BytesIO
-import base64, os, requests, time
+import base64, requests
 from util import encode_image, logger_image
+from .llm_clients import get_openai, get_gemini
+from . import llm_scheduler
 from typing import Literal
 
 def save_image(url, filename):
     urllib.request.urlretrieve(url, filename)
 
 def gen_image(sentence,size="1024x1024",quality="standard",n=1):
-    client = OpenAI()
-
-    while True:
-        try:
-            response = client.images.generate(
-                model="dall-e-3",
-                prompt=sentence,
-                size=size,
-                quality=quality,
-                n=n,
-                )
-            break
-        except Exception as e:
-            print(f"Error: {e}")
-            continue
+    client = get_openai()
+    response = llm_scheduler.call(
+        "dall-e-3",
+        client.images.generate,
+        model="dall-e-3",
+        prompt=sentence,
+        size=size,
+        quality=quality,
+        n=n,
+    )
     return response.data[0].url
 
-def gen_image_gpt_image_1_5(prompt):
-    client = OpenAI()
-    while True:
-        try:
-            result = client.images.generate(
-                model="gpt-image-1.5",
-                prompt=prompt,
-                size='1024x1024'
-            )
-
-            if result and result.data and result.data[0].b64_json:
-                break
-        except Exception as e:
-            print(f"Error: {e}")
-            continue
+def _images_b64(client, **request):
+    result = client.images.generate(**request)
+    if not (result and result.data and result.data[0].b64_json):
+        raise llm_scheduler.RetryableResponseError(f"{request['model']} returned no image data")
     return result.data[0].b64_json
 
+def gen_image_gpt_image_1_5(prompt):
+    client = get_openai()
+    return llm_scheduler.call(
+        "gpt-image-1.5",
+        _images_b64,
+        client,
+        model="gpt-image-1.5",
+        prompt=prompt,
+        size='1024x1024'
+    )
+
 def gen_image_gpt_image_2(prompt):
-    client = OpenAI()
-    while True:
-        try:
-            result = client.images.generate(
-                model="gpt-image-2",
-                prompt=prompt,
-                quality="low",
-                size='1024x1024'
-            )
+    client = get_openai()
+    return llm_scheduler.call(
+        "gpt-image-2",
+        _images_b64,
+        client,
+        model="gpt-image-2",
+        prompt=prompt,
+        quality="low",
+        size='1024x1024'
+    )
 
-            if result and result.data and result.data[0].b64_json:
-                break
-        except Exception as e:
-            print(f"Error: {e}")
-            continue
-    return result.data[0].b64_json
+def _responses_image(client, **request):
+    response = client.responses.create(**request)
+    image_data = [
+        output.result
+        for output in response.output
+        if output.type == "image_generation_call"
+    ]
+    if not image_data:
+        raise llm_scheduler.RetryableResponseError(f"{request['model']} returned no image")
+    return image_data[0]
 
 def gen_image_gpt_5(prompt):
-    client = OpenAI()
-    while True:
-        try:
-            response = client.responses.create(
-                model="gpt-5",
-                input=prompt,
-                tools=[{"type": "image_generation"}],
-            )
+    client = get_openai()
+    return llm_scheduler.call(
+        "gpt-5",
+        _responses_image,
+        client,
+        est_tokens=llm_scheduler.estimate_tokens(prompt),
+        model="gpt-5",
+        input=prompt,
+        tools=[{"type": "image_generation"}],
+    )
 
-            image_data = [
-                output.result
-                for output in response.output
-                if output.type == "image_generation_call"
-            ]
+def _gemini_image(client, prompt):
+    response = client.models.generate_content(
+        model="gemini-2.5-flash-image",
+        contents=[prompt],
+        config=types.GenerateContentConfig(
+        response_modalities=['TEXT', 'IMAGE']
+        )
+    )
+    logger_image.info(f"Response: {prompt}")
+    for part in response.parts or []:
+        if part.text is not None:
+            logger_image.info(f"Text part: {part.text}")
+        elif part.inline_data is not None:
+            logger_image.info(f"Image part: {part.inline_data.mime_type}")
+            return Image.open(BytesIO((part.inline_data.data)))
+    raise llm_scheduler.RetryableResponseError("gemini returned no image part")
 
-            if image_data:
-                break
-        except Exception as e:
-            print(f"Error: {e}")
-            continue
-    return image_data[0]
-       
 def gen_image_gemini(prompt):
-    client = genai.Client(api_key=os.environ["GEMINI_API_KEY"])
-
-    while True:
-        try:
-            response = client.models.generate_content(
-                model="gemini-2.5-flash-image",
-                contents=[prompt],
-                config=types.GenerateContentConfig(
-                response_modalities=['TEXT', 'IMAGE']
-                )
-            )
-            logger_image.info(f"Response: {prompt}")
-            for part in response.parts:
-                if part.text is not None:
-                    logger_image.info(f"Text part: {part.text}")
-                elif part.inline_data is not None:
-                    logger_image.info(f"Image part: {part.inline_data.mime_type}")
-                    image = Image.open(BytesIO((part.inline_data.data)))
-                    return image
-        # Catch 429 RESOURCE_EXHAUSTED error and retry
-        except genai.errors.APIError as e:
-            logger_image.error(f"Resource exhausted: {e}")
-            details = e.response.json().get('error', {}).get('details', [])
-            for detail in details:
-                if detail.get('@type') == 'type.googleapis.com/google.rpc.RetryInfo':
-                    retry_delay = detail.get('retryDelay')
-                    time.sleep(int(retry_delay.split('s')[0]))
+    # 429 RESOURCE_EXHAUSTED and its RetryInfo delay are handled by the scheduler
+    return llm_scheduler.call(
+        "gemini-2.5-flash-image",
+        _gemini_image,
+        get_gemini(),
+        prompt,
+    )
 
 def generate_interpretion(
     sentence, 
@@ -1,9 +1,16 @@
-from openai import OpenAI
-client = OpenAI()
+from .llm_clients import get_openai
+from . import llm_scheduler
 
 def get_embedding(text, model="text-embedding-3-small"):
    text = text.replace("\n", " ")
-   return client.embeddings.create(input = [text], model=model).data[0].embedding
+   response = llm_scheduler.call(
+      model,
+      get_openai().embeddings.create,
+      est_tokens=len(text) // 4 + 1,
+      input = [text],
+      model=model
+   )
+   return response.data[0].embedding
 
 import numpy as np
 
@@ -0,0 +1,178 @@
+"""Image similarity computed in the worker instead of by the chat model.
+
+A program picks the method with a `SIM:<method>` token in Program.feedback, for example
+"AWE+IMG+SIM:local". Without the token IMAGE_SIMILARITY_METHOD applies.
+
+- `llm`: Hint_Chatbot.image_similarity, one chat model call per generation
+- `local`: weighted mean of a perceptual hash, an HSV histogram intersection and SSIM,
+  all on copies downscaled to IMAGE_SIMILARITY_SIZE pixels
+- `clip`: cosine similarity of CLIP image embeddings on the CPU; needs transformers and
+  torch, and falls back to `local` when the model cannot be loaded
+
+Every method returns a float between 0 and 1. Features are cached per content hash, so the
+leaderboard's original image is decoded once per worker and not once per generation.
+"""
+import io, logging, os
+from dataclasses import dataclass
+from threading import Lock, RLock
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+from cachetools import TTLCache
+
+from . import blob_store
+
+logger = logging.getLogger(__name__)
+
+METHODS = ("llm", "local", "clip")
+
+IMAGE_SIMILARITY_METHOD = os.getenv("IMAGE_SIMILARITY_METHOD", "llm")
+IMAGE_SIMILARITY_SIZE = int(os.getenv("IMAGE_SIMILARITY_SIZE", "128"))
+# perceptual hash, histogram, SSIM
+IMAGE_SIMILARITY_WEIGHTS = tuple(float(w) for w in os.getenv("IMAGE_SIMILARITY_WEIGHTS", "0.3,0.3,0.4").split(","))
+IMAGE_SIMILARITY_CLIP_MODEL = os.getenv("IMAGE_SIMILARITY_CLIP_MODEL", "openai/clip-vit-base-patch32")
+IMAGE_FEATURE_CACHE_TTL = int(os.getenv("IMAGE_FEATURE_CACHE_TTL", "3600"))
+IMAGE_FEATURE_CACHE_MAXSIZE = int(os.getenv("IMAGE_FEATURE_CACHE_MAXSIZE", "256"))
+
+feature_cache = TTLCache(maxsize=IMAGE_FEATURE_CACHE_MAXSIZE, ttl=IMAGE_FEATURE_CACHE_TTL)
+feature_cache_lock = RLock()
+
+_SSIM_C1 = (0.01 * 255) ** 2
+_SSIM_C2 = (0.03 * 255) ** 2
+
+
+def method_for(feedback: Optional[str]) -> str:
+    for token in (feedback or "").split("+"):
+        name, _, value = token.strip().partition(":")
+        if name.upper() == "SIM" and value.lower() in METHODS:
+            return value.lower()
+    return IMAGE_SIMILARITY_METHOD
+
+
+@dataclass(frozen=True)
+class Features:
+    phash: np.ndarray
+    hist: np.ndarray
+    gray: np.ndarray
+
+
+def decode(data: bytes) -> np.ndarray:
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Could not decode image")
+    return image
+
+
+def features(image: np.ndarray) -> Features:
+    small = cv2.resize(image, (IMAGE_SIMILARITY_SIZE, IMAGE_SIMILARITY_SIZE), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+    # pHash: the 8x8 lowest frequencies of a 32x32 DCT, against their median without the DC term
+    low = cv2.dct(cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA))[:8, :8].ravel()
+    phash = low > np.median(low[1:])
+
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1, 2], None, [8, 4, 4], [0, 180, 0, 256, 0, 256]).ravel()
+    hist /= max(float(hist.sum()), 1.0)
+    return Features(phash=phash, hist=hist, gray=gray)
+
+
+def phash_similarity(a: Features, b: Features) -> float:
+    return 1.0 - np.count_nonzero(a.phash != b.phash) / a.phash.size
+
+
+def histogram_similarity(a: Features, b: Features) -> float:
+    return float(np.minimum(a.hist, b.hist).sum())
+
+
+def ssim(a: Features, b: Features) -> float:
+    def blur(x):
+        return cv2.GaussianBlur(x, (7, 7), 1.5)
+
+    x, y = a.gray, b.gray
+    mu_x, mu_y = blur(x), blur(y)
+    var_x = blur(x * x) - mu_x * mu_x
+    var_y = blur(y * y) - mu_y * mu_y
+    cov = blur(x * y) - mu_x * mu_y
+    ssim_map = ((2 * mu_x * mu_y + _SSIM_C1) * (2 * cov + _SSIM_C2)) / \
+        ((mu_x * mu_x + mu_y * mu_y + _SSIM_C1) * (var_x + var_y + _SSIM_C2))
+    # structurally inverted images score below 0; treat them as unrelated
+    return float(np.clip(ssim_map.mean(), 0.0, 1.0))
+
+
+def components(a: Features, b: Features) -> Dict[str, float]:
+    scores = {
+        "phash": phash_similarity(a, b),
+        "histogram": histogram_similarity(a, b),
+        "ssim": ssim(a, b),
+    }
+    total = sum(IMAGE_SIMILARITY_WEIGHTS) or 1.0
+    scores["local"] = sum(w * s for w, s in zip(IMAGE_SIMILARITY_WEIGHTS, scores.values())) / total
+    return scores
+
+
+def _cached(kind: str, db_image, compute):
+    key = (kind, db_image.storage_key) if db_image.storage_key else None
+    if key is not None:
+        with feature_cache_lock:
+            if key in feature_cache:
+                return feature_cache[key]
+    data = blob_store.load_image_bytes(db_image)
+    if not data:
+        raise ValueError(f"Image {db_image.id} has no data")
+    value = compute(data)
+    if key is not None:
+        with feature_cache_lock:
+            feature_cache[key] = value
+    return value
+
+
+def image_features(db_image) -> Features:
+    return _cached("local", db_image, lambda data: features(decode(data)))
+
+
+_clip = None
+_clip_lock = Lock()
+
+
+def _load_clip():
+    global _clip
+    with _clip_lock:
+        if _clip is None:
+            import torch
+            from transformers import CLIPModel, CLIPProcessor
+            model = CLIPModel.from_pretrained(IMAGE_SIMILARITY_CLIP_MODEL).eval()
+            _clip = (torch, model, CLIPProcessor.from_pretrained(IMAGE_SIMILARITY_CLIP_MODEL))
+    return _clip
+
+
+def _clip_embedding(data: bytes) -> np.ndarray:
+    from PIL import Image
+
+    torch, model, processor = _load_clip()
+    inputs = processor(images=Image.open(io.BytesIO(data)).convert("RGB"), return_tensors="pt")
+    with torch.no_grad():
+        embedding = model.get_image_features(**inputs)[0].numpy()
+    return embedding / np.linalg.norm(embedding)
+
+
+def image_embedding(db_image) -> np.ndarray:
+    return _cached("clip", db_image, _clip_embedding)
+
+
+def compare(image1, image2, method: str = "local") -> Optional[float]:
+    """Similarity of two OriginalImage/InterpretedImage rows; None when it cannot be computed."""
+    if image1 is None or image2 is None:
+        return None
+    try:
+        if method == "clip":
+            try:
+                # CLIP cosines of related images sit well above 0; negative ones count as unrelated
+                return float(np.clip(image_embedding(image1) @ image_embedding(image2), 0.0, 1.0))
+            except (ImportError, OSError) as e:
+                logger.warning(f"CLIP unavailable, using local similarity: {e}")
+        return components(image_features(image1), image_features(image2))["local"]
+    except Exception as e:
+        logger.error(f"Image similarity of {image1.id} and {image2.id} failed: {e}")
+        return None
@@ -0,0 +1,103 @@
+import os
+from threading import Lock
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+from . import llm_scheduler
+
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "200"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "50"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "180"))
+# retries are owned by llm_scheduler so they share its backoff and retry budget
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "0"))
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "true").lower() in ("1", "true", "yes")
+
+try:
+    import h2  # noqa: F401  httpx needs it for http2=True
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+_lock = Lock()
+_clients = {}
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+
+
+def _get_or_create(name: str, factory):
+    # clients hold sockets, so a forked worker (gunicorn, celery prefork) must build its own
+    key = (name, os.getpid())
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = factory()
+                _clients[key] = client
+    return client
+
+
+def get_openai() -> OpenAI:
+    """Process-wide sync client for Celery tasks and other blocking callers."""
+    return _get_or_create(
+        "openai",
+        lambda: OpenAI(
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=httpx.Client(
+                limits=_limits(),
+                timeout=_timeout(),
+                http2=OPENAI_HTTP2 and _HTTP2_AVAILABLE,
+                event_hooks={"response": [llm_scheduler.observe_response]},
+            ),
+        ),
+    )
+
+
+def get_async_openai() -> AsyncOpenAI:
+    """Process-wide async client for request handlers and the WebSocket loop."""
+    return _get_or_create(
+        "async_openai",
+        lambda: AsyncOpenAI(
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=httpx.AsyncClient(
+                limits=_limits(),
+                timeout=_timeout(),
+                http2=OPENAI_HTTP2 and _HTTP2_AVAILABLE,
+                event_hooks={"response": [llm_scheduler.aobserve_response]},
+            ),
+        ),
+    )
+
+
+def get_gemini():
+    """Process-wide Gemini client; use `.aio` on it for the async API."""
+    from google import genai
+    return _get_or_create(
+        "gemini",
+        lambda: genai.Client(api_key=os.environ["GEMINI_API_KEY"]),
+    )
+
+
+async def aclose_clients() -> None:
+    pid = os.getpid()
+    with _lock:
+        keys = [key for key in _clients if key[1] == pid]
+        clients = [_clients.pop(key) for key in keys]
+    for client in clients:
+        if isinstance(client, AsyncOpenAI):
+            await client.close()
+        elif isinstance(client, OpenAI):
+            client.close()
@@ -0,0 +1,391 @@
+"""Process-wide admission control for LLM calls.
+
+Every OpenAI/Gemini request goes through `call` (sync) or `acall` (async), keyed by model:
+
+- per-model token buckets for requests/min and tokens/min, seeded from
+  LLM_RATE_LIMITS and corrected from the `x-ratelimit-*` response headers,
+  which reflect the account-wide state shared with the other processes
+- interactive work (hints, submit checks) always goes first; batch work
+  (word clouds, descriptions, fix_error) is capped in concurrency, may not
+  dip into the last LLM_BATCH_RESERVE of a bucket and waits while any
+  interactive call is queued
+- retries use full-jitter exponential backoff, honour retry-after, and draw
+  from a shared retry budget so a 429 storm does not multiply itself
+- each call, with its queueing and retries, is one "llm" span in instrumentation
+"""
+import asyncio, contextvars, json, logging, os, random, re, threading, time
+from contextlib import contextmanager
+from typing import Optional
+
+import openai
+
+import instrumentation
+
+logger = logging.getLogger("llm_scheduler")
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+LLM_DEFAULT_RPM = int(os.getenv("LLM_DEFAULT_RPM", "500"))
+LLM_DEFAULT_TPM = int(os.getenv("LLM_DEFAULT_TPM", "200000"))
+# per-model overrides, e.g. {"gpt-4o": {"rpm": 5000, "tpm": 800000}, "gpt-image-2": {"rpm": 50}}
+LLM_RATE_LIMITS = json.loads(os.getenv("LLM_RATE_LIMITS", "{}"))
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "200"))
+LLM_BATCH_MAX_INFLIGHT = int(os.getenv("LLM_BATCH_MAX_INFLIGHT", "20"))
+LLM_BATCH_RESERVE = float(os.getenv("LLM_BATCH_RESERVE", "0.2"))
+LLM_MAX_QUEUE_WAIT = float(os.getenv("LLM_MAX_QUEUE_WAIT", "120"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_CAP = float(os.getenv("LLM_BACKOFF_CAP", "30"))
+LLM_RETRY_BUDGET = float(os.getenv("LLM_RETRY_BUDGET", "20"))
+LLM_RETRY_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.2"))
+LLM_IMAGE_INPUT_TOKENS = int(os.getenv("LLM_IMAGE_INPUT_TOKENS", "800"))
+
+_current_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+_current_model = contextvars.ContextVar("llm_model", default=None)
+
+
+class LLMQueueTimeout(Exception):
+    pass
+
+
+class RetryableResponseError(Exception):
+    """Raised by callers when a 200 response is unusable (e.g. no image data) and should be retried."""
+
+
+@contextmanager
+def priority_scope(priority: str):
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> str:
+    return _current_priority.get()
+
+
+def estimate_tokens(request, output_tokens: int = 500) -> int:
+    """Rough upper bound used for admission; corrected from `usage` once the response arrives."""
+    chars = 0
+    images = 0
+    stack = [request]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+        elif isinstance(item, str):
+            if item.startswith("data:image"):
+                images += 1
+            else:
+                chars += len(item)
+    return chars // 4 + images * LLM_IMAGE_INPUT_TOKENS + output_tokens
+
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+def _parse_duration(value: Optional[str]) -> Optional[float]:
+    # OpenAI sends reset times like "1s", "6m0s" or "20ms"
+    if not value:
+        return None
+    matches = _DURATION_RE.findall(value)
+    if not matches:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(n) * _DURATION_UNITS[unit] for n, unit in matches)
+
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / 60.0
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, reserve: float, now: float) -> float:
+        self._refill(now)
+        # never ask for more than the bucket can ever hold
+        amount = min(amount, self.capacity * (1 - reserve))
+        missing = amount + self.capacity * reserve - self.level
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate if self.rate > 0 else LLM_BACKOFF_CAP
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+    def sync(self, limit: Optional[int], remaining: Optional[int], now: float) -> None:
+        self._refill(now)
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            self.level = min(self.level, float(remaining))
+
+
+class ModelLimiter:
+    def __init__(self, model: str):
+        limits = LLM_RATE_LIMITS.get(model, {})
+        self.requests = TokenBucket(limits.get("rpm", LLM_DEFAULT_RPM))
+        self.tokens = TokenBucket(limits.get("tpm", LLM_DEFAULT_TPM))
+        self.blocked_until = 0.0
+
+
+class LLMScheduler:
+    def __init__(self):
+        # only held for short bookkeeping, never while waiting, so it is safe from async code
+        self._lock = threading.Lock()
+        self._limiters = {}
+        self._inflight = {INTERACTIVE: 0, BATCH: 0}
+        self._waiting_interactive = 0
+        self._retry_budget = LLM_RETRY_BUDGET
+
+    def _limiter(self, model: str) -> ModelLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            limiter = self._limiters[model] = ModelLimiter(model)
+        return limiter
+
+    def _try_admit(self, model: str, priority: str, tokens: int) -> float:
+        """Reserve capacity and return 0, or return how long to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            limiter = self._limiter(model)
+            if limiter.blocked_until > now:
+                return limiter.blocked_until - now
+            if sum(self._inflight.values()) >= LLM_MAX_INFLIGHT:
+                return 0.05
+            reserve = 0.0
+            if priority == BATCH:
+                if self._waiting_interactive or self._inflight[BATCH] >= LLM_BATCH_MAX_INFLIGHT:
+                    return 0.2
+                reserve = LLM_BATCH_RESERVE
+            wait = max(
+                limiter.requests.wait_time(1, reserve, now),
+                limiter.tokens.wait_time(tokens, reserve, now) if tokens else 0.0,
+            )
+            if wait > 0:
+                return wait
+            limiter.requests.take(1)
+            limiter.tokens.take(tokens)
+            self._inflight[priority] += 1
+            self._retry_budget = min(LLM_RETRY_BUDGET, self._retry_budget + LLM_RETRY_BUDGET_RATIO)
+            return 0.0
+
+    def _set_waiting(self, priority: str, delta: int) -> None:
+        if priority == INTERACTIVE:
+            with self._lock:
+                self._waiting_interactive += delta
+
+    def _release(self, model: str, priority: str, estimated: int, actual: Optional[int]) -> None:
+        with self._lock:
+            self._inflight[priority] -= 1
+            if actual is not None:
+                self._limiter(model).tokens.take(actual - estimated)
+
+    def _sleep_for(self, wait: float, deadline: float, model: str) -> float:
+        now = time.monotonic()
+        if now + wait > deadline:
+            raise LLMQueueTimeout(f"Timed out waiting for LLM capacity on {model}")
+        # short slices so higher priority work and header updates are noticed quickly
+        return min(wait, 1.0) + random.uniform(0, 0.05)
+
+    def _admit(self, model: str, priority: str, tokens: int) -> None:
+        deadline = time.monotonic() + LLM_MAX_QUEUE_WAIT
+        wait = self._try_admit(model, priority, tokens)
+        if wait == 0:
+            return
+        self._set_waiting(priority, 1)
+        try:
+            while wait > 0:
+                time.sleep(self._sleep_for(wait, deadline, model))
+                wait = self._try_admit(model, priority, tokens)
+        finally:
+            self._set_waiting(priority, -1)
+
+    async def _aadmit(self, model: str, priority: str, tokens: int) -> None:
+        deadline = time.monotonic() + LLM_MAX_QUEUE_WAIT
+        wait = self._try_admit(model, priority, tokens)
+        if wait == 0:
+            return
+        self._set_waiting(priority, 1)
+        try:
+            while wait > 0:
+                await asyncio.sleep(self._sleep_for(wait, deadline, model))
+                wait = self._try_admit(model, priority, tokens)
+        finally:
+            self._set_waiting(priority, -1)
+
+    def observe_headers(self, model: Optional[str], headers) -> None:
+        if model is None or "x-ratelimit-remaining-requests" not in headers:
+            return
+        with self._lock:
+            now = time.monotonic()
+            limiter = self._limiter(model)
+            remaining_requests = _parse_int(headers.get("x-ratelimit-remaining-requests"))
+            remaining_tokens = _parse_int(headers.get("x-ratelimit-remaining-tokens"))
+            limiter.requests.sync(_parse_int(headers.get("x-ratelimit-limit-requests")), remaining_requests, now)
+            limiter.tokens.sync(_parse_int(headers.get("x-ratelimit-limit-tokens")), remaining_tokens, now)
+            if remaining_requests == 0:
+                reset = _parse_duration(headers.get("x-ratelimit-reset-requests"))
+                if reset:
+                    limiter.blocked_until = max(limiter.blocked_until, now + reset)
+            if remaining_tokens == 0:
+                reset = _parse_duration(headers.get("x-ratelimit-reset-tokens"))
+                if reset:
+                    limiter.blocked_until = max(limiter.blocked_until, now + reset)
+
+    def _retry_delay(self, model: str, e: Exception, attempt: int) -> Optional[float]:
+        """Return the backoff before the next attempt, or None if the error should propagate."""
+        retry_after = None
+        if isinstance(e, openai.RateLimitError):
+            if getattr(e, "code", None) == "insufficient_quota":
+                return None
+            headers = e.response.headers if getattr(e, "response", None) is not None else {}
+            if headers.get("retry-after-ms"):
+                retry_after = _parse_duration(f"{headers['retry-after-ms']}ms")
+            else:
+                retry_after = _parse_duration(headers.get("retry-after"))
+        elif isinstance(e, (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)):
+            pass
+        elif isinstance(e, RetryableResponseError):
+            pass
+        elif type(e).__module__.startswith("google.genai") and getattr(e, "code", None) in (429, 500, 503):
+            retry_after = _gemini_retry_delay(e)
+        else:
+            return None
+
+        if attempt + 1 >= LLM_MAX_ATTEMPTS:
+            return None
+        with self._lock:
+            if self._retry_budget < 1:
+                logger.warning(f"Retry budget exhausted, not retrying {model}: {e}")
+                return None
+            self._retry_budget -= 1
+            delay = random.uniform(0, min(LLM_BACKOFF_CAP, LLM_BACKOFF_BASE * 2 ** attempt))
+            if retry_after:
+                delay = max(delay, retry_after)
+                # everyone else waiting on this model should back off too
+                limiter = self._limiter(model)
+                limiter.blocked_until = max(limiter.blocked_until, time.monotonic() + retry_after)
+        logger.info(f"Retrying {model} in {delay:.2f}s (attempt {attempt + 1}): {e}")
+        return delay
+
+    def call(self, model_key: str, fn, /, *args, priority: Optional[str] = None, est_tokens: int = 0, **kwargs):
+        priority = priority or current_priority()
+        with instrumentation.span(model_key, "llm", priority=priority):
+            return self._call(model_key, fn, priority, est_tokens, *args, **kwargs)
+
+    def _call(self, model_key: str, fn, priority: str, est_tokens: int, /, *args, **kwargs):
+        attempt = 0
+        while True:
+            self._admit(model_key, priority, est_tokens)
+            token = _current_model.set(model_key)
+            actual = None
+            try:
+                result = fn(*args, **kwargs)
+                actual = _usage_tokens(result)
+                return result
+            except Exception as e:
+                delay = self._retry_delay(model_key, e, attempt)
+                if delay is None:
+                    raise
+            finally:
+                _current_model.reset(token)
+                self._release(model_key, priority, est_tokens, actual)
+            attempt += 1
+            time.sleep(delay)
+
+    async def acall(self, model_key: str, fn, /, *args, priority: Optional[str] = None, est_tokens: int = 0, **kwargs):
+        priority = priority or current_priority()
+        with instrumentation.span(model_key, "llm", priority=priority):
+            return await self._acall(model_key, fn, priority, est_tokens, *args, **kwargs)
+
+    async def _acall(self, model_key: str, fn, priority: str, est_tokens: int, /, *args, **kwargs):
+        attempt = 0
+        while True:
+            await self._aadmit(model_key, priority, est_tokens)
+            token = _current_model.set(model_key)
+            actual = None
+            try:
+                result = await fn(*args, **kwargs)
+                actual = _usage_tokens(result)
+                return result
+            except Exception as e:
+                delay = self._retry_delay(model_key, e, attempt)
+                if delay is None:
+                    raise
+            finally:
+                _current_model.reset(token)
+                self._release(model_key, priority, est_tokens, actual)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "inflight": dict(self._inflight),
+                "waiting_interactive": self._waiting_interactive,
+                "retry_budget": round(self._retry_budget, 2),
+                "models": {
+                    model: {
+                        "requests_left": round(limiter.requests.level, 1),
+                        "tokens_left": round(limiter.tokens.level, 1),
+                        "blocked_for": max(0.0, round(limiter.blocked_until - now, 2)),
+                    }
+                    for model, limiter in self._limiters.items()
+                },
+            }
+
+
+def _usage_tokens(result) -> Optional[int]:
+    usage = getattr(result, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+
+def _gemini_retry_delay(e) -> Optional[float]:
+    try:
+        details = e.response.json().get("error", {}).get("details", [])
+    except Exception:
+        return None
+    for detail in details:
+        if detail.get("@type") == "type.googleapis.com/google.rpc.RetryInfo":
+            return _parse_duration(detail.get("retryDelay"))
+    return None
+
+
+scheduler = LLMScheduler()
+
+def call(model_key: str, fn, /, *args, **kwargs):
+    """Run `fn(*args, **kwargs)` under the limits of `model_key`; kwargs may carry the API's own `model`."""
+    return scheduler.call(model_key, fn, *args, **kwargs)
+
+async def acall(model_key: str, fn, /, *args, **kwargs):
+    return await scheduler.acall(model_key, fn, *args, **kwargs)
+
+def observe_response(response) -> None:
+    """httpx response hook; the model comes from the call that is currently in flight."""
+    scheduler.observe_headers(_current_model.get(), response.headers)
+
+async def aobserve_response(response) -> None:
+    scheduler.observe_headers(_current_model.get(), response.headers)
@@ -1,13 +1,18 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from typing import Optional
+from threading import RLock
+from cachetools import TTLCache
 
-import io, gc, json
+import io, gc, json, os
 import requests
 import base64
 import PIL.Image
 from PIL.PngImagePlugin import PngImageFile
 from PIL.JpegImagePlugin import JpegImageFile
 
+from .llm_clients import get_openai, get_async_openai
+from . import llm_scheduler, provider_files, shared_cache
+
 def convert_image(img):
     if img:
         try:
@@ -17,14 +22,7 @@ def convert_image(img):
         return pilImage
     return None 
 
-class Hint_Chatbot:
-    def __init__(self, model_name="gpt-4o", vocabularies=None, first_res_id=None, prev_res_id=None, prev_res_ids=[]):
-        self.client=OpenAI()
-        self.first_res_id=first_res_id
-        self.prev_res_ids = prev_res_ids
-        self.prev_res_id=prev_res_id
-        
-        self.system_prompt = f"""
+HINT_SYSTEM_PROMPT = """
 # Role
 Avery、ロボット（ディズニーのベイマックスのように話すキャラクター）
 
@@ -73,124 +71,7 @@ Avery、ロボット（ディズニーのベイマックスのように話すキ
     hints：画像の中はキッチンですね。キッチンの英語は **kitchen** です。
         """
 
-        if vocabularies:
-            self.system_prompt+="\n\n## おすすめ関連単語\n"
-            for vocabulary in vocabularies:
-                self.system_prompt+=f"- {vocabulary.word} ({vocabulary.pos}): {vocabulary.meaning}\n"
-
-        self.messages=[]
-
-        self.model_name=model_name
-    
-    def nextResponse(self, ask_for_hint: str, new_messages: list, base64_image):
-        if self.first_res_id is None:
-            self.messages.append(
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "input_image",
-                            "image_url": f"data:image/jpeg;base64,{base64_image}"
-                        }
-                    ]
-                }
-            )
-
-        for entry in new_messages:
-            if entry.sender == "assistant":
-                type_msg = "output_text"
-            else:
-                type_msg = "input_text"
-
-            self.messages.append(
-                {
-                    "role": entry.sender, 
-                    "content": [
-                    {"type": type_msg, "text": entry.content}
-                    ]
-                }
-            )
-
-        self.messages.append(
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "input_text",
-                        "text": ask_for_hint
-                    }
-                ]
-            }
-        )
-
-        # if len(self.messages)<2:
-        #     print("No messages")
-        #     return {}
-
-        try:
-            if self.prev_res_id is None:
-                response = self.client.responses.create(
-                    model=self.model_name,
-                    instructions=self.system_prompt,
-                    input=self.messages,
-                    temperature=0.5,
-                )
-            else:
-                response = self.client.responses.create(
-                    model=self.model_name,
-                    instructions=self.system_prompt,
-                    input=self.messages,
-                    temperature=0.5,
-                    previous_response_id=self.prev_res_id
-                )
-
-            self.prev_res_id = response.id
-            self.prev_res_ids.append(response.id)
-
-            if self.first_res_id is None:
-                self.first_res_id = response.id
-
-            hint = response.output[0].content[0].text
-            
-            return hint
-        
-        except Exception as e:
-            if 'Previous response with id' in str(e):
-                messages = [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "input_image",
-                                "image_url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        ]
-                    }
-                ]
-                messages.extend(self.messages)
-
-                response = self.client.responses.create(
-                    model=self.model_name,
-                    instructions=self.system_prompt,
-                    input=messages,
-                    temperature=0.5,
-                )
-
-                self.prev_res_id = response.id
-                self.prev_res_ids.append(response.id)
-
-                if self.first_res_id is None:
-                    self.first_res_id = response.id
-
-                hint = response.output[0].content[0].text
-                
-                return hint
-            print(f"Error: {e}")
-            print(f"Messages: {self.messages}")
-            return {}
-            
-    def get_result(self, sentence, correct_sentence,base64_image,grammar_errors,spelling_errors, descriptions):
-        prompt = """
+EVALUATION_PROMPT = """
 # 役割
 あなたの名前は Avery、ロボットです。
 
@@ -260,129 +141,7 @@ Every soldiers are exhausted and they are sleeping on the floor.
 文法の誤りを修正して、画像に合った内容に変更してください。😇
         """
 
-        self.messages=[]
-
-        user_prompt = """# 現状
-1. ユーザーの英作文（評価対象）：{user_sentence}
-2. システムが修正された英作文: {correct_sentence}
-3. 検出された文法の誤り: {grammar_errors}
-4. 検出されたスペルミス: {spelling_errors}
-5. 参考記述: {descriptions}""".format(
-    user_sentence=sentence,
-    correct_sentence=correct_sentence,
-    grammar_errors=grammar_errors,
-    spelling_errors=spelling_errors, 
-    descriptions=descriptions
-)
-
-        self.messages.append(
-            {
-                "role": "user", 
-                "content": [
-                    {
-                    "type": "input_image",
-                    "image_url": f"data:image/jpeg;base64,{base64_image}"
-                    },
-                    {"type": "input_text", "text": user_prompt}
-                ]
-            }
-        )
-        
-        try: 
-            response = self.client.responses.create(
-                model=self.model_name,
-                instructions=prompt,
-                input=self.messages,
-                temperature=0.8,
-                previous_response_id=self.prev_res_id,
-                text={
-                    "format": {
-                        "type": "json_schema",
-                        "name": "Final_Evaluation",
-                        "schema": {
-                            "type": "object",
-                            "properties": {
-                                "grammar_evaluation": {
-                                    "type": "string"
-                                },
-                                "spelling_evaluation": {
-                                    "type": "string"
-                                },
-                                "style_evaluation": {
-                                    "type": "string"
-                                },
-                                "content_evaluation": {
-                                    "type": "string"
-                                },
-                                "overall_evaluation": {
-                                    "type": "string"
-                                }
-                            },
-                            "required": ["grammar_evaluation", "spelling_evaluation", "style_evaluation", "content_evaluation", "overall_evaluation"],
-                            "additionalProperties": False
-                        },
-                        "strict": True
-                    }
-                }
-            )
-
-            self.prev_res_id = response.id
-            if self.first_res_id is None:
-                self.first_res_id = response.id
-
-            evaluation = json.loads(response.output_text)
-
-            return evaluation
-        except Exception as e:
-            if 'Previous response with id' in str(e):
-                response = self.client.responses.create(
-                    model=self.model_name,
-                    instructions=prompt,
-                    input=self.messages,
-                    temperature=0.8,
-                    text={
-                        "format": {
-                            "type": "json_schema",
-                            "name": "Final_Evaluation",
-                            "schema": {
-                                "type": "object",
-                                "properties": {
-                                    "grammar_evaluation": {
-                                        "type": "string"
-                                    },
-                                    "spelling_evaluation": {
-                                        "type": "string"
-                                    },
-                                    "style_evaluation": {
-                                        "type": "string"
-                                    },
-                                    "content_evaluation": {
-                                        "type": "string"
-                                    },
-                                    "overall_evaluation": {
-                                        "type": "string"
-                                    }
-                                },
-                                "required": ["grammar_evaluation", "spelling_evaluation", "style_evaluation", "content_evaluation", "overall_evaluation"],
-                                "additionalProperties": False
-                            },
-                            "strict": True
-                        }
-                    }
-                )
-
-                self.prev_res_id = response.id
-                if self.first_res_id is None:
-                    self.first_res_id = response.id
-                evaluation = json.loads(response.output_text)
-
-                return evaluation
-            print(f"Error: {e}")
-            print(f"Messages: {self.messages}")
-            return {}
-            
-    def get_short_result(self, sentence, correct_sentence,base64_image,grammar_errors,spelling_errors, descriptions):
-        prompt = """
+SHORT_EVALUATION_PROMPT = """
 # 役割
 あなたの名前は Avery、ロボットです。
 **役割：** あなたはAveryです。日本人EFL学習者の英語ライティング力向上を支援する、優しく知的な英語作文チューターです。
@@ -405,105 +164,14 @@ Every soldiers are exhausted and they are sleeping on the floor.
 
         """
 
-        self.messages=[]
-
-        user_prompt = """# 現状
+EVALUATION_USER_PROMPT = """# 現状
 1. ユーザーの英作文（評価対象）：{user_sentence}
 2. システムが修正された英作文: {correct_sentence}
 3. 検出された文法の誤り: {grammar_errors}
 4. 検出されたスペルミス: {spelling_errors}
-5. 参考記述: {descriptions}""".format(
-    user_sentence=sentence,
-    correct_sentence=correct_sentence,
-    grammar_errors=grammar_errors,
-    spelling_errors=spelling_errors, 
-    descriptions=descriptions
-)
+5. 参考記述: {descriptions}"""
 
-        self.messages.append(
-            {
-                "role": "user", 
-                "content": [
-                    {
-                    "type": "input_image",
-                    "image_url": f"data:image/jpeg;base64,{base64_image}"
-                    },
-                    {"type": "input_text", "text": user_prompt}
-                ]
-            }
-        )
-        
-        try: 
-            response = self.client.responses.create(
-                model=self.model_name,
-                instructions=prompt,
-                input=self.messages,
-                temperature=0.8,
-                previous_response_id=self.prev_res_id,
-                text={
-                    "format": {
-                        "type": "json_schema",
-                        "name": "Feedback",
-                        "schema": {
-                            "type": "object",
-                            "properties": {
-                                "feedback": {
-                                    "type": "string"
-                                },
-                            },
-                            "required": ["feedback"],
-                            "additionalProperties": False
-                        },
-                        "strict": True
-                    }
-                }
-            )
-
-            self.prev_res_id = response.id
-            if self.first_res_id is None:
-                self.first_res_id = response.id
-
-            evaluation = json.loads(response.output_text)
-
-            return evaluation
-        except Exception as e:
-            if 'Previous response with id' in str(e):
-                response = self.client.responses.create(
-                    model=self.model_name,
-                    instructions=prompt,
-                    input=self.messages,
-                    temperature=0.8,
-                    text={
-                        "format": {
-                            "type": "json_schema",
-                            "name": "Feedback",
-                            "schema": {
-                                "type": "object",
-                                "properties": {
-                                    "feedback": {
-                                        "type": "string"
-                                    },
-                                },
-                                "required": ["feedback"],
-                                "additionalProperties": False
-                            },
-                            "strict": True
-                        }
-                    }
-                )
-
-                self.prev_res_id = response.id
-                if self.first_res_id is None:
-                    self.first_res_id = response.id
-                evaluation = json.loads(response.output_text)
-
-                return evaluation
-            print(f"Error: {e}")
-            print(f"Messages: {self.messages}")
-            return {}
-        
-    def scoring(self, sentence, base64_image=None):
-        instructions = """### ✅ Role
+SCORING_INSTRUCTIONS = """### ✅ Role
 
 You are an evaluator. Your task is to assess a user-submitted passage based on six specific writing criteria: grammar, spelling, conventions, content comprehension, content vividness, and sentence structure. Use the detailed rubrics provided below to assign a score for each category.
 
@@ -599,118 +267,490 @@ Evaluate sentence complexity and cohesion.
 {"grammar": 2, "spelling": 0, "convention": 1, "content_comprehension": 2, "content_vividness": 0, "sentence_structure": 0}
 ```"""
 
-        passage_json_schema = {
-            "format": {
-                "type": "json_schema",
-                "name": "Passage",
-                "schema": {
-                    "type": "object",
-                    "properties": {
-                        "grammar": {"type": "integer"},
-                        "spelling": {"type": "integer"},
-                        "convention": {"type": "integer"},
-                        "content_comprehension": {"type": "integer"},
-                        "content_vividness": {"type": "integer"},
-                        "sentence_structure": {"type": "integer"},
-                    },
-                    "required": [
-                        "grammar",
-                        "spelling",
-                        "convention",
-                        "content_comprehension",
-                        "content_vividness",
-                        "sentence_structure"
-                    ],
-                    "additionalProperties": False
-                    },
-                    "strict": True,
+IMAGE_SIMILARITY_INSTRUCTIONS = "Compare two input images and calculate a similarity score between 0 and 1, where 1 means identical and 0 means completely different. Base the similarity on visual features such as shapes, colors, and structure. Return only the similarity score as a float."
+
+EVALUATION_SCHEMA = {
+    "format": {
+        "type": "json_schema",
+        "name": "Final_Evaluation",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "grammar_evaluation": {
+                    "type": "string"
+                },
+                "spelling_evaluation": {
+                    "type": "string"
+                },
+                "style_evaluation": {
+                    "type": "string"
+                },
+                "content_evaluation": {
+                    "type": "string"
+                },
+                "overall_evaluation": {
+                    "type": "string"
                 }
+            },
+            "required": ["grammar_evaluation", "spelling_evaluation", "style_evaluation", "content_evaluation", "overall_evaluation"],
+            "additionalProperties": False
+        },
+        "strict": True
+    }
+}
+
+FEEDBACK_SCHEMA = {
+    "format": {
+        "type": "json_schema",
+        "name": "Feedback",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "feedback": {
+                    "type": "string"
+                },
+            },
+            "required": ["feedback"],
+            "additionalProperties": False
+        },
+        "strict": True
+    }
+}
+
+PASSAGE_SCHEMA = {
+    "format": {
+        "type": "json_schema",
+        "name": "Passage",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "grammar": {"type": "integer"},
+                "spelling": {"type": "integer"},
+                "convention": {"type": "integer"},
+                "content_comprehension": {"type": "integer"},
+                "content_vividness": {"type": "integer"},
+                "sentence_structure": {"type": "integer"},
+            },
+            "required": [
+                "grammar",
+                "spelling",
+                "convention",
+                "content_comprehension",
+                "content_vividness",
+                "sentence_structure"
+            ],
+            "additionalProperties": False
+            },
+            "strict": True,
+        }
+}
+
+# Images are passed around as OriginalImage/InterpretedImage rows and sent by file id
+# (provider_files); a base64 string is still accepted and sent inline.
+
+def _image_input(image):
+    if image is None or isinstance(image, str):
+        return {
+            "type": "input_image",
+            "image_url": f"data:image/jpeg;base64,{image}"
         }
+    return provider_files.image_input(image)
+
+async def _aimage_input(image):
+    if image is None or isinstance(image, str):
+        return _image_input(image)
+    return await provider_files.aimage_input(image)
+
+def _missing_previous_response(e: Exception) -> bool:
+    return 'Previous response with id' in str(e)
+
+# Hint instructions per leaderboard. The vocabulary edits in crud invalidate the entry in
+# every API process through shared_cache.
+HINT_PROMPT_CACHE_TTL = int(os.getenv("HINT_PROMPT_CACHE_TTL", "600"))
+HINT_PROMPT_CACHE_MAXSIZE = int(os.getenv("HINT_PROMPT_CACHE_MAXSIZE", "512"))
+
+hint_prompt_cache = TTLCache(maxsize=HINT_PROMPT_CACHE_MAXSIZE, ttl=HINT_PROMPT_CACHE_TTL)
+hint_prompt_lock = RLock()
+
+def build_hint_prompt(vocabularies=None) -> str:
+    # the fixed prompt comes first and the words are sorted, so every round of a leaderboard
+    # sends byte-identical instructions and the provider's prompt cache can serve the prefix
+    prompt = HINT_SYSTEM_PROMPT
+    if vocabularies:
+        prompt += "\n\n## おすすめ関連単語\n"
+        for vocabulary in sorted(vocabularies, key=lambda v: (v.word, v.pos or "")):
+            prompt += f"- {vocabulary.word} ({vocabulary.pos}): {vocabulary.meaning}\n"
+    return prompt
+
+def hint_system_prompt(db_leaderboard) -> str:
+    """Cached `build_hint_prompt`; `db_leaderboard.vocabularies` is only loaded on a miss."""
+    with hint_prompt_lock:
+        prompt = hint_prompt_cache.get(db_leaderboard.id)
+    if prompt is None:
+        prompt = build_hint_prompt(db_leaderboard.vocabularies)
+        with hint_prompt_lock:
+            hint_prompt_cache[db_leaderboard.id] = prompt
+    return prompt
+
+def _drop_hint_prompts(keys, tags) -> None:
+    with hint_prompt_lock:
+        for leaderboard_id in keys:
+            hint_prompt_cache.pop(leaderboard_id, None)
+
+shared_cache.register("hint_prompt", _drop_hint_prompts)
+
+def invalidate_hint_prompt(leaderboard_id: int) -> None:
+    shared_cache.invalidate("hint_prompt", keys=[leaderboard_id])
+
+def prompt_cache_key(leaderboard_id: Optional[int]) -> Optional[str]:
+    # requests of one leaderboard share a prefix; the key routes them to the same cache
+    return f"avery-leaderboard-{leaderboard_id}" if leaderboard_id is not None else None
+
+class Hint_Chatbot:
+    def __init__(
+        self,
+        model_name="gpt-4o",
+        vocabularies=None,
+        system_prompt: Optional[str]=None,
+        leaderboard_id: Optional[int]=None,
+        first_res_id=None,
+        prev_res_id=None,
+        prev_res_ids=None,
+        client: Optional[OpenAI]=None,
+        async_client: Optional[AsyncOpenAI]=None,
+        priority: Optional[str]=None,
+    ):
+        self.client=client or get_openai()
+        self._async_client=async_client
+        # None follows llm_scheduler.priority_scope (interactive unless a task says otherwise)
+        self.priority=priority
+        self.first_res_id=first_res_id
+        # copied: a shared default list made one round's akill() delete another round's responses
+        self.prev_res_ids = list(prev_res_ids or [])
+        self.prev_res_id=prev_res_id
+
+        # pass hint_system_prompt(db_leaderboard) to skip building it from the vocabularies
+        self.system_prompt = system_prompt if system_prompt is not None else build_hint_prompt(vocabularies)
+        self.prompt_cache_key = prompt_cache_key(leaderboard_id)
+
+        self.messages=[]
+
+        self.model_name=model_name
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        # resolved lazily so sync-only callers (Celery tasks) never build the async pool
+        if self._async_client is None:
+            self._async_client = get_async_openai()
+        return self._async_client
+
+    def _create(self, **request):
+        if self.prompt_cache_key is not None:
+            request.setdefault("prompt_cache_key", self.prompt_cache_key)
+        return llm_scheduler.call(
+            self.model_name,
+            self.client.responses.create,
+            priority=self.priority,
+            est_tokens=llm_scheduler.estimate_tokens(request["input"]),
+            **request
+        )
+
+    async def _acreate(self, **request):
+        if self.prompt_cache_key is not None:
+            request.setdefault("prompt_cache_key", self.prompt_cache_key)
+        return await llm_scheduler.acall(
+            self.model_name,
+            self.async_client.responses.create,
+            priority=self.priority,
+            est_tokens=llm_scheduler.estimate_tokens(request["input"]),
+            **request
+        )
+
+    # hints
+
+    def _hint_request(self, ask_for_hint: str, new_messages: list, image_input: Optional[dict]):
+        # image_input is only needed (and only resolved by the callers) for the first request
         if self.first_res_id is None:
-            user_inputs=[
+            self.messages.append(
                 {
                     "role": "user",
-                    "content": [
-                        { "type": "input_text", "text": sentence},
-                        {
-                            "type": "input_image",
-                            "image_url": f"data:image/jpeg;base64,{base64_image}"
-                        }
-                    ]
+                    "content": [image_input]
                 }
-            ]
-        else:
-            user_inputs=[
+            )
+
+        for entry in new_messages:
+            if entry.sender == "assistant":
+                type_msg = "output_text"
+            else:
+                type_msg = "input_text"
+
+            self.messages.append(
                 {
-                    "role": "user",
+                    "role": entry.sender, 
                     "content": [
-                        { "type": "input_text", "text": sentence},
+                    {"type": type_msg, "text": entry.content}
                     ]
                 }
-            ]
-        
-        try:
-            response = self.client.responses.create(
-                model=self.model_name,
-                instructions=instructions,
-                input=user_inputs,
-                temperature=0.1,
-                text=passage_json_schema,
-                previous_response_id=self.first_res_id
             )
 
+        self.messages.append(
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "input_text",
+                        "text": ask_for_hint
+                    }
+                ]
+            }
+        )
+
+        request = dict(
+            model=self.model_name,
+            instructions=self.system_prompt,
+            input=self.messages,
+            temperature=0.5,
+        )
+        if self.prev_res_id is not None:
+            request["previous_response_id"] = self.prev_res_id
+        return request
+
+    def _hint_retry_request(self, image_input: dict):
+        # the stored conversation expired on the OpenAI side, so send the image again with the
+        # history; by file id that is a reference, not the image itself
+        messages = [
+            {
+                "role": "user",
+                "content": [image_input]
+            }
+        ]
+        messages.extend(self.messages)
+        return dict(
+            model=self.model_name,
+            instructions=self.system_prompt,
+            input=messages,
+            temperature=0.5,
+        )
+
+    def _record_hint(self, response):
+        self.prev_res_id = response.id
+        self.prev_res_ids.append(response.id)
+
+        if self.first_res_id is None:
+            self.first_res_id = response.id
+
+        return response.output[0].content[0].text
+
+    def nextResponse(self, ask_for_hint: str, new_messages: list, image):
+        image_input = _image_input(image) if self.first_res_id is None else None
+        request = self._hint_request(ask_for_hint, new_messages, image_input)
+        try:
+            return self._record_hint(self._create(**request))
+        except Exception as e:
+            if _missing_previous_response(e):
+                return self._record_hint(
+                    self._create(**self._hint_retry_request(image_input or _image_input(image)))
+                )
+            print(f"Error: {e}")
+            print(f"Messages: {self.messages}")
+            return {}
+
+    async def anextResponse(self, ask_for_hint: str, new_messages: list, image):
+        image_input = await _aimage_input(image) if self.first_res_id is None else None
+        request = self._hint_request(ask_for_hint, new_messages, image_input)
+        try:
+            return self._record_hint(await self._acreate(**request))
+        except Exception as e:
+            if _missing_previous_response(e):
+                return self._record_hint(
+                    await self._acreate(**self._hint_retry_request(image_input or await _aimage_input(image)))
+                )
+            print(f"Error: {e}")
+            print(f"Messages: {self.messages}")
+            return {}
+
+    # evaluation
+
+    def _evaluation_request(self, instructions, schema, sentence, correct_sentence, image_input, grammar_errors, spelling_errors, descriptions):
+        user_prompt = EVALUATION_USER_PROMPT.format(
+            user_sentence=sentence,
+            correct_sentence=correct_sentence,
+            grammar_errors=grammar_errors,
+            spelling_errors=spelling_errors, 
+            descriptions=descriptions
+        )
+
+        self.messages=[
+            {
+                "role": "user", 
+                "content": [
+                    image_input,
+                    {"type": "input_text", "text": user_prompt}
+                ]
+            }
+        ]
+
+        return dict(
+            model=self.model_name,
+            instructions=instructions,
+            input=self.messages,
+            temperature=0.8,
+            text=schema,
+        )
+
+    def _record_evaluation(self, response):
+        self.prev_res_id = response.id
+        if self.first_res_id is None:
+            self.first_res_id = response.id
+        return json.loads(response.output_text)
+
+    def _evaluate(self, request):
+        try:
+            response = self._create(**request, previous_response_id=self.prev_res_id)
+            return self._record_evaluation(response)
+        except Exception as e:
+            if _missing_previous_response(e):
+                return self._record_evaluation(self._create(**request))
+            print(f"Error: {e}")
+            print(f"Messages: {self.messages}")
+            return {}
+
+    async def _aevaluate(self, request):
+        try:
+            response = await self._acreate(**request, previous_response_id=self.prev_res_id)
+            return self._record_evaluation(response)
+        except Exception as e:
+            if _missing_previous_response(e):
+                return self._record_evaluation(await self._acreate(**request))
+            print(f"Error: {e}")
+            print(f"Messages: {self.messages}")
+            return {}
+
+    def get_result(self, sentence, correct_sentence,image,grammar_errors,spelling_errors, descriptions):
+        return self._evaluate(self._evaluation_request(
+            EVALUATION_PROMPT, EVALUATION_SCHEMA,
+            sentence, correct_sentence, _image_input(image), grammar_errors, spelling_errors, descriptions
+        ))
+
+    async def aget_result(self, sentence, correct_sentence,image,grammar_errors,spelling_errors, descriptions):
+        return await self._aevaluate(self._evaluation_request(
+            EVALUATION_PROMPT, EVALUATION_SCHEMA,
+            sentence, correct_sentence, await _aimage_input(image), grammar_errors, spelling_errors, descriptions
+        ))
+
+    def get_short_result(self, sentence, correct_sentence,image,grammar_errors,spelling_errors, descriptions):
+        return self._evaluate(self._evaluation_request(
+            SHORT_EVALUATION_PROMPT, FEEDBACK_SCHEMA,
+            sentence, correct_sentence, _image_input(image), grammar_errors, spelling_errors, descriptions
+        ))
+
+    async def aget_short_result(self, sentence, correct_sentence,image,grammar_errors,spelling_errors, descriptions):
+        return await self._aevaluate(self._evaluation_request(
+            SHORT_EVALUATION_PROMPT, FEEDBACK_SCHEMA,
+            sentence, correct_sentence, await _aimage_input(image), grammar_errors, spelling_errors, descriptions
+        ))
+
+    # scoring
+
+    def _scoring_request(self, sentence, image_input=None):
+        if self.first_res_id is None:
+            # the leaderboard's image before the sentence keeps the shared part in the prefix
+            content = [
+                image_input,
+                { "type": "input_text", "text": sentence},
+            ]
+        else:
+            content = [
+                { "type": "input_text", "text": sentence},
+            ]
+        return dict(
+            model=self.model_name,
+            instructions=SCORING_INSTRUCTIONS,
+            input=[{"role": "user", "content": content}],
+            temperature=0.1,
+            text=PASSAGE_SCHEMA,
+            previous_response_id=self.first_res_id
+        )
+
+    def scoring(self, sentence, image=None):
+        try:
+            image_input = _image_input(image) if self.first_res_id is None else None
+            response = self._create(**self._scoring_request(sentence, image_input))
             return json.loads(response.output_text)
         except Exception as e:
             print(f"Error: {e}")
             print(f"Messages: {self.messages}")
-            print(f"Response: {response}")
             return {}
-    
-    def image_similarity(self, image1_base64, image2_base64):
+
+    async def ascoring(self, sentence, image=None):
         try:
-            user_inputs=[
+            image_input = await _aimage_input(image) if self.first_res_id is None else None
+            response = await self._acreate(**self._scoring_request(sentence, image_input))
+            return json.loads(response.output_text)
+        except Exception as e:
+            print(f"Error: {e}")
+            print(f"Messages: {self.messages}")
+            return {}
+
+    def _image_similarity_request(self, image1_input, image2_input):
+        return dict(
+            model=self.model_name,
+            instructions=IMAGE_SIMILARITY_INSTRUCTIONS,
+            input=[
                 {
                     "role": "user",
                     "content": [
-                        {
-                            "type": "input_image",
-                            "image_url": f"data:image/jpeg;base64,{image1_base64}"
-                        },
-                        {
-                            "type": "input_image",
-                            "image_url": f"data:image/jpeg;base64,{image2_base64}"
-                        }
+                        image1_input,
+                        image2_input,
                     ]
                 }
-            ]
-            response = self.client.responses.create(
-                model=self.model_name,
-                instructions="Compare two input images and calculate a similarity score between 0 and 1, where 1 means identical and 0 means completely different. Base the similarity on visual features such as shapes, colors, and structure. Return only the similarity score as a float.",
-                input=user_inputs,
-                temperature=0,
-            )
-                
-            similarity_score = float(response.output_text)
+            ],
+            temperature=0,
+        )
 
-            return similarity_score
-        
+    def image_similarity(self, image1, image2):
+        try:
+            response = self._create(**self._image_similarity_request(
+                _image_input(image1), _image_input(image2)
+            ))
+            return float(response.output_text)
         except Exception as e:
             print(f"Error: {e}")
             return None
-        
-    def kill(self):
-        while self.prev_res_ids:
-            prev_res_id = self.prev_res_ids.pop()
-            
-            self.client.responses.delete(prev_res_id)
-            
+
+    async def aimage_similarity(self, image1, image2):
+        try:
+            response = await self._acreate(**self._image_similarity_request(
+                await _aimage_input(image1), await _aimage_input(image2)
+            ))
+            return float(response.output_text)
+        except Exception as e:
+            print(f"Error: {e}")
+            return None
+
+    def _reset(self):
+        # the clients are shared by the whole process, so only drop our references
         self.client=None
+        self._async_client=None
 
         self.first_res_id=None
         self.prev_res_id=None
         self.messages=[]
         gc.collect()
         return True
-        
+
+    def kill(self):
+        while self.prev_res_ids:
+            prev_res_id = self.prev_res_ids.pop()
             
-        
\ No newline at end of file
+            self.client.responses.delete(prev_res_id)
+
+        return self._reset()
+
+    async def akill(self):
+        while self.prev_res_ids:
+            prev_res_id = self.prev_res_ids.pop()
+
+            await self.async_client.responses.delete(prev_res_id)
+
+        return self._reset()
@@ -0,0 +1,103 @@
+"""Images uploaded once to the OpenAI Files API and referenced by file id.
+
+A request that names `file_id` is a few hundred bytes instead of a multi-megabyte data URL.
+The id is cached in Redis under the image's content hash (`storage_key`), so every
+worker and every Celery process shares one upload per image. Uploaded files expire on
+the OpenAI side after OPENAI_FILE_TTL; the Redis entry expires an hour earlier so a
+cached id never points at a deleted file. Uploads go through llm_scheduler like any other
+OpenAI request, at the priority of the call that needs the image, so a class submitting at
+once is rate-limited and retried instead of falling back on the first 429. When the upload
+still fails, the caller falls back to the inline data URL.
+"""
+import asyncio, base64, logging, os
+from typing import Optional
+
+from . import blob_store, llm_scheduler
+from .llm_clients import get_openai
+from .redis_client import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+OPENAI_FILE_UPLOADS = os.getenv("OPENAI_FILE_UPLOADS", "true").lower() in ("1", "true", "yes")
+# the Files API accepts 1 hour to 30 days
+OPENAI_FILE_TTL = int(os.getenv("OPENAI_FILE_TTL", str(30 * 24 * 3600)))
+
+
+def _cache_key(content_key: str) -> str:
+    return f"openai:file:{content_key}"
+
+
+def _content_key(db_image) -> Optional[str]:
+    if db_image.storage_key:
+        return db_image.storage_key
+    data = blob_store.load_image_bytes(db_image)
+    return blob_store.content_key(data) if data else None
+
+
+def _upload(db_image, content_key: str) -> str:
+    data = blob_store.load_image_bytes(db_image)
+    mime_type = db_image.mime_type or blob_store.sniff_mime_type(data)
+    extension = mime_type.rsplit("/", 1)[-1]
+    # the priority comes from the caller's priority_scope; asyncio.to_thread in afile_id copies it
+    uploaded = llm_scheduler.call(
+        "files",
+        get_openai().files.create,
+        file=(f"{content_key}.{extension}", data, mime_type),
+        purpose="vision",
+        expires_after={"anchor": "created_at", "seconds": OPENAI_FILE_TTL},
+    )
+    get_redis().set(_cache_key(content_key), uploaded.id, ex=max(OPENAI_FILE_TTL - 3600, 60))
+    return uploaded.id
+
+
+def file_id(db_image) -> Optional[str]:
+    """File id for an OriginalImage/InterpretedImage row, uploading it on first use."""
+    if db_image is None or not OPENAI_FILE_UPLOADS:
+        return None
+    try:
+        content_key = _content_key(db_image)
+        if content_key is None:
+            return None
+        cached = get_redis().get(_cache_key(content_key))
+        return cached or _upload(db_image, content_key)
+    except Exception as e:
+        logger.warning(f"Sending image {db_image.id} inline, upload failed: {e}")
+        return None
+
+
+async def afile_id(db_image) -> Optional[str]:
+    if db_image is None or not OPENAI_FILE_UPLOADS:
+        return None
+    if db_image.storage_key:
+        try:
+            cached = await get_async_redis().get(_cache_key(db_image.storage_key))
+        except Exception as e:
+            logger.warning(f"Redis lookup of image {db_image.id} failed: {e}")
+            cached = None
+        if cached:
+            return cached
+    return await asyncio.to_thread(file_id, db_image)
+
+
+def _data_url(db_image) -> dict:
+    data = blob_store.load_image_bytes(db_image)
+    mime_type = db_image.mime_type or blob_store.sniff_mime_type(data)
+    return {
+        "type": "input_image",
+        "image_url": f"data:{mime_type};base64,{base64.b64encode(data).decode('utf-8')}",
+    }
+
+
+def _file_input(file_id: str) -> dict:
+    return {"type": "input_image", "file_id": file_id, "detail": "auto"}
+
+
+def image_input(db_image) -> dict:
+    """Responses API `input_image` part for an image row."""
+    uploaded = file_id(db_image)
+    return _file_input(uploaded) if uploaded else _data_url(db_image)
+
+
+async def aimage_input(db_image) -> dict:
+    uploaded = await afile_id(db_image)
+    return _file_input(uploaded) if uploaded else await asyncio.to_thread(_data_url, db_image)
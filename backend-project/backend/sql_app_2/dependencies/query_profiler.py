@@ -0,0 +1,111 @@
+"""Per-request SQL statistics.
+
+`instrument` hooks the engines' cursor events. `profile_queries` is an HTTP middleware
+that collects the statements run while a request is handled. It reports them in three
+places:
+
+- a `Server-Timing: db;dur=...;desc="N queries"` header
+- Prometheus histograms per route template, served by GET /metrics
+- a warning log with the slowest statements when the request goes over
+  SLOW_REQUEST_QUERIES or SLOW_REQUEST_DB_MS
+
+Under gunicorn, set PROMETHEUS_MULTIPROC_DIR so /metrics adds up every worker.
+"""
+import contextvars, heapq, logging, os, time
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from fastapi import Request
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Histogram, generate_latest, multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_QUERIES = int(os.getenv("SLOW_REQUEST_QUERIES", "50"))
+SLOW_REQUEST_DB_MS = float(os.getenv("SLOW_REQUEST_DB_MS", "200"))
+QUERY_PROFILE_TOP = int(os.getenv("QUERY_PROFILE_TOP", "3"))
+
+QUERY_SECONDS = Histogram(
+    "avery_db_query_seconds", "Duration of single SQL statements",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+REQUEST_QUERIES = Histogram(
+    "avery_request_db_queries", "SQL statements per HTTP request", ["method", "route"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+REQUEST_DB_SECONDS = Histogram(
+    "avery_request_db_seconds", "Time spent in SQL per HTTP request", ["method", "route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+
+@dataclass
+class RequestQueries:
+    count: int = 0
+    seconds: float = 0.0
+    # min-heap of (seconds, statement), at most QUERY_PROFILE_TOP long
+    slowest: List[Tuple[float, str]] = field(default_factory=list)
+
+    def add(self, seconds: float, statement: str) -> None:
+        self.count += 1
+        self.seconds += seconds
+        if len(self.slowest) < QUERY_PROFILE_TOP:
+            heapq.heappush(self.slowest, (seconds, statement))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, statement))
+
+    def top(self) -> List[Tuple[float, str]]:
+        return sorted(self.slowest, reverse=True)
+
+
+# a mutable holder, so statements run in threadpool copies of the context still count
+_current: contextvars.ContextVar[Optional[RequestQueries]] = contextvars.ContextVar("request_queries", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["query_start"].pop()
+    QUERY_SECONDS.observe(seconds)
+    queries = _current.get()
+    if queries is not None:
+        queries.add(seconds, statement)
+
+
+def instrument(*engines: Engine) -> None:
+    for engine in engines:
+        if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+async def profile_queries(request: Request, call_next):
+    queries = RequestQueries()
+    token = _current.set(queries)
+    try:
+        response = await call_next(request)
+    finally:
+        _current.reset(token)
+
+    route = request.scope.get("route")
+    route = getattr(route, "path", "unmatched")
+    REQUEST_QUERIES.labels(request.method, route).observe(queries.count)
+    REQUEST_DB_SECONDS.labels(request.method, route).observe(queries.seconds)
+
+    db_ms = queries.seconds * 1000
+    response.headers.append("Server-Timing", f'db;dur={db_ms:.1f};desc="{queries.count} queries"')
+    if queries.count > SLOW_REQUEST_QUERIES or db_ms > SLOW_REQUEST_DB_MS:
+        slowest = "\n".join(f"  {seconds * 1000:7.1f} ms  {' '.join(statement.split())[:300]}" for seconds, statement in queries.top())
+        logger.warning(f"{request.method} {route}: {queries.count} queries, {db_ms:.1f} ms in the database\n{slowest}")
+    return response
+
+
+def metrics() -> Tuple[bytes, str]:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,37 @@
+import os
+from threading import Lock
+
+import redis
+import redis.asyncio
+
+# defaults to the Celery broker, which every deployment already runs
+REDIS_URL = os.getenv("REDIS_URL", os.getenv("BROKER_URL", "redis://localhost:7876"))
+
+_lock = Lock()
+_clients = {}
+
+
+def get_redis() -> redis.Redis:
+    """Process-wide client; a forked worker builds its own connection pool."""
+    pid = os.getpid()
+    client = _clients.get(pid)
+    if client is None:
+        with _lock:
+            client = _clients.get(pid)
+            if client is None:
+                client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+                _clients[pid] = client
+    return client
+
+
+def get_async_redis() -> redis.asyncio.Redis:
+    """Process-wide asyncio client for the API event loop (pub/sub listeners)."""
+    key = ("async", os.getpid())
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = redis.asyncio.Redis.from_url(REDIS_URL, decode_responses=True)
+                _clients[key] = client
+    return client
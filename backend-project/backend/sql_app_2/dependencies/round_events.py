@@ -0,0 +1,124 @@
+"""Round events published by the Celery worker and pushed into the student's WebSocket.
+
+The worker publishes on `round:{round_id}:events` right after it commits, and the socket
+handler keeps one subscription per connection. Clients open a new socket per action, so each
+event also leaves a short-lived marker key; `wait` checks the markers after subscribing and
+a socket opened after the worker finished (or failed) does not wait for a message already sent.
+"""
+import asyncio, json, logging, os
+from typing import Awaitable, Callable, Iterable, Optional
+
+from .redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+INTERPRETATION_READY = "interpretation_ready"
+SCORE_READY = "score_ready"
+INTERPRETATION_FAILED = "interpretation_failed"
+SCORE_FAILED = "score_failed"
+
+FAILED = {INTERPRETATION_READY: INTERPRETATION_FAILED, SCORE_READY: SCORE_FAILED}
+
+# how long `evaluate` waits for the worker before it gives up on the pending results
+ROUND_EVENT_TIMEOUT = float(os.getenv("ROUND_EVENT_TIMEOUT", "180"))
+ROUND_EVENT_MARKER_TTL = int(os.getenv("ROUND_EVENT_MARKER_TTL", "3600"))
+
+
+def channel(round_id: int) -> str:
+    return f"round:{round_id}:events"
+
+
+def marker(generation_id: int, event: str) -> str:
+    return f"generation:{generation_id}:event:{event}"
+
+
+def publish(round_id: int, generation_id: int, event: str, **payload) -> None:
+    """Called by the worker after commit; a Redis outage must not fail the task."""
+    message = json.dumps({"event": event, "round_id": round_id, "generation_id": generation_id, **payload})
+    try:
+        pipe = get_redis().pipeline()
+        pipe.set(marker(generation_id, event), message, ex=ROUND_EVENT_MARKER_TTL)
+        if event in FAILED:
+            # a retried step that succeeds clears the failure of the earlier attempt
+            pipe.delete(marker(generation_id, FAILED[event]))
+        pipe.publish(channel(round_id), message)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Round event {event} for generation {generation_id} not published: {e}")
+
+
+class RoundEventListener:
+    """Subscription to one round; forwards every event and lets the handler wait for specific ones."""
+
+    def __init__(self, round_id: int, forward: Optional[Callable[[dict], Awaitable[None]]] = None):
+        self.round_id = round_id
+        self.forward = forward
+        self._pubsub = None
+        self._reader = None
+        self._seen = set()
+        self._changed = asyncio.Condition()
+
+    async def start(self) -> "RoundEventListener":
+        # subscribe before returning so nothing committed after this point is missed
+        self._pubsub = get_async_redis().pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(channel(self.round_id))
+        self._reader = asyncio.create_task(self._read())
+        return self
+
+    async def _read(self) -> None:
+        async for message in self._pubsub.listen():
+            try:
+                data = json.loads(message["data"])
+            except (TypeError, ValueError):
+                continue
+            async with self._changed:
+                self._seen.add((data.get("generation_id"), data.get("event")))
+                self._changed.notify_all()
+            if self.forward:
+                try:
+                    await self.forward(data)
+                except Exception as e:
+                    logger.warning(f"Round event {data.get('event')} not forwarded: {e}")
+
+    async def wait(self, generation_id: int, events: Iterable[str], timeout: float = ROUND_EVENT_TIMEOUT) -> set:
+        """Wait until every event arrived for the generation; returns the ones still missing.
+
+        A failure ends the wait early: later steps of the Celery chain depend on the failed one.
+        """
+        pending = set(events)
+        checked = list(pending) + list(FAILED.values())
+        try:
+            stored = await get_async_redis().mget([marker(generation_id, event) for event in checked])
+        except Exception as e:
+            logger.warning(f"Round event markers unavailable for generation {generation_id}: {e}")
+            stored = []
+
+        def settle():
+            for event in list(pending):
+                if (generation_id, event) in self._seen:
+                    pending.discard(event)
+            return not pending or any((generation_id, failed) in self._seen for failed in FAILED.values())
+
+        async with self._changed:
+            self._seen.update((generation_id, event) for event, value in zip(checked, stored) if value)
+
+        try:
+            async with self._changed:
+                await asyncio.wait_for(self._changed.wait_for(settle), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return pending
+
+    async def aclose(self) -> None:
+        if self._reader:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except (asyncio.CancelledError, Exception):
+                pass
+        if self._pubsub:
+            try:
+                await self._pubsub.unsubscribe()
+                await self._pubsub.aclose()
+            except Exception:
+                pass
@@ -0,0 +1,65 @@
+"""Round state shared by every API worker, keyed by round id.
+
+A round used to live in local variables of one `round_websocket` call, so a reconnect only
+resumed correctly on the same process. The state is small and rewritten after each action;
+when Redis is unavailable or the key expired the socket rebuilds it from the database.
+Time spent on a generation is not kept here: sockets add it to `Generation.duration`.
+"""
+import json, logging, os
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from .redis_client import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+ROUND_SESSION_TTL = int(os.getenv("ROUND_SESSION_TTL", str(12 * 60 * 60)))
+
+
+@dataclass
+class RoundSession:
+    round_id: int
+    player_id: int
+    # a session is only trusted while it points at the round's last generation
+    generation_id: Optional[int] = None
+    generated_time: int = 0
+    # Celery chain started for `chain_generation_id`; any worker can look it up by id
+    chain_id: Optional[str] = None
+    chain_generation_id: Optional[int] = None
+    # Hint_Chatbot conversation, so a resume does not rescan the chat
+    prev_res_id: Optional[str] = None
+    prev_res_ids: list = field(default_factory=list)
+
+
+def key(round_id: int) -> str:
+    return f"round:{round_id}:session"
+
+
+async def load(round_id: int) -> Optional[RoundSession]:
+    try:
+        value = await get_async_redis().get(key(round_id))
+    except Exception as e:
+        logger.warning(f"Round session {round_id} not loaded: {e}")
+        return None
+    if not value:
+        return None
+    try:
+        return RoundSession(**json.loads(value))
+    except (TypeError, ValueError) as e:
+        # written by an older release; the database has everything needed to rebuild it
+        logger.warning(f"Round session {round_id} discarded: {e}")
+        return None
+
+
+async def save(session: RoundSession) -> None:
+    try:
+        await get_async_redis().set(key(session.round_id), json.dumps(asdict(session)), ex=ROUND_SESSION_TTL)
+    except Exception as e:
+        logger.warning(f"Round session {session.round_id} not saved: {e}")
+
+
+async def delete(round_id: int) -> None:
+    try:
+        await get_async_redis().delete(key(round_id))
+    except Exception as e:
+        logger.warning(f"Round session {round_id} not deleted: {e}")
@@ -1,6 +1,8 @@
-from openai import OpenAI
 from pydantic import BaseModel
-import json
+import ast, json
+
+from .llm_clients import get_openai, get_async_openai
+from . import llm_scheduler
 
 class Description(BaseModel):
    details: list[str]
@@ -20,12 +22,40 @@ class Passage(BaseModel):
    spelling_mistakes: list[SpellingMistake]
    grammar_mistakes: list[GrammarMistake]
 
-def str_to_list(s: str):
-   return eval(s)
+def mistakes_to_json(mistakes) -> str:
+   """Serialize Spelling/GrammarMistake lists for Generation.grammar_errors/spelling_errors."""
+   return json.dumps([m.model_dump() if isinstance(m, BaseModel) else dict(m) for m in mistakes], ensure_ascii=False)
+
+def _mistake(fields: dict):
+   if "word" in fields:
+      return SpellingMistake(**fields)
+   return GrammarMistake(**fields)
+
+def _parse_legacy_mistakes(s: str) -> list:
+   # older rows hold the repr of the pydantic list, e.g. "[SpellingMistake(word='teh', correction='the')]";
+   # read the literals out of the syntax tree instead of executing it
+   tree = ast.parse(s, mode="eval")
+   if not isinstance(tree.body, ast.List):
+      raise ValueError("Not a list of mistakes")
+   mistakes = []
+   for node in tree.body.elts:
+      if not isinstance(node, ast.Call):
+         raise ValueError("Not a list of mistakes")
+      mistakes.append(_mistake({kw.arg: ast.literal_eval(kw.value) for kw in node.keywords}))
+   return mistakes
+
+def str_to_list(s: str) -> list:
+   """Parse stored grammar/spelling errors: JSON, or the legacy repr format."""
+   if not s:
+      return []
+   try:
+      return [_mistake(fields) for fields in json.loads(s)]
+   except json.JSONDecodeError:
+      return _parse_legacy_mistakes(s)
 
 def generateSentence(base64_image,story: str=None, model_name="gpt-4o"):
   
-  client=OpenAI()
+  client=get_openai()
   system_prompt = """
 # Role
 Image Describer
@@ -97,7 +127,10 @@ Provide a detailed, line-by-line description of the image, incorporating relevan
     }
   }
       
-  response = client.responses.create(
+  response = llm_scheduler.call(
+    model_name,
+    client.responses.create,
+    est_tokens=llm_scheduler.estimate_tokens(messages),
     model=model_name,
     instructions=system_prompt,
     input=messages,
@@ -117,12 +150,7 @@ def genSentences(image,story,amt=3):
         response_id, gen_Sentences=generateSentence(image,story)
     return response_id, gen_Sentences
 
-def checkSentence(passage,temp=1):
-  client=OpenAI()
-  completion = client.beta.chat.completions.parse(
-    model="gpt-4o",
-    messages=[
-      {"role": "system", "content": """
+CHECK_SENTENCE_PROMPT = """
 # Role
 Language and content validator
 
@@ -161,15 +189,42 @@ Output: `{"status": 2, "message": "ブー！不適切な言葉が含まれてい
        
 Input: "I am walk in a dessert"
 Output: `{"status": 0, "message": "I walk in a desert", "spelling_mistakes": [{"word":"dessert","correction":"desert"}], "grammar_mistakes": [{"extracted_text": "I am walk","explanation":"一般動詞の原形・現在形・過去形は単独で述語動詞になるので、be動詞と一緒に使うことはできません。","correction":"I walk"}]}`
-"""},
+"""
+
+def _check_sentence_request(passage, temp):
+  return dict(
+    model="gpt-4o",
+    messages=[
+      {"role": "system", "content": CHECK_SENTENCE_PROMPT},
       {"role": "user", "content": f"{passage}"}
     ],
     temperature=temp,
     response_format=Passage,
-
   )
+
+def _parse_check_result(completion):
   output = completion.choices[0].message.parsed
   if output:
     return output.status, output.corrected_passage, output.spelling_mistakes, output.grammar_mistakes
   else:
-     raise Exception("Sentence correction failed.")
\ No newline at end of file
+     raise Exception("Sentence correction failed.")
+
+def checkSentence(passage,temp=1):
+  request = _check_sentence_request(passage, temp)
+  completion = llm_scheduler.call(
+    request["model"],
+    get_openai().beta.chat.completions.parse,
+    est_tokens=llm_scheduler.estimate_tokens(request["messages"]),
+    **request
+  )
+  return _parse_check_result(completion)
+
+async def acheckSentence(passage,temp=1):
+  request = _check_sentence_request(passage, temp)
+  completion = await llm_scheduler.acall(
+    request["model"],
+    get_async_openai().beta.chat.completions.parse,
+    est_tokens=llm_scheduler.estimate_tokens(request["messages"]),
+    **request
+  )
+  return _parse_check_result(completion)
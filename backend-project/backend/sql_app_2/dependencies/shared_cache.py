@@ -0,0 +1,278 @@
+"""Two-level cache shared by every API worker: an in-process TTLCache in front of Redis.
+
+`SharedCache.get_or_load` reads L1, then Redis (L2), then runs the loader. Misses are
+coalesced twice: callers in one process wait for the same load, and a short Redis lock
+makes the other processes poll L2 instead of querying the database themselves. So a cold
+key under a classroom rush costs one query, not one per request.
+
+Redis keys are `cache:{namespace}:{key}`. Entries carry tags, e.g. the school and course a
+leaderboard list was filtered by. `invalidate` drops keys or tags in Redis and publishes
+them on CACHE_INVALIDATION_CHANNEL. `listen` runs in every API process and drops the same
+entries from L1. Plain per-process caches can join with `register`.
+
+Redis is an optimisation here: when it is down, the cache works as L1 only and the
+invalidation reaches only the process that made the change.
+"""
+import asyncio, json, logging, os, uuid
+from threading import RLock
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional
+
+from cachetools import TTLCache
+from pydantic import TypeAdapter
+
+from .redis_client import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache:invalidate")
+# how long one process may hold a key's load before others give up waiting and load it too
+CACHE_LOAD_LOCK_MS = int(os.getenv("CACHE_LOAD_LOCK_MS", "5000"))
+CACHE_LOAD_POLL_MS = int(os.getenv("CACHE_LOAD_POLL_MS", "50"))
+
+InvalidationHandler = Callable[[list, list], None]
+
+_handlers: Dict[str, InvalidationHandler] = {}
+
+
+def register(namespace: str, handler: InvalidationHandler) -> None:
+    """`handler(keys, tags)` runs for every invalidation of `namespace`, local or published."""
+    _handlers[namespace] = handler
+
+
+def _wire_key(key: Hashable) -> str:
+    return json.dumps(list(key) if isinstance(key, tuple) else key, default=str, ensure_ascii=False)
+
+
+def _local_key(key):
+    # JSON turns tuples into lists; L1 keys are the tuples the callers built
+    return tuple(key) if isinstance(key, list) else key
+
+
+def _apply(namespace: str, keys: list, tags: list) -> None:
+    handler = _handlers.get(namespace)
+    if handler is not None:
+        handler([_local_key(key) for key in keys], tags)
+
+
+def invalidate(namespace: str, keys: Iterable[Hashable] = (), tags: Iterable[str] = ()) -> None:
+    """Drop entries here at once and in every other process through Redis pub/sub."""
+    keys, tags = list(keys), list(tags)
+    if not keys and not tags:
+        return
+    _apply(namespace, keys, tags)
+    cache = SharedCache.instances.get(namespace)
+    try:
+        client = get_redis()
+        pipe = client.pipeline()
+        if cache is not None:
+            redis_keys = [cache._redis_key(key) for key in keys]
+            for tag in tags:
+                redis_keys.extend(client.smembers(cache._tag_key(tag)))
+                redis_keys.append(cache._tag_key(tag))
+            if redis_keys:
+                pipe.delete(*redis_keys)
+        pipe.publish(CACHE_INVALIDATION_CHANNEL, json.dumps({
+            "namespace": namespace,
+            "keys": [json.loads(_wire_key(key)) for key in keys],
+            "tags": tags,
+            "origin": _origin(),
+        }, default=str))
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Invalidation of {namespace} not shared: {e}")
+
+
+_origins: Dict[int, str] = {}
+
+
+def _origin() -> str:
+    # one id per process, so a process skips its own messages; forks get a new one
+    return _origins.setdefault(os.getpid(), uuid.uuid4().hex)
+
+
+async def listen() -> None:
+    while True:
+        pubsub = None
+        try:
+            pubsub = get_async_redis().pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+            async for message in pubsub.listen():
+                try:
+                    data = json.loads(message["data"])
+                except (TypeError, ValueError):
+                    continue
+                if data.get("origin") != _origin():
+                    _apply(data.get("namespace"), data.get("keys") or [], data.get("tags") or [])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # entries may have gone stale while disconnected; the TTLs bound how long
+            logger.warning(f"Cache invalidation listener reconnecting: {e}")
+            await asyncio.sleep(1)
+        finally:
+            if pubsub is not None:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+
+_listener: Optional[asyncio.Task] = None
+
+
+def start_listener() -> None:
+    global _listener
+    if _listener is None or _listener.done():
+        _listener = asyncio.create_task(listen())
+
+
+async def stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.cancel()
+        try:
+            await _listener
+        except (asyncio.CancelledError, Exception):
+            pass
+        _listener = None
+
+
+class SharedCache:
+    instances: Dict[str, "SharedCache"] = {}
+
+    def __init__(self, namespace: str, value_type: Any, ttl: int, maxsize: int, l2_ttl: Optional[int] = None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.l2_ttl = l2_ttl or ttl
+        self.adapter = TypeAdapter(value_type)
+        # L1 values are (value, tags)
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.lock = RLock()
+        self._loading: Dict[Hashable, asyncio.Future] = {}
+        SharedCache.instances[namespace] = self
+        register(namespace, self._drop_local)
+
+    def _redis_key(self, key: Hashable) -> str:
+        return f"cache:{self.namespace}:{_wire_key(key)}"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"cache:{self.namespace}:tag:{tag}"
+
+    def _drop_local(self, keys: list, tags: list) -> None:
+        tags = set(tags)
+        with self.lock:
+            for key in keys:
+                self.local.pop(key, None)
+            if tags:
+                for key, (_, entry_tags) in list(self.local.items()):
+                    if entry_tags & tags:
+                        self.local.pop(key, None)
+
+    def get_local(self, key: Hashable):
+        with self.lock:
+            entry = self.local.get(key)
+        return entry[0] if entry is not None else None
+
+    def _set_local(self, key: Hashable, value, tags: Iterable[str]) -> None:
+        with self.lock:
+            self.local[key] = (value, frozenset(tags))
+
+    async def _get_remote(self, key: Hashable):
+        try:
+            raw = await get_async_redis().get(self._redis_key(key))
+        except Exception as e:
+            logger.warning(f"Cache {self.namespace} read from Redis failed: {e}")
+            return None
+        return self.adapter.validate_json(raw) if raw is not None else None
+
+    async def set(self, key: Hashable, value, tags: Iterable[str] = ()) -> None:
+        tags = list(tags)
+        self._set_local(key, value, tags)
+        redis_key = self._redis_key(key)
+        try:
+            pipe = get_async_redis().pipeline()
+            pipe.set(redis_key, self.adapter.dump_json(value), ex=self.l2_ttl)
+            for tag in tags:
+                pipe.sadd(self._tag_key(tag), redis_key)
+                pipe.expire(self._tag_key(tag), self.l2_ttl)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Cache {self.namespace} write to Redis failed: {e}")
+
+    async def _acquire_load(self, key: Hashable) -> bool:
+        try:
+            return bool(await get_async_redis().set(
+                f"{self._redis_key(key)}:loading", _origin(), nx=True, px=CACHE_LOAD_LOCK_MS
+            ))
+        except Exception:
+            return True
+
+    async def _release_load(self, key: Hashable) -> None:
+        try:
+            await get_async_redis().delete(f"{self._redis_key(key)}:loading")
+        except Exception:
+            pass
+
+    async def _store(self, key: Hashable, value, tags: list):
+        if value is not None:
+            await self.set(key, value, tags)
+        return value
+
+    async def _load(self, key: Hashable, load: Callable[[], Awaitable[Any]], tags: list):
+        value = await self._get_remote(key)
+        if value is not None:
+            self._set_local(key, value, tags)
+            return value
+
+        if not await self._acquire_load(key):
+            # another process is loading this key; wait for its result in Redis
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + CACHE_LOAD_LOCK_MS / 1000
+            while loop.time() < deadline:
+                await asyncio.sleep(CACHE_LOAD_POLL_MS / 1000)
+                value = await self._get_remote(key)
+                if value is not None:
+                    self._set_local(key, value, tags)
+                    return value
+            return await self._store(key, await load(), tags)
+
+        try:
+            return await self._store(key, await load(), tags)
+        finally:
+            await self._release_load(key)
+
+    async def get_or_load(self, key: Hashable, load: Callable[[], Awaitable[Any]], tags: Iterable[str] = ()):
+        """Cached value of `key`, or the result of `load()`; None results are not cached."""
+        value = self.get_local(key)
+        if value is not None:
+            return value
+
+        pending = self._loading.get(key)
+        if pending is not None and pending.get_loop() is asyncio.get_running_loop():
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # the request that was loading went away; load it here instead
+                if not pending.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            value = await self._load(key, load, list(tags))
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # nobody may be waiting; retrieve it so the loop does not log it as unhandled
+            future.exception()
+            raise
+        finally:
+            if self._loading.get(key) is future:
+                del self._loading[key]
+
+    def invalidate(self, keys: Iterable[Hashable] = (), tags: Iterable[str] = ()) -> None:
+        invalidate(self.namespace, keys, tags)
@@ -1,6 +1,70 @@
 import spacy
-import re
-from openai import OpenAI
+import re, os, json, hashlib, unicodedata, logging
+from threading import RLock
+from typing import List, Optional
+from cachetools import LRUCache
+from sqlalchemy.orm import Session
+
+from .llm_clients import get_openai
+from . import llm_scheduler
+from .. import crud
+
+logger = logging.getLogger("wordcloud")
+
+TRANSLATION_MODEL = os.getenv("TRANSLATION_MODEL", "gpt-4.1-nano-2025-04-14")
+TRANSLATION_CACHE_MAXSIZE = int(os.getenv("TRANSLATION_CACHE_MAXSIZE", "20000"))
+TRANSLATION_BATCH_SIZE = int(os.getenv("TRANSLATION_BATCH_SIZE", "40"))
+TRANSLATION_BATCH_MAX_CHARS = int(os.getenv("TRANSLATION_BATCH_MAX_CHARS", "12000"))
+
+TRANSLATION_PROMPTS = {
+    'en': "Translate the following text to English.",
+    'ja': "以下の内容を日本語に翻訳してください。",
+}
+BATCH_TRANSLATION_PROMPTS = {
+    'en': "Translate the \"text\" of every item to English. Return each item with the same id.",
+    'ja': "各項目の\"text\"を日本語に翻訳してください。同じidで返してください。",
+}
+BATCH_TRANSLATION_SCHEMA = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "translations",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "translations": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "integer"},
+                            "text": {"type": "string"},
+                        },
+                        "required": ["id", "text"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["translations"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+SPACY_MODELS = {
+    'en': os.getenv("SPACY_MODEL_EN", "en_core_web_sm"),
+    'ja': os.getenv("SPACY_MODEL_JA", "ja_core_news_sm"),
+}
+SPACY_EXCLUDE = [c for c in os.getenv("SPACY_EXCLUDE", "parser,ner").split(",") if c]
+SPACY_N_PROCESS = int(os.getenv("SPACY_N_PROCESS", "1"))
+SPACY_BATCH_SIZE = int(os.getenv("SPACY_BATCH_SIZE", "256"))
+
+_nlp_registry = {}
+_nlp_registry_lock = RLock()
+
+# (text hash, target lang, model) -> translation; the translation_cache table sits behind it
+translation_cache = LRUCache(maxsize=TRANSLATION_CACHE_MAXSIZE)
+translation_cache_lock = RLock()
 
 def detect_lang(text: str) -> str:
     if re.search(r'[\u3040-\u309F\u30A0-\u30FF]', text):
@@ -10,45 +74,161 @@ def detect_lang(text: str) -> str:
     else:
         return 'Unknown'
     
-def translate_text(text: str, target_lang: str = 'en') -> str:
-    if text is None or text.strip() == "":
-        return ""
-    if detect_lang(text) == target_lang:
-        return text
-    client=OpenAI()
+def normalize_text(text: str) -> str:
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', text)).strip()
+
+def _check_target_lang(target_lang: str):
     if target_lang not in ['en', 'ja']:
         raise ValueError("Target language must be either 'en' or 'ja'")
-    
-    if target_lang == 'en':
-        response = client.chat.completions.create(
-            model="gpt-4.1-nano-2025-04-14",
+
+def _translate_one(text: str, target_lang: str) -> str:
+    # translations only feed the analysis word clouds, so they queue behind students' calls
+    response = llm_scheduler.call(
+        TRANSLATION_MODEL,
+        get_openai().chat.completions.create,
+        priority=llm_scheduler.BATCH,
+        est_tokens=len(text) // 2 + 100,
+        model=TRANSLATION_MODEL,
+        messages=[
+            {"role": "system", "content": TRANSLATION_PROMPTS[target_lang]},
+            {"role": "user", "content": text}
+        ]
+    )
+    return response.choices[0].message.content.strip()
+
+def _translate_batch(texts: List[str], target_lang: str) -> List[str]:
+    """Translate several texts in one request; items the model drops are retried one by one."""
+    if len(texts) == 1:
+        return [_translate_one(texts[0], target_lang)]
+    items = [{"id": i, "text": text} for i, text in enumerate(texts)]
+    translated = {}
+    try:
+        response = llm_scheduler.call(
+            TRANSLATION_MODEL,
+            get_openai().chat.completions.create,
+            priority=llm_scheduler.BATCH,
+            est_tokens=sum(len(text) for text in texts) // 2 + 20 * len(texts) + 100,
+            model=TRANSLATION_MODEL,
+            response_format=BATCH_TRANSLATION_SCHEMA,
             messages=[
-                {"role": "system", "content": f"Translate the following text to English."},
-                {"role": "user", "content": text}
+                {"role": "system", "content": BATCH_TRANSLATION_PROMPTS[target_lang]},
+                {"role": "user", "content": json.dumps(items, ensure_ascii=False)}
             ]
         )
-    elif target_lang == 'ja':
-        response = client.chat.completions.create(
-            model="gpt-4.1-nano-2025-04-14",
-            messages=[
-                {"role": "system", "content": f"以下の内容を日本語に翻訳してください。"},
-                {"role": "user", "content": text}
-            ]
+        for item in json.loads(response.choices[0].message.content)["translations"]:
+            if 0 <= item["id"] < len(texts):
+                translated[item["id"]] = item["text"].strip()
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        logger.warning(f"Batch translation returned malformed output, falling back: {e}")
+    return [
+        translated[i] if i in translated else _translate_one(text, target_lang)
+        for i, text in enumerate(texts)
+    ]
+
+def _chunks(texts: List[str]):
+    chunk, chars = [], 0
+    for text in texts:
+        if chunk and (len(chunk) >= TRANSLATION_BATCH_SIZE or chars + len(text) > TRANSLATION_BATCH_MAX_CHARS):
+            yield chunk
+            chunk, chars = [], 0
+        chunk.append(text)
+        chars += len(text)
+    if chunk:
+        yield chunk
+
+def translate_texts(texts: List[str], target_lang: str = 'en', db: Optional[Session] = None) -> List[str]:
+    """Translate many strings at once.
+
+    Lookups go to the in-process LRU, then the translation_cache table (when `db` is given),
+    and only the remaining distinct texts are sent to the model, in batches.
+    """
+    _check_target_lang(target_lang)
+    results: List[Optional[str]] = [None] * len(texts)
+    pending = {}  # hash -> (normalized text, [indexes])
+    for i, text in enumerate(texts):
+        if text is None or text.strip() == "":
+            results[i] = ""
+            continue
+        if detect_lang(text) == target_lang:
+            results[i] = text
+            continue
+        normalized = normalize_text(text)
+        key = hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+        with translation_cache_lock:
+            cached = translation_cache.get((key, target_lang, TRANSLATION_MODEL))
+        if cached is not None:
+            results[i] = cached
+            continue
+        pending.setdefault(key, (normalized, []))[1].append(i)
+
+    if pending and db is not None:
+        stored = crud.get_translations(
+            db=db,
+            text_hashes=list(pending.keys()),
+            target_lang=target_lang,
+            model=TRANSLATION_MODEL
         )
-    return response.choices[0].message.content.strip()
+        with translation_cache_lock:
+            for key, translated in stored.items():
+                translation_cache[(key, target_lang, TRANSLATION_MODEL)] = translated
+                for i in pending.pop(key)[1]:
+                    results[i] = translated
 
-def cal_frequency(text: str, lang: str = 'en') -> dict:
-    if lang not in ['en', 'ja']:
+    if pending:
+        keys = list(pending.keys())
+        translated_texts = []
+        for chunk in _chunks([pending[key][0] for key in keys]):
+            translated_texts.extend(_translate_batch(chunk, target_lang))
+        new_rows = []
+        with translation_cache_lock:
+            for key, translated in zip(keys, translated_texts):
+                translation_cache[(key, target_lang, TRANSLATION_MODEL)] = translated
+                for i in pending[key][1]:
+                    results[i] = translated
+                new_rows.append({
+                    "text_hash": key,
+                    "target_lang": target_lang,
+                    "model": TRANSLATION_MODEL,
+                    "source_text": pending[key][0],
+                    "translated_text": translated,
+                })
+        if db is not None:
+            crud.create_translations(db=db, translations=new_rows)
+
+    return results
+
+def translate_text(text: str, target_lang: str = 'en', db: Optional[Session] = None) -> str:
+    return translate_texts([text], target_lang=target_lang, db=db)[0]
+
+def get_nlp(lang: str = 'en'):
+    """Load a spaCy pipeline on first use and keep it for the life of the process."""
+    if lang not in SPACY_MODELS:
         raise ValueError("Language must be either 'en' or 'ja'")
-    if lang == 'ja':
-        nlp = spacy.load("ja_core_news_sm")
-    else:
-        nlp = spacy.load("en_core_web_sm")
-    doc = nlp(text)
+    nlp = _nlp_registry.get(lang)
+    if nlp is None:
+        with _nlp_registry_lock:
+            nlp = _nlp_registry.get(lang)
+            if nlp is None:
+                # only the tokenizer and lexical attributes (is_stop, is_punct) are used
+                nlp = spacy.load(SPACY_MODELS[lang], exclude=SPACY_EXCLUDE)
+                _nlp_registry[lang] = nlp
+    return nlp
+
+def _token_frequency(doc) -> dict:
     frequency = {}
-    
     for token in doc:
         if not token.is_stop and not token.is_punct:
             frequency[token.text] = frequency.get(token.text, 0) + 1
-            
-    return frequency
\ No newline at end of file
+    return frequency
+
+def cal_frequencies(texts: List[str], lang: str = 'en', n_process: Optional[int] = None, batch_size: Optional[int] = None) -> List[dict]:
+    nlp = get_nlp(lang)
+    docs = nlp.pipe(
+        (text or "" for text in texts),
+        n_process=n_process or SPACY_N_PROCESS,
+        batch_size=batch_size or SPACY_BATCH_SIZE,
+    )
+    return [_token_frequency(doc) for doc in docs]
+
+def cal_frequency(text: str, lang: str = 'en') -> dict:
+    return cal_frequencies([text], lang=lang)[0]
@@ -1,5 +1,5 @@
 import logging.config
-from fastapi import Depends, FastAPI, HTTPException, File, UploadFile, Form, responses, status, Request
+from fastapi import Depends, FastAPI, HTTPException, File, UploadFile, Form, responses, status, Request, Response
 from fastapi.templating import Jinja2Templates
 
 templates = Jinja2Templates(directory="templates")
@@ -7,25 +7,28 @@ templates = Jinja2Templates(directory="templates")
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import parse_obj_as
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import os, datetime, shutil, tempfile, zipfile, zoneinfo, random, json, asyncio, time #, yappi
 import pandas as pd
 from pathlib import Path
-from cachetools import TTLCache
+from cachetools import TTLCache, LRUCache
 from threading import RLock
 
 from .analysis_router import router as analysis_router
 from .admin_router import router as admin_router
 from .ws_router import router as ws_router
-from . import crud, models, schemas
+from .action_buffer import user_actions
+from . import caches, crud, crud_async, models, pagination, queries, schemas
 from tasks import app as celery_app
 from tasks import generateDescription2, generate_interpretation2, calculate_score_gpt
-from .database import SessionLocal2, engine2
+from .database import SessionLocal2, engine2, async_engine2, AsyncSessionLocal2
 
-from .dependencies import sentence, score, dictionary, openai_chatbot, lti
+from .dependencies import sentence, score, dictionary, openai_chatbot, lti, blob_store, llm_clients, llm_scheduler, query_profiler, shared_cache
 from .authentication import authenticate_user, authenticate_user_2, create_access_token, oauth2_scheme, SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, create_refresh_token, JWTError, jwt, create_ws_token
 from util import *
+import instrumentation
 
-from typing import Tuple, List, Annotated, Optional, Union, Literal
+from typing import Tuple, List, Annotated, Optional, Union, Literal, NamedTuple
 from datetime import timedelta
 from contextlib import asynccontextmanager
 
@@ -66,19 +69,23 @@ media_dir.mkdir(parents=True, exist_ok=True)
 
 JST = zoneinfo.ZoneInfo("Asia/Tokyo")
 
-LEADERBOARD_CACHE_TTL = int(os.getenv("LEADERBOARD_CACHE_TTL", "15"))
-LEADERBOARD_CACHE_MAXSIZE = int(os.getenv("LEADERBOARD_CACHE_MAXSIZE", "128"))
-LEADERBOARD_STATS_CACHE_TTL = int(os.getenv("LEADERBOARD_STATS_CACHE_TTL", str(LEADERBOARD_CACHE_TTL)))
-LEADERBOARD_STATS_CACHE_MAXSIZE = int(os.getenv("LEADERBOARD_STATS_CACHE_MAXSIZE", "128"))
-USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "10"))
-USER_CACHE_MAXSIZE = int(os.getenv("USER_CACHE_MAXSIZE", "2048"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+IMAGE_REF_CACHE_TTL = int(os.getenv("IMAGE_REF_CACHE_TTL", "300"))
+IMAGE_REF_CACHE_MAXSIZE = int(os.getenv("IMAGE_REF_CACHE_MAXSIZE", "4096"))
+IMAGE_CACHE_CONTROL = "private, max-age=31536000, immutable"
 
-leaderboard_cache = TTLCache(maxsize=LEADERBOARD_CACHE_MAXSIZE, ttl=LEADERBOARD_CACHE_TTL)
-leaderboard_stats_cache = TTLCache(maxsize=LEADERBOARD_STATS_CACHE_MAXSIZE, ttl=LEADERBOARD_STATS_CACHE_TTL)
-user_cache = TTLCache(maxsize=USER_CACHE_MAXSIZE, ttl=USER_CACHE_TTL)
+class CachedImage(NamedTuple):
+    data: bytes
+    etag: str
+    media_type: str
 
-cache_lock = RLock()
-user_cache_lock = RLock()
+
+# decoded image bytes keyed by (kind, image id); maxsize is a byte budget
+image_cache = LRUCache(maxsize=IMAGE_CACHE_MAX_BYTES, getsizeof=lambda item: len(item.data))
+# (kind, leaderboard id / generation id) -> image id, so repeat hits skip MySQL
+image_ref_cache = TTLCache(maxsize=IMAGE_REF_CACHE_MAXSIZE, ttl=IMAGE_REF_CACHE_TTL)
+
+image_cache_lock = RLock()
 
 
 def _datetime_key(value: Optional[datetime.datetime]) -> Optional[str]:
@@ -94,14 +101,13 @@ def _leaderboard_cache_key(
     published_at_end: Optional[datetime.datetime],
     is_public: bool,
     created_by_id: Optional[int],
+    cursor: Optional[str] = None,
 ) -> Tuple:
-    school_key = school_name if school_name is not None else "__all__"
-    course_key = course_id if course_id is not None else "__all__"
     return (
-        school_key,
-        course_key,
+        caches.scope(school_name, course_id),
         skip,
         limit,
+        cursor,
         _datetime_key(published_at_start),
         _datetime_key(published_at_end),
         is_public,
@@ -117,11 +123,8 @@ def _leaderboard_stats_cache_key(
     is_public: bool,
     created_by_id: Optional[int],
 ) -> Tuple:
-    school_key = school_name if school_name is not None else "__all__"
-    course_key = course_id if course_id is not None else "__all__"
     return (
-        school_key,
-        course_key,
+        caches.scope(school_name, course_id),
         _datetime_key(published_at_start),
         _datetime_key(published_at_end),
         is_public,
@@ -129,40 +132,27 @@ def _leaderboard_stats_cache_key(
     )
 
 
-def invalidate_leaderboard_cache() -> None:
-    with cache_lock:
-        leaderboard_cache.clear()
-        leaderboard_stats_cache.clear()
-
-
-def _get_cached_user(username: str) -> Optional[schemas.User]:
-    with user_cache_lock:
-        return user_cache.get(username)
-
-
-def _cache_user(username: str, user: schemas.User) -> None:
-    with user_cache_lock:
-        user_cache[username] = user
+def invalidate_leaderboard_cache(db: Session, leaderboard_id: int) -> None:
+    """For changes to the leaderboard itself; crud handles added and removed school links."""
+    caches.invalidate_leaderboards(crud.get_school_leaderboard(db, leaderboard_id=leaderboard_id))
 
 
-def invalidate_user_cache(username: str) -> None:
-    with user_cache_lock:
-        user_cache.pop(username, None)
+async def _load_user_by_username(adb: AsyncSession, username: str) -> Optional[schemas.User]:
+    inactive_user = None
 
-
-async def _load_user_by_username(db: Session, username: str) -> Optional[schemas.User]:
-    cached_user = _get_cached_user(username)
-    if cached_user:
-        return cached_user
-
-    db_user = await asyncio.to_thread(crud.get_user_by_username, db, username=username)
-    if db_user is None:
+    async def load():
+        nonlocal inactive_user
+        db_user = await crud_async.get_user_by_username(adb, username=username)
+        if db_user is None:
+            return None
+        user_schema = schemas.User.model_validate(db_user, from_attributes=True)
+        if user_schema.is_active:
+            return user_schema
+        # not cached, so reactivating the account takes effect at once
+        inactive_user = user_schema
         return None
 
-    user_schema = schemas.User.model_validate(db_user, from_attributes=True)
-    if user_schema.is_active:
-        _cache_user(username, user_schema)
-    return user_schema
+    return await caches.user_cache.get_or_load(username, load) or inactive_user
 
 
 def _parse_jst_date(date_str: Optional[str]) -> Optional[datetime.datetime]:
@@ -171,6 +161,12 @@ def _parse_jst_date(date_str: Optional[str]) -> Optional[datetime.datetime]:
     return datetime.datetime.strptime(date_str, "%d%m%Y").replace(tzinfo=JST)
 
 
+def _cacheable_now() -> datetime.datetime:
+    # floored to the cache TTL, so the requests of one TTL window share a cache key
+    now = datetime.datetime.now(tz=JST)
+    return now - datetime.timedelta(seconds=now.timestamp() % caches.LEADERBOARD_CACHE_TTL)
+
+
 def _clamp_student_dates(
     start: Optional[datetime.datetime],
     end: Optional[datetime.datetime],
@@ -178,7 +174,7 @@ def _clamp_student_dates(
 ) -> Tuple[Optional[datetime.datetime], Optional[datetime.datetime]]:
     if not is_student:
         return start, end
-    now = datetime.datetime.now(tz=JST)
+    now = _cacheable_now()
     if start and start > now:
         start = now
     if end and end > now:
@@ -197,6 +193,7 @@ async def get_leaderboards_cached(
     published_at_end: Optional[datetime.datetime],
     is_public: bool,
     created_by_id: Optional[int],
+    cursor: Optional[str] = None,
 ) -> List[Tuple[schemas.LeaderboardOut, schemas.SchoolOut]]:
     key = _leaderboard_cache_key(
         school_name,
@@ -207,34 +204,34 @@ async def get_leaderboards_cached(
         published_at_end,
         is_public,
         created_by_id,
-    )
-    with cache_lock:
-        cached = leaderboard_cache.get(key)
-    if cached is not None:
-        return cached
+        cursor,
+    )
+    page = pagination.keyset("published_at", cursor)
+
+    async def load():
+        rows = await asyncio.to_thread(
+            crud.get_leaderboards,
+            db,
+            school_name,
+            course_id,
+            skip,
+            limit,
+            published_at_start,
+            published_at_end,
+            is_public,
+            created_by_id,
+            page.before,
+            page.after,
+        )
+        return [
+            (
+                schemas.LeaderboardOut.model_validate(leaderboard, from_attributes=True),
+                schemas.SchoolOut.model_validate(school, from_attributes=True),
+            )
+            for leaderboard, school in rows
+        ]
 
-    rows = await asyncio.to_thread(
-        crud.get_leaderboards,
-        db,
-        school_name,
-        course_id,
-        skip,
-        limit,
-        published_at_start,
-        published_at_end,
-        is_public,
-        created_by_id,
-    )
-    serialized = [
-        (
-            schemas.LeaderboardOut.model_validate(leaderboard, from_attributes=True),
-            schemas.SchoolOut.model_validate(school, from_attributes=True),
-        )
-        for leaderboard, school in rows
-    ]
-    with cache_lock:
-        leaderboard_cache[key] = serialized
-    return serialized
+    return await caches.leaderboard_cache.get_or_load(key, load, tags=[key[0]])
 
 
 async def get_leaderboards_stats_cached(
@@ -255,26 +252,135 @@ async def get_leaderboards_stats_cached(
         is_public,
         created_by_id,
     )
-    with cache_lock:
-        cached = leaderboard_stats_cache.get(key)
+
+    async def load():
+        raw_stats = await asyncio.to_thread(
+            crud.get_leaderboards_stats,
+            db,
+            school_name,
+            course_id,
+            published_at_start,
+            published_at_end,
+            None,
+            is_public,
+            created_by_id,
+        )
+        return schemas.LeaderboardsStats.model_validate(raw_stats)
+
+    return await caches.leaderboard_stats_cache.get_or_load(key, load, tags=[key[0]])
+
+def _get_cached_image(kind: str, owner_id: int) -> Optional[CachedImage]:
+    with image_cache_lock:
+        image_id = image_ref_cache.get((kind, owner_id))
+        if image_id is None:
+            return None
+        return image_cache.get((kind, image_id))
+
+
+def _cache_image(kind: str, owner_id: int, db_image) -> Optional[CachedImage]:
+    data = blob_store.load_image_bytes(db_image)
+    if data is None:
+        return None
+    item = CachedImage(
+        data=data,
+        etag=f'"{db_image.storage_key or blob_store.content_key(data)}"',
+        media_type=db_image.mime_type or blob_store.sniff_mime_type(data),
+    )
+    with image_cache_lock:
+        image_ref_cache[(kind, owner_id)] = db_image.id
+        if len(data) <= IMAGE_CACHE_MAX_BYTES:
+            image_cache[(kind, db_image.id)] = item
+    return item
+
+
+def invalidate_image_cache(keys: list, tags: list) -> None:
+    """caches.invalidate_images handler; keys are (kind, owner_id)."""
+    with image_cache_lock:
+        for kind, owner_id in keys:
+            image_id = image_ref_cache.pop((kind, owner_id), None)
+            if image_id is not None:
+                image_cache.pop((kind, image_id), None)
+
+shared_cache.register(caches.IMAGES, invalidate_image_cache)
+
+
+async def load_image_cached(db: Session, kind: Literal["original", "interpreted"], owner_id: int) -> Optional[CachedImage]:
+    cached = _get_cached_image(kind, owner_id)
     if cached is not None:
         return cached
 
-    raw_stats = await asyncio.to_thread(
-        crud.get_leaderboards_stats,
-        db,
-        school_name,
-        course_id,
-        published_at_start,
-        published_at_end,
-        None,
-        is_public,
-        created_by_id,
-    )
-    stats_model = schemas.LeaderboardsStats.model_validate(raw_stats)
-    with cache_lock:
-        leaderboard_stats_cache[key] = stats_model
-    return stats_model
+    if kind == "original":
+        db_image = await asyncio.to_thread(crud.get_leaderboard_original_image, db, leaderboard_id=owner_id)
+    else:
+        db_image = await asyncio.to_thread(crud.get_generation_interpreted_image, db, generation_id=owner_id)
+    if db_image is None:
+        return None
+    try:
+        return await asyncio.to_thread(_cache_image, kind, owner_id, db_image)
+    except KeyError:
+        logger1.error(f"Blob missing for {kind} image {db_image.id} ({db_image.storage_key})")
+        return None
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def _parse_byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single 'bytes=start-end' range. Returns None when unsatisfiable."""
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise ValueError("unsupported range")
+    start_str, _, end_str = spec.strip().partition("-")
+    if start_str == "":
+        length = int(end_str)
+        if length <= 0:
+            return None
+        return max(size - length, 0), size - 1
+    start = int(start_str)
+    end = int(end_str) if end_str else size - 1
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def image_response(request: Request, image: CachedImage) -> responses.Response:
+    headers = {
+        "ETag": image.etag,
+        "Cache-Control": IMAGE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), image.etag):
+        return responses.Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == image.etag):
+        size = len(image.data)
+        try:
+            byte_range = _parse_byte_range(range_header, size)
+        except ValueError:
+            # malformed or multi-range requests get the full body
+            byte_range = (0, size - 1)
+        if byte_range is None:
+            headers["Content-Range"] = f"bytes */{size}"
+            return responses.Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers=headers)
+        start, end = byte_range
+        if (start, end) != (0, size - 1):
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            return responses.Response(
+                content=image.data[start:end + 1],
+                status_code=status.HTTP_206_PARTIAL_CONTENT,
+                media_type=image.media_type,
+                headers=headers,
+            )
+
+    return responses.Response(content=image.data, media_type=image.media_type, headers=headers)
 
 # Dependency
 def get_db():
@@ -284,6 +390,10 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal2() as adb:
+        yield adb
+
 app = FastAPI(
     debug=True,
     title="AVERY",
@@ -294,18 +404,53 @@ app = FastAPI(
 async def initialize_database_schema() -> None:
     await asyncio.to_thread(_initialize_database_schema_with_retry)
 
+
+@app.on_event("startup")
+async def setup_tracing() -> None:
+    instrumentation.setup_tracing("avery-backend")
+
+
+@app.on_event("startup")
+async def listen_for_cache_invalidations() -> None:
+    shared_cache.start_listener()
+
+
+@app.on_event("shutdown")
+async def stop_cache_invalidations() -> None:
+    await shared_cache.stop_listener()
+
+
+@app.on_event("shutdown")
+async def close_llm_clients() -> None:
+    await llm_clients.aclose_clients()
+
+
+@app.on_event("shutdown")
+async def flush_user_actions() -> None:
+    await user_actions.stop()
+
+query_profiler.instrument(engine2, async_engine2.sync_engine)
+instrumentation.instrument_sessions()
+app.middleware("http")(query_profiler.profile_queries)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor"],
 )
 
 @app.get("/")
 def hello_world():
     return {"Hello": "World"}
 
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    content, media_type = query_profiler.metrics()
+    return responses.Response(content=content, media_type=media_type)
+
 @app.get("/tasks", tags=["Task"], response_model=list[schemas.Task])
 async def read_tasks(
     db: Session = Depends(get_db),
@@ -348,7 +493,7 @@ async def check_leaderboard_task_status(
 
     return output
 
-async def get_current_user(db: Annotated[Session, Depends(get_db)],token: Annotated[schemas.TokenData, Depends(oauth2_scheme)]):
+async def get_current_user(adb: Annotated[AsyncSession, Depends(get_async_db)],token: Annotated[schemas.TokenData, Depends(oauth2_scheme)]):
 #async def get_current_user(db: Annotated[Session, Depends(get_db)],username: str):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -372,7 +517,7 @@ async def get_current_user(db: Annotated[Session, Depends(get_db)],token: Annota
             detail="Token has expired",
             headers={"WWW-Authenticate": "Bearer"},
         )
-        user = await _load_user_by_username(db, token_data.username)
+        user = await _load_user_by_username(adb, token_data.username)
         if user is None:
             raise credentials_exception
         elif user.is_active:
@@ -387,7 +532,7 @@ async def get_current_user(db: Annotated[Session, Depends(get_db)],token: Annota
     else:
         raise credentials_exception
 
-async def get_current_admin(db: Annotated[Session, Depends(get_db)],token: Annotated[schemas.TokenData, Depends(oauth2_scheme)]):
+async def get_current_admin(adb: Annotated[AsyncSession, Depends(get_async_db)],token: Annotated[schemas.TokenData, Depends(oauth2_scheme)]):
 #async def get_current_user(db: Annotated[Session, Depends(get_db)],username: str):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -410,7 +555,7 @@ async def get_current_admin(db: Annotated[Session, Depends(get_db)],token: Annot
             detail="Token has expired",
             headers={"WWW-Authenticate": "Bearer"},
         )
-        user = await _load_user_by_username(db, token_data.username)
+        user = await _load_user_by_username(adb, token_data.username)
         if user is None:
             raise credentials_exception
         elif user.is_admin:
@@ -457,14 +602,13 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    _cache_user(user.username, schemas.User.model_validate(user, from_attributes=True))
+    await caches.user_cache.set(user.username, schemas.User.model_validate(user, from_attributes=True))
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
     )
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=user.id,
             action="login",
@@ -627,15 +771,14 @@ async def login_for_access_token_lti(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    _cache_user(user.username, schemas.User.model_validate(user, from_attributes=True))
+    await caches.user_cache.set(user.username, schemas.User.model_validate(user, from_attributes=True))
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username, "course_id": course_id}, expires_delta=access_token_expires
     )
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=user.id,
             action="lti_login",
@@ -733,8 +876,7 @@ async def create_user(user: Annotated[schemas.UserCreateIn, Form()], db: Session
             user_id=new_user.id,
         )
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=new_user.id,
             action="create_user",
@@ -785,8 +927,7 @@ async def create_user_w_random_username(user: Annotated[schemas.UserRandomCreate
             user_id=new_user.id,
         )
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=new_user.id,
             action="create_random_user",
@@ -802,8 +943,7 @@ async def create_user_lti(user: schemas.UserLti, db: Session = Depends(get_db)):
     if db_user:
         raise HTTPException(status_code=400, detail="This account already exists")
     new_user = crud.create_user_lti(db=db, user=user)
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=new_user.id,
             action="create_user_lti",
@@ -823,7 +963,7 @@ async def delete_user(current_user: Annotated[schemas.User, Depends(get_current_
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     deleted_user = crud.delete_user(db=db, user_id=user_id)
-    invalidate_user_cache(db_user.username)
+    caches.invalidate_user(db_user.username)
     return "Deleted"
 
 @app.put("/users/{user_id}/password", tags=["User"], response_model=schemas.User)
@@ -836,7 +976,7 @@ async def update_user_password(
         raise HTTPException(status_code=401, detail="Login to update password")
     user_id = current_user.id
     updated_user = crud.update_user_password(db=db, user_id=user_id, new_password=user.new_password)
-    invalidate_user_cache(current_user.username)
+    caches.invalidate_user(current_user.username)
     return updated_user
 
 @app.put("/users/", tags=["User"], response_model=schemas.User)
@@ -869,7 +1009,7 @@ async def update_user(
         )
     )
     updated_user = crud.update_user(db=db, user=user)
-    invalidate_user_cache(db_user.username)
+    caches.invalidate_user(db_user.username)
     return updated_user
 
 @app.get("/users/me", tags=["User"], response_model=schemas.UserOutWithCurrentCourse)
@@ -987,8 +1127,7 @@ async def read_scene_schools(
     if not current_user.is_admin:
         raise HTTPException(status_code=401, detail="You are not an admin")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_scene_schools",
@@ -1013,8 +1152,7 @@ async def add_scene_to_school(
     if not current_user.is_admin:
         raise HTTPException(status_code=401, detail="You are not an admin")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="update_school_scene",
@@ -1036,8 +1174,7 @@ async def remove_scene_from_school(
     if not current_user.is_admin:
         raise HTTPException(status_code=401, detail="You are not an admin")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="remove_school_scene",
@@ -1124,8 +1261,7 @@ async def read_story_schools(
     if not current_user.is_admin:
         raise HTTPException(status_code=401, detail="You are not an admin")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_story_schools",
@@ -1150,8 +1286,7 @@ async def add_story_to_school(
     if not current_user.is_admin:
         raise HTTPException(status_code=401, detail="You are not an admin")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="update_school_story",
@@ -1173,8 +1308,7 @@ async def remove_story_from_school(
     if not current_user.is_admin:
         raise HTTPException(status_code=401, detail="You are not an admin")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="remove_school_story",
@@ -1187,8 +1321,10 @@ async def remove_story_from_school(
 @app.get("/leaderboards/", tags=["Leaderboard"], response_model=list[Tuple[schemas.LeaderboardOut, schemas.SchoolOut]])
 async def read_leaderboards(
     current_user: Annotated[schemas.User, Depends(get_current_user)],
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     published_at_start: str = None,
     published_at_end: str = None,
     is_public: bool = True,
@@ -1196,6 +1332,7 @@ async def read_leaderboards(
 ):
     if not current_user:
         raise HTTPException(status_code=401, detail="Login to view leaderboards")
+    page = pagination.keyset("published_at", cursor)
 
     school_name = current_user.school
     if school_name is None and not current_user.is_admin:
@@ -1206,7 +1343,7 @@ async def read_leaderboards(
     start_dt, end_dt = _clamp_student_dates(start_dt, end_dt, current_user.user_type == "student")
 
     if start_dt is None and end_dt is None:
-        end_dt = datetime.datetime.now(tz=JST)
+        end_dt = _cacheable_now()
 
     owner_filter = current_user.id if not is_public else None
 
@@ -1220,10 +1357,11 @@ async def read_leaderboards(
         published_at_end=end_dt,
         is_public=is_public,
         created_by_id=owner_filter,
+        cursor=cursor,
     )
+    pagination.set_cursors(response, "published_at", leaderboards, pagination.leaderboard_key, limit, page)
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_leaderboards",
@@ -1254,7 +1392,7 @@ async def read_leaderboards_stats(
     start_dt, end_dt = _clamp_student_dates(start_dt, end_dt, current_user.user_type == "student")
 
     if start_dt is None and end_dt is None:
-        end_dt = datetime.datetime.now(tz=JST)
+        end_dt = _cacheable_now()
 
     owner_filter = current_user.id if not is_public else None
 
@@ -1268,8 +1406,7 @@ async def read_leaderboards_stats(
         created_by_id=owner_filter,
     )
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_leaderboards_stats",
@@ -1309,8 +1446,7 @@ async def read_leaderboards_admin(
         is_public=is_public,
     )
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_leaderboards_admin",
@@ -1346,8 +1482,7 @@ async def read_leaderboards_admin_stats(
         is_public=is_public,
     )
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_leaderboards_admin_stats",
@@ -1390,7 +1525,7 @@ async def create_leaderboard(
 
     t =  await generateDescription2.delayx(
         leaderboard_id=result.id,
-        image=db_original_image.image,
+        image=blob_store.load_image_base64(db_original_image),
         story=story,
         model_name="gpt-4o-mini"
     )
@@ -1422,8 +1557,7 @@ async def create_leaderboard(
         )
     )
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="create_leaderboard",
@@ -1433,7 +1567,6 @@ async def create_leaderboard(
         )
     )
 
-    invalidate_leaderboard_cache()
 
     return result
 
@@ -1674,7 +1807,7 @@ async def create_leaderboards(
             # Generate description
             t = await generateDescription2.delayx(
                 leaderboard_id=db_leaderboard.id,
-                image=img.image,
+                image=blob_store.load_image_base64(img),
                 story=story_extract,
                 model_name="gpt-4o-mini",
             )
@@ -1694,8 +1827,7 @@ async def create_leaderboards(
         shutil.rmtree(temp_dir)
 
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="create_leaderboards",
@@ -1704,7 +1836,6 @@ async def create_leaderboards(
         )
     )
 
-    invalidate_leaderboard_cache()
 
     return leaderboard_list
 
@@ -1743,8 +1874,7 @@ async def read_leaderboard(current_user: Annotated[schemas.User, Depends(get_cur
         logger1.error(f"Leaderboard not found: {leaderboard_id}")
         raise HTTPException(status_code=404, detail="Leaderboard not found")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_leaderboard_info",
@@ -1765,8 +1895,7 @@ async def read_schools(current_user: Annotated[schemas.User, Depends(get_current
     else:
         schools = crud.get_course_leaderboard(db, leaderboard_id=leaderboard_id, school=current_user.school, course_id=current_user.course_id)
     
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_schools",
@@ -1784,8 +1913,7 @@ async def read_courses(current_user: Annotated[schemas.User, Depends(get_current
     
     courses = crud.get_courses_by_user(db, user_id=current_user.id)
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_courses",
@@ -1811,8 +1939,7 @@ async def update_leaderboard(
     if db_leaderboard is None:
         raise HTTPException(status_code=404, detail="Leaderboard not found")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="update_leaderboard_info",
@@ -1825,7 +1952,7 @@ async def update_leaderboard(
 
     # update courses
     
-    invalidate_leaderboard_cache()
+    invalidate_leaderboard_cache(db, leaderboard_id)
     return updated_leaderboard
 
 @app.post("/leaderboards/{leaderboard_id}/school", tags=["Leaderboard"], response_model=list[schemas.SchoolOut])
@@ -1844,8 +1971,7 @@ async def update_leaderboard_school(
     if db_leaderboard is None:
         raise HTTPException(status_code=404, detail="Leaderboard not found")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="update_leaderboard_school",
@@ -1886,7 +2012,6 @@ async def update_leaderboard_school(
     else:
         schools = []
 
-    invalidate_leaderboard_cache()
     return schools
 
 @app.put("/leaderboards/{leaderboard_id}/school", tags=["Leaderboard"], response_model=list[schemas.SchoolOut])
@@ -1904,8 +2029,7 @@ async def add_leaderboard_school(
     if db_leaderboard is None:
         raise HTTPException(status_code=404, detail="Leaderboard not found")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="add_leaderboard_school",
@@ -1917,7 +2041,6 @@ async def add_leaderboard_school(
     crud.add_leaderboard_school(db=db, leaderboard=leaderboard)
     schools = crud.get_school_leaderboard(db, leaderboard_id=leaderboard_id)
 
-    invalidate_leaderboard_cache()
     return schools
 
 @app.delete("/leaderboards/{leaderboard_id}/school", tags=["Leaderboard"], response_model=list[schemas.SchoolOut])
@@ -1935,8 +2058,7 @@ async def delete_leaderboard_school(
     if db_leaderboard is None:
         raise HTTPException(status_code=404, detail="Leaderboard not found")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="delete_leaderboard_school",
@@ -1947,7 +2069,6 @@ async def delete_leaderboard_school(
     )
     crud.remove_leaderboard_school(db=db, leaderboard=leaderboard)
     schools = crud.get_school_leaderboard(db, leaderboard_id=leaderboard_id)
-    invalidate_leaderboard_cache()
     return schools
 
 @app.put("/leaderboards/{leaderboard_id}/vocabulary", tags=["Leaderboard"], response_model=schemas.LeaderboardOut)
@@ -1965,8 +2086,7 @@ async def add_leaderboard_vocabulary(
     if db_leaderboard is None:
         raise HTTPException(status_code=404, detail="Leaderboard not found")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="add_leaderboard_vocabulary",
@@ -1976,7 +2096,7 @@ async def add_leaderboard_vocabulary(
         )
     )
     updated_leaderboard = crud.add_leaderboard_vocab(db=db, leaderboard_id=leaderboard_id, vocabulary=vocabulary)
-    invalidate_leaderboard_cache()
+    invalidate_leaderboard_cache(db, leaderboard_id)
     return updated_leaderboard
 
 @app.delete("/leaderboards/{leaderboard_id}/vocabulary", tags=["Leaderboard"], response_model=schemas.LeaderboardOut)
@@ -1994,8 +2114,7 @@ async def delete_leaderboard_vocabulary(
     if db_leaderboard is None:
         raise HTTPException(status_code=404, detail="Leaderboard not found")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="delete_leaderboard_vocabulary",
@@ -2005,7 +2124,7 @@ async def delete_leaderboard_vocabulary(
         )
     )
     updated_leaderboard = crud.remove_leaderboard_vocab(db=db, leaderboard_id=leaderboard_id, vocab_id=vocabulary_id)
-    invalidate_leaderboard_cache()
+    invalidate_leaderboard_cache(db, leaderboard_id)
     return updated_leaderboard
 
 @app.delete("/leaderboards/{leaderboard_id}", tags=["Leaderboard"], response_model=schemas.IdOnly)
@@ -2022,8 +2141,7 @@ async def delete_leaderboard(
     if db_leaderboard is None:
         raise HTTPException(status_code=404, detail="Leaderboard not found")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="delete_leaderboard",
@@ -2032,9 +2150,7 @@ async def delete_leaderboard(
             received_at=datetime.datetime.now(tz=JST),
         )
     )
-    result = crud.delete_leaderboard(db=db, leaderboard_id=leaderboard_id)
-    invalidate_leaderboard_cache()
-    return result
+    return crud.delete_leaderboard(db=db, leaderboard_id=leaderboard_id)
 
 @app.post("/program", tags=["Program"], response_model=schemas.Program, status_code=201)
 async def create_program(
@@ -2047,8 +2163,7 @@ async def create_program(
     if not current_user.is_admin:
         raise HTTPException(status_code=401, detail="You are not an admin")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="create_program",
@@ -2085,8 +2200,7 @@ async def read_programs(current_user: Annotated[schemas.User, Depends(get_curren
     if not programs:
         return [crud.get_program_by_name(db, "inlab_test")]
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_programs",
@@ -2107,8 +2221,7 @@ async def read_school_programs(
     if not current_user.is_admin:
         raise HTTPException(status_code=401, detail="You are not an admin")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_school_programs",
@@ -2133,8 +2246,7 @@ async def add_program_to_school(
     if not current_user.is_admin:
         raise HTTPException(status_code=401, detail="You are not an admin")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="update_school_program",
@@ -2156,8 +2268,7 @@ async def remove_program_from_school(
     if not current_user.is_admin:
         raise HTTPException(status_code=401, detail="You are not an admin")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="remove_school_program",
@@ -2187,8 +2298,7 @@ async def get_user_program(
         user_id=user_id,
     )
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_user_program",
@@ -2228,8 +2338,7 @@ async def add_program_to_user(
     if programUserUpdate.program_id not in [sp.program_id for sp in school_programs]:
         raise HTTPException(status_code=401, detail="This program not available for your school")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="update_user_program",
@@ -2268,8 +2377,7 @@ async def remove_program_from_user(
     if programUserUpdate.program_id not in [sp.program_id for sp in school_programs]:
         raise HTTPException(status_code=401, detail="This program not available for your school")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="remove_user_program",
@@ -2295,8 +2403,7 @@ async def get_round(
     if db_round.player_id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=401, detail="You are not allowed to view this round")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_round",
@@ -2324,8 +2431,7 @@ async def update_round_display_name(
     if db_round.player_id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=401, detail="You are not allowed to update this round")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="update_round_display_name",
@@ -2340,12 +2446,18 @@ async def update_round_display_name(
 @app.get("/leaderboards/{leaderboard_id}/rounds/", tags=["Leaderboard", "Round"], response_model=list[schemas.RoundOut])
 async def get_rounds_by_leaderboard(
     current_user: Annotated[schemas.User, Depends(get_current_user)],
+    response: Response,
     leaderboard_id: int,
     program: Optional[str] = "none",
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
     db: Session = Depends(get_db),
 ):
     if not current_user:
         raise HTTPException(status_code=401, detail="Login to view")
+    page = pagination.keyset("id", cursor, before_id, after_id)
 
     if program == "none":
         return []
@@ -2355,15 +2467,19 @@ async def get_rounds_by_leaderboard(
 
             db_rounds_users = crud.get_rounds_full(
                 db=db,
+                limit=limit,
                 leaderboard_id=leaderboard_id,
-                user_type=current_user.user_type
+                user_type=current_user.user_type,
+                before=page.before,
+                after=page.after,
             )
-            return [r for r,u in db_rounds_users]
+            db_rounds = [r for r,u in db_rounds_users]
+            pagination.set_cursors(response, "id", db_rounds, pagination.round_key, limit, page)
+            return db_rounds
         raise HTTPException(status_code=401, detail="You are not allowed to view all rounds")
     db_program = crud.get_program_by_name(db, program)
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_rounds_by_leaderboard",
@@ -2376,21 +2492,28 @@ async def get_rounds_by_leaderboard(
     if current_user.school is None or current_user.school == "public":
         db_rounds_users = crud.get_rounds_full(
             db=db,
+            limit=limit,
             leaderboard_id=leaderboard_id,
             player_id=current_user.id,
             user_type=current_user.user_type,
             program_id=db_program.id,
+            before=page.before,
+            after=page.after,
         )
     else:
         db_rounds_users = crud.get_rounds_full(
             db=db,
+            limit=limit,
             leaderboard_id=leaderboard_id,
             school_name=current_user.school,
             user_type=current_user.user_type,
             program_id=db_program.id,
+            before=page.before,
+            after=page.after,
         )
 
     db_rounds = [r for r,u in db_rounds_users]
+    pagination.set_cursors(response, "id", db_rounds, pagination.round_key, limit, page)
 
     if current_user.user_type == "student":
         for r in db_rounds:
@@ -2414,18 +2537,11 @@ async def get_rounds_stats_by_leaderboard(
     elif program == "overview":
         # check admin
         if current_user.is_admin and current_user.user_type == "instructor":
-
-            n_rounds = crud.get_rounds_full_count(
-                db=db,
-                leaderboard_id=leaderboard_id,
-                user_type=current_user.user_type
-            )
-            return {"n_rounds": n_rounds}
+            return crud.get_leaderboard_round_stats(db=db, leaderboard_id=leaderboard_id)
         raise HTTPException(status_code=401, detail="You are not allowed to view all rounds")
     db_program = crud.get_program_by_name(db, program)
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_rounds_stats_by_leaderboard",
@@ -2436,21 +2552,13 @@ async def get_rounds_stats_by_leaderboard(
     )
 
     if current_user.school is None or current_user.school == "public":
-        n_rounds = crud.get_rounds_full_count(
-            db=db,
-            leaderboard_id=leaderboard_id,
-            player_id=current_user.id,
-            user_type=current_user.user_type,
-        )
-    else:
-        n_rounds = crud.get_rounds_full_count(
-            db=db,
-            leaderboard_id=leaderboard_id,
-            school_name=current_user.school,
-            user_type=current_user.user_type,
-        )
-
-    return {"n_rounds": n_rounds}
+        return crud.get_player_stats(db=db, player_id=current_user.id, leaderboard_id=leaderboard_id)
+    return crud.get_leaderboard_round_stats(
+        db=db,
+        leaderboard_id=leaderboard_id,
+        school_name=current_user.school,
+        user_type="student" if current_user.user_type == "student" else None,
+    )
 
 @app.get("/my_rounds/", tags=["Round"], response_model=list[schemas.RoundOut])
 async def get_my_rounds(
@@ -2475,8 +2583,7 @@ async def get_my_rounds(
                 program_id=db_program.id
             )
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_my_rounds",
@@ -2501,7 +2608,7 @@ async def create_user_action(
 ):
     if not current_user:
         raise HTTPException(status_code=401, detail="Login to create user action")
-    crud.create_user_action(db=db, user_action=schemas.UserActionBase(
+    await user_actions.record(user_action=schemas.UserActionBase(
         user_id=current_user.id,
         action=user_action.action,
         related_id=user_action.related_id,
@@ -2532,8 +2639,7 @@ async def read_vocabulary(current_user: Annotated[schemas.User, Depends(get_curr
     if not vocabularies:
         raise HTTPException(status_code=404, detail="Vocabulary not found")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="check_vocabulary_info",
@@ -2550,8 +2656,7 @@ async def read_vocabularies(current_user: Annotated[schemas.User, Depends(get_cu
         raise HTTPException(status_code=401, detail="Login to view vocabularies")
     vocabularies = crud.get_vocabularies(db, skip=skip, limit=limit)
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="check_vocabularies",
@@ -2609,8 +2714,7 @@ async def create_vocabularies(
                 )
                 output.append(v)
 
-        crud.create_user_action(
-            db=db,
+        await user_actions.record(
             user_action=schemas.UserActionBase(
                 user_id=current_user.id,
                 action="create_vocabularies",
@@ -2630,8 +2734,7 @@ async def read_personal_dictionaries(current_user: Annotated[schemas.User, Depen
     player_id = current_user.id
     personal_dictionaries = crud.get_personal_dictionaries(db, player_id=player_id)
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_personal_dictionary",
@@ -2678,8 +2781,7 @@ async def create_personal_dictionary(
             )
         )
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="create_personal_dictionary",
@@ -2708,8 +2810,7 @@ async def update_personal_dictionary(
         raise HTTPException(status_code=401, detail="Login to update personal dictionary")
     personal_dictionary.user_id = current_user.id
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="update_personal_dictionary",
@@ -2730,8 +2831,7 @@ async def delete_personal_dictionary(
     db: Session = Depends(get_db),
 ):
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="delete_personal_dictionary",
@@ -2764,8 +2864,7 @@ async def get_evaluation(
         round_id=db_generation.round_id
     )
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_evaluation",
@@ -2787,17 +2886,18 @@ async def get_evaluation(
 
             chatbot_obj = openai_chatbot.Hint_Chatbot(
                 model_name=db_round.model,
-                vocabularies=db_round.leaderboard.vocabularies,
+                system_prompt=openai_chatbot.hint_system_prompt(db_round.leaderboard),
+                leaderboard_id=db_round.leaderboard_id,
                 first_res_id=db_round.leaderboard.response_id,
                 prev_res_id=prev_res_ids[-1] if prev_res_ids else db_round.leaderboard.response_id,
                 prev_res_ids=prev_res_ids
             )
 
             descriptions = crud.get_description(db, leaderboard_id=db_round.leaderboard_id, model_name=db_round.model)
-            evaluation = chatbot_obj.get_result(
+            evaluation = await chatbot_obj.aget_result(
                 sentence=db_generation.sentence,
                 correct_sentence=db_generation.correct_sentence,
-                base64_image=db_round.leaderboard.original_image.image,
+                image=db_round.leaderboard.original_image,
                 grammar_errors=db_generation.grammar_errors,
                 spelling_errors=db_generation.spelling_errors,
                 descriptions=[des.content for des in descriptions]
@@ -2874,8 +2974,7 @@ async def read_chat(
     if chat is None:
         raise HTTPException(status_code=404, detail="Chat not found")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_chat",
@@ -2904,8 +3003,7 @@ async def read_chat_stats(
     if chat_stats is None:
         raise HTTPException(status_code=404, detail="Chat stats not found")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_chat_stats",
@@ -2920,23 +3018,17 @@ async def read_chat_stats(
 async def get_original_image(
     current_user: Annotated[schemas.User, Depends(get_current_user)],
     leaderboard_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: Session = Depends(get_db),
 ):
     if not current_user:
         raise HTTPException(status_code=401, detail="Login to view images")
-    db_leaderboard = crud.get_leaderboard(
-        db=db,
-        leaderboard_id=leaderboard_id
-    )
 
-    #decode base64 image
-    if db_leaderboard.original_image is None:
+    image = await load_image_cached(db, "original", leaderboard_id)
+    if image is None:
         raise HTTPException(status_code=404, detail="Original image not found")
 
-    imgdata = decode_image(db_leaderboard.original_image.image)
-
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_original_image",
@@ -2945,42 +3037,23 @@ async def get_original_image(
             received_at=datetime.datetime.now(tz=JST),
         )
     )
-    return responses.Response(
-        content=imgdata,
-        media_type="image/png"  # Adjust this based on your image type (jpeg, png, etc.)
-    )
+    return image_response(request, image)
 
 @app.get("/interpreted_image/{generation_id}", tags=["Image"])
 async def get_interpreted_image(
     current_user: Annotated[schemas.User, Depends(get_current_user)],
     generation_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: Session = Depends(get_db),
 ):
     if not current_user:
         raise HTTPException(status_code=401, detail="Login to view images")
 
-    db_generation = crud.get_generation(
-        db=db,
-        generation_id=generation_id
-    )
-
-    db_round = crud.get_round(
-        db=db,
-        round_id=db_generation.round_id
-    )
-
-    if db_generation is None or db_round is None:
-        raise HTTPException(status_code=404, detail="Generation or Round not found")
-
-    # if current_user.id != db_round.player_id and not current_user.is_admin:
-    #     raise HTTPException(status_code=401, detail="You are not authorized to view images")
-    if db_generation.interpreted_image is None:
+    image = await load_image_cached(db, "interpreted", generation_id)
+    if image is None:
         raise HTTPException(status_code=404, detail="Interpreted image not found")
 
-    imgdata = decode_image(db_generation.interpreted_image.image)
-
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_interpreted_image",
@@ -2989,28 +3062,24 @@ async def get_interpreted_image(
             received_at=datetime.datetime.now(tz=JST),
         )
     )
-    return responses.Response(
-        content=imgdata,
-        media_type="image/jpeg"  # Adjust this based on your image type (jpeg, png, etc.)
-    )
+    return image_response(request, image)
 
 @app.get("/generation/{generation_id}", tags=["Generation"], response_model=schemas.GenerationOut)
 async def read_generation(
     current_user: Annotated[schemas.User, Depends(get_current_user)],
     generation_id: int,
-    db: Session = Depends(get_db)
+    adb: AsyncSession = Depends(get_async_db)
 ):
     if not current_user:
         raise HTTPException(status_code=401, detail="Login to view generation")
-    db_generation = crud.get_generation(
-        db=db,
+    db_generation = await crud_async.get_generation(
+        db=adb,
         generation_id=generation_id
     )
     if db_generation is None:
         raise HTTPException(status_code=404, detail="Generation not found")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_generation_info",
@@ -3025,19 +3094,26 @@ async def read_generation(
 @app.get("/generations/", tags=["Generation"], response_model=list[Tuple[schemas.GenerationOut, schemas.RoundOut]])
 async def read_generations(
     current_user: Annotated[schemas.User, Depends(get_current_user)],
+    response: Response,
     player_id: Optional[int] = None,
     leaderboard_id: Optional[int] = None,
     program: Optional[str] = None,
     order_by: Optional[str] = "total_score",
-    skip: int = 0, limit: int = 100, db: Session = Depends(get_db)
+    skip: int = 0, limit: int = 100,
+    cursor: Optional[str] = None,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    db: Session = Depends(get_db)
 ):
     if not current_user:
         raise HTTPException(status_code=401, detail="Login to view generations")
     if player_id is not None and player_id != current_user.id and current_user.user_type == "student":
         raise HTTPException(status_code=401, detail="You are not authorized to view generations")
+    if order_by not in queries.GENERATION_ORDERS:
+        raise HTTPException(status_code=400, detail="order_by must be id or total_score")
+    page = pagination.keyset(order_by, cursor, before_id, after_id)
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_generations",
@@ -3055,9 +3131,11 @@ async def read_generations(
             limit=limit,
             player_id=player_id,
             leaderboard_id=leaderboard_id,
-            order_by=order_by
+            order_by=order_by,
+            before=page.before,
+            after=page.after,
         )
-
+        pagination.set_cursors(response, order_by, generations, pagination.generation_key(order_by), limit, page)
         return generations
     db_program = crud.get_program_by_name(db, program)
     if db_program is None:
@@ -3069,21 +3147,29 @@ async def read_generations(
         limit=limit,
         player_id=player_id,
         leaderboard_id=leaderboard_id,
-        order_by=order_by
+        order_by=order_by,
+        before=page.before,
+        after=page.after,
     )
+    pagination.set_cursors(response, order_by, generations, pagination.generation_key(order_by), limit, page)
     return generations
 
 @app.get("/my_generations/", tags=["Generation"], response_model=list[Tuple[schemas.GenerationOut, schemas.RoundOut]])
 async def read_my_generations(
     current_user: Annotated[schemas.User, Depends(get_current_user)],
+    response: Response,
     leaderboard_id: Optional[int] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
     db: Session = Depends(get_db),
 ):
     if not current_user:
         return []
+    page = pagination.keyset("id", cursor, before_id, after_id)
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_my_generations",
@@ -3094,12 +3180,15 @@ async def read_my_generations(
     player_id = current_user.id
     generations = crud.get_generations(
         db=db,
+        limit=limit,
         player_id=player_id,
         leaderboard_id=leaderboard_id,
+        before=page.before,
+        after=page.after,
     )
+    pagination.set_cursors(response, "id", generations, pagination.generation_key("id"), limit, page)
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view my generations",
@@ -3113,19 +3202,18 @@ async def read_my_generations(
 async def get_generation_score(
     current_user: Annotated[schemas.User, Depends(get_current_user)],
     generation_id: int,
-    db: Session = Depends(get_db)
+    adb: AsyncSession = Depends(get_async_db)
 ):
     if not current_user:
         raise HTTPException(status_code=401, detail="Login to view generation")
-    db_generation = crud.get_generation(
-        db=db,
+    db_generation = await crud_async.get_generation(
+        db=adb,
         generation_id=generation_id
     )
     if db_generation is None:
         raise HTTPException(status_code=404, detail="Generation not found")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="view_generation_score",
@@ -3135,11 +3223,8 @@ async def get_generation_score(
         )
     )
 
-    score = crud.get_score(
-        db=db,
-        generation_id=generation_id
-    )
-    return score
+    # loaded with the generation
+    return db_generation.score
 
 @app.get("/leaderboards/{leaderboard_id}/check_ok_to_start_new", tags=["Leaderboard"], response_model=schemas.LeaderboardStartNew)
 async def check_leaderboard_playrecord(
@@ -3151,8 +3236,7 @@ async def check_leaderboard_playrecord(
     if not current_user:
         raise HTTPException(status_code=401, detail="Login to check leaderboard")
 
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=current_user.id,
             action="check_leaderboard_no_play_record",
@@ -3311,11 +3395,12 @@ async def fix_error_task(
                 generation_dict = {
                     "id": db_generation.id,
                     "at": db_generation.created_at,
+                    "priority": llm_scheduler.BATCH,
                 }
 
                 chain_interpretation = celery_app.chain(
                     celery_app.group(
-                        generate_interpretation2.s(generation_id=db_generation.id, sentence=db_generation.sentence, at=db_generation.created_at),
+                        generate_interpretation2.s(generation_id=db_generation.id, sentence=db_generation.sentence, at=db_generation.created_at, priority=llm_scheduler.BATCH),
                     ),
                     celery_app.group(
                         calculate_score_gpt.s()
@@ -3334,6 +3419,7 @@ async def fix_error_task(
                 generation_dict = {
                     "id": db_generation.id,
                     "at": db_generation.created_at,
+                    "priority": llm_scheduler.BATCH,
                 }
                 calculate_score_gpt.s(
                     items=[generation_dict],
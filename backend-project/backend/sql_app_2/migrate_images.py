@@ -0,0 +1,95 @@
+"""Move legacy base64 images out of MySQL into the blob store.
+
+Usage (from the backend directory):
+
+    python -m sql_app_2.migrate_images --batch-size 100
+    python -m sql_app_2.migrate_images --table interpreted --keep-legacy
+
+Rows are streamed by primary key in batches so only one batch of payloads is
+held in memory at a time. Each batch is committed on its own, so the command
+can be interrupted and re-run; already migrated rows are skipped.
+"""
+import argparse, base64, logging
+
+from sqlalchemy import select, update
+
+from . import models
+from .database import SessionLocal2
+from .dependencies import blob_store
+
+logger = logging.getLogger("migrate_images")
+
+TABLES = {
+    "original": models.OriginalImage,
+    "interpreted": models.InterpretedImage,
+}
+
+
+def migrate_table(model, batch_size: int = 100, keep_legacy: bool = False, dry_run: bool = False) -> int:
+    migrated = 0
+    last_id = 0
+    db = SessionLocal2()
+    try:
+        while True:
+            rows = db.execute(
+                select(model.id, model.image).
+                where(model.id > last_id, model.storage_key == None, model.image != None).
+                order_by(model.id).
+                limit(batch_size)
+            ).all()
+            if not rows:
+                break
+
+            for image_id, image_str in rows:
+                last_id = image_id
+                try:
+                    data = base64.b64decode(image_str.split("base64,", 1)[-1])
+                except Exception as e:
+                    logger.error(f"{model.__tablename__} {image_id}: invalid base64 ({e})")
+                    continue
+                if dry_run:
+                    migrated += 1
+                    continue
+                blob = blob_store.put_image(data)
+                values = dict(
+                    storage_key=blob.key,
+                    mime_type=blob.mime_type,
+                    width=blob.width,
+                    height=blob.height,
+                    byte_size=blob.byte_size,
+                )
+                if not keep_legacy:
+                    values["image"] = None
+                db.execute(update(model).where(model.id == image_id).values(**values))
+                migrated += 1
+
+            if not dry_run:
+                db.commit()
+            logger.info(f"{model.__tablename__}: migrated {migrated} rows (last id {last_id})")
+    finally:
+        db.close()
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move base64 image columns into the blob store")
+    parser.add_argument("--table", choices=["original", "interpreted", "all"], default="all")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--keep-legacy", action="store_true", help="do not clear the base64 column after copying")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    tables = TABLES.keys() if args.table == "all" else [args.table]
+    for name in tables:
+        count = migrate_table(
+            TABLES[name],
+            batch_size=args.batch_size,
+            keep_legacy=args.keep_legacy,
+            dry_run=args.dry_run,
+        )
+        print(f"{name}: {count} images migrated")
+
+
+if __name__ == "__main__":
+    main()
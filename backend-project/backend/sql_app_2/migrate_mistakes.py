@@ -0,0 +1,87 @@
+"""Rewrite legacy grammar/spelling errors as JSON.
+
+Usage (from the backend directory):
+
+    python -m sql_app_2.migrate_mistakes --batch-size 500
+
+Older generations store the repr of the pydantic mistake lists. Reading them needs the
+syntax-tree parser in `sentence.str_to_list`; after this command every row is plain
+JSON. Rows are streamed by primary key and committed per batch, so the command can be
+interrupted and re-run; rows that are already JSON are left alone.
+"""
+import argparse, json, logging
+
+from sqlalchemy import select, update, or_
+
+from . import models
+from .database import SessionLocal2
+from .dependencies import sentence
+
+logger = logging.getLogger("migrate_mistakes")
+
+COLUMNS = ("grammar_errors", "spelling_errors")
+
+
+def _is_json(value: str) -> bool:
+    try:
+        json.loads(value)
+        return True
+    except json.JSONDecodeError:
+        return False
+
+
+def migrate(batch_size: int = 500, dry_run: bool = False) -> int:
+    migrated = 0
+    last_id = 0
+    db = SessionLocal2()
+    try:
+        while True:
+            rows = db.execute(
+                select(models.Generation.id, models.Generation.grammar_errors, models.Generation.spelling_errors).
+                where(
+                    models.Generation.id > last_id,
+                    or_(models.Generation.grammar_errors != None, models.Generation.spelling_errors != None),
+                ).
+                order_by(models.Generation.id).
+                limit(batch_size)
+            ).all()
+            if not rows:
+                break
+
+            for generation_id, *values in rows:
+                last_id = generation_id
+                changes = {}
+                for column, value in zip(COLUMNS, values):
+                    if not value or _is_json(value):
+                        continue
+                    try:
+                        changes[column] = sentence.mistakes_to_json(sentence.str_to_list(value))
+                    except (SyntaxError, ValueError, TypeError) as e:
+                        logger.error(f"generation {generation_id}: cannot parse {column} ({e})")
+                if not changes:
+                    continue
+                if not dry_run:
+                    db.execute(update(models.Generation).where(models.Generation.id == generation_id).values(**changes))
+                migrated += 1
+
+            if not dry_run:
+                db.commit()
+            logger.info(f"generations: migrated {migrated} rows (last id {last_id})")
+    finally:
+        db.close()
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rewrite legacy grammar/spelling errors as JSON")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    count = migrate(batch_size=args.batch_size, dry_run=args.dry_run)
+    print(f"{count} generations migrated")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, TEXT, Float
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, TEXT, Float, UniqueConstraint, Index
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.dialects.mysql import MEDIUMTEXT, LONGTEXT
 
 import datetime
@@ -9,6 +9,9 @@ from .database import Base
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_school_active", "school", "is_active"),
+    )
 
     id = Column(Integer, primary_key=True)
     lti = Column(Boolean, default=False)
@@ -89,6 +92,9 @@ class StorySchool(Base):
 
 class Leaderboard(Base):
     __tablename__ = "leaderboards"
+    __table_args__ = (
+        Index("ix_leaderboards_public_published", "is_public", "published_at"),
+    )
 
     id = Column(Integer, primary_key=True)
     title = Column(String(255), index=True)
@@ -166,6 +172,12 @@ class CourseUser(Base):
 
 class Round(Base): 
     __tablename__ = "rounds"
+    __table_args__ = (
+        # InnoDB appends the primary key, so equality on every column still reads in id order
+        Index("ix_rounds_leaderboard_completed", "leaderboard_id", "is_completed"),
+        Index("ix_rounds_player_leaderboard_completed", "player_id", "leaderboard_id", "is_completed"),
+        Index("ix_rounds_program_completed", "program_id", "is_completed"),
+    )
 
     id = Column(Integer, primary_key=True)
     chat_history=Column(Integer,ForeignKey("chats.id"))
@@ -191,6 +203,9 @@ class Round(Base):
 
 class Generation(Base): 
     __tablename__ = "generations"
+    __table_args__ = (
+        Index("ix_generations_round_completed_score", "round_id", "is_completed", "total_score"),
+    )
 
     id = Column(Integer, primary_key=True)
 
@@ -200,7 +215,7 @@ class Generation(Base):
     grammar_errors = Column(MEDIUMTEXT, nullable=True)
     spelling_errors = Column(MEDIUMTEXT, nullable=True)
 
-    total_score = Column(Integer, default=0,nullable=True)
+    total_score = Column(Integer, default=0, nullable=False, server_default="0")
     rank = Column(String(1), default='F',nullable=True)
     generated_time = Column(Integer, default=1,nullable=True)
 
@@ -208,6 +223,8 @@ class Generation(Base):
     duration = Column(Integer, default=0,nullable=True)
 
     is_completed = Column(Boolean, default=False)
+    # set once, when is_completed first turns true; the word clouds read generations in this order
+    completed_at = Column(DateTime, nullable=True)
     
     interpreted_image_id=Column(Integer,ForeignKey("interpreted_images.id"),nullable=True)
     round_id=Column(Integer,ForeignKey("rounds.id"))
@@ -241,6 +258,9 @@ class Chat(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_chat_sender", "chat_id", "sender"),
+    )
 
     id = Column(Integer, primary_key=True)
     chat_id = Column(Integer, ForeignKey("chats.id"))
@@ -298,7 +318,13 @@ class OriginalImage(Base):
     __tablename__ = "original_images"
 
     id = Column(Integer, primary_key=True)
-    image = Column(MEDIUMTEXT)
+    # legacy base64 payload, emptied by migrate_images once the blob is in the store
+    image = deferred(Column(MEDIUMTEXT, nullable=True))
+    storage_key = Column(String(64), index=True, nullable=True)
+    mime_type = Column(String(50), nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    byte_size = Column(Integer, nullable=True)
 
     leaderboard = relationship("Leaderboard", back_populates="original_image")
     
@@ -306,7 +332,13 @@ class InterpretedImage(Base):
     __tablename__ = "interpreted_images"
 
     id = Column(Integer, primary_key=True)
-    image = Column(MEDIUMTEXT)
+    # legacy base64 payload, emptied by migrate_images once the blob is in the store
+    image = deferred(Column(MEDIUMTEXT, nullable=True))
+    storage_key = Column(String(64), index=True, nullable=True)
+    mime_type = Column(String(50), nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    byte_size = Column(Integer, nullable=True)
 
     generation = relationship("Generation", back_populates="interpreted_image")
 
@@ -344,6 +376,10 @@ class Course(Base):
 
 class School_Leaderboard(Base):
     __tablename__ = "school_leaderboards"
+    __table_args__ = (
+        # covers the leaderboard list join: the rows are read from the index alone
+        Index("ix_school_leaderboards_school_course", "school", "course_id", "leaderboard_id"),
+    )
 
     id = Column(Integer, primary_key=True)
     school = Column(String(100))
@@ -358,8 +394,19 @@ class Task(Base):
     
     leaderboard_id = Column(Integer, ForeignKey("leaderboards.id"), nullable=True)
 
+    # progress of long running jobs such as word cloud builds
+    name = Column(String(100), index=True, nullable=True)
+    status = Column(String(20), nullable=True)  # 'pending', 'started', 'success', 'failure'
+    progress = Column(Integer, default=0, nullable=True)
+    total = Column(Integer, default=0, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+
 class User_Action(Base):
     __tablename__ = "user_actions"
+    __table_args__ = (
+        Index("ix_user_actions_user_action", "user_id", "action"),
+        Index("ix_user_actions_action", "action"),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -382,8 +429,26 @@ class WritingTrace(Base):
 # Analytics related models
 # These models are used to store items for vite app
 
+class TranslationCache(Base):
+    __tablename__ = "translation_cache"
+    __table_args__ = (
+        UniqueConstraint("text_hash", "target_lang", "model", name="uq_translation_cache_key"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    text_hash = Column(String(64), index=True)  # sha256 of the normalized source text
+    target_lang = Column(String(5))
+    model = Column(String(50))
+    source_text = Column(MEDIUMTEXT)
+    translated_text = Column(MEDIUMTEXT)
+    created_at = Column(DateTime, default=datetime.datetime.now)
+
 class MistakeWordCloudItem(Base):
     __tablename__ = "mistake_word_cloud_items"
+    __table_args__ = (
+        # lets refreshes upsert with INSERT ... ON DUPLICATE KEY UPDATE
+        UniqueConstraint("word_cloud_id", "word", name="uq_mistake_word_cloud_items_cloud_word"),
+    )
 
     id = Column(Integer, primary_key=True)
     word = Column(String(255), index=True)
@@ -401,6 +466,10 @@ class MistakeWordCloudItemGeneration(Base):
 
 class WritingWordCloudItem(Base):
     __tablename__ = "writing_word_cloud_items"
+    __table_args__ = (
+        # lets refreshes upsert with INSERT ... ON DUPLICATE KEY UPDATE
+        UniqueConstraint("word_cloud_id", "word", name="uq_writing_word_cloud_items_cloud_word"),
+    )
 
     id = Column(Integer, primary_key=True)
     word = Column(String(255), index=True)
@@ -418,6 +487,10 @@ class WritingWordCloudItemGeneration(Base):
 
 class UserChatWordCloudItem(Base):
     __tablename__ = "user_chat_word_cloud_items"
+    __table_args__ = (
+        # lets refreshes upsert with INSERT ... ON DUPLICATE KEY UPDATE
+        UniqueConstraint("word_cloud_id", "word", name="uq_user_chat_word_cloud_items_cloud_word"),
+    )
 
     id = Column(Integer, primary_key=True)
     word = Column(String(255), index=True)
@@ -435,6 +508,10 @@ class UserChatWordCloudItemChat(Base):
 
 class AssistantChatWordCloudItem(Base):
     __tablename__ = "assistant_chat_word_cloud_items"
+    __table_args__ = (
+        # lets refreshes upsert with INSERT ... ON DUPLICATE KEY UPDATE
+        UniqueConstraint("word_cloud_id", "word", name="uq_assistant_chat_word_cloud_items_cloud_word"),
+    )
 
     id = Column(Integer, primary_key=True)
     word = Column(String(255), index=True)
@@ -461,7 +538,9 @@ class WordCloud(Base):
     assistant_chat_word_cloud_items = relationship("AssistantChatWordCloudItem", back_populates="word_cloud")
     
     last_updated = Column(DateTime, default=datetime.datetime.now())
+    # watermark: last message id, or last (completed_at, id) of a generation cloud
     latest_generation_id = Column(Integer)
+    latest_completed_at = Column(DateTime, nullable=True)
 
 class Leaderboard_Analysis(Base):
     __tablename__ = "leaderboard_analysis"
@@ -480,3 +559,57 @@ class LeaderboardAnalysis_WordCloud(Base):
     type = Column(String(50), index=True)  # 'mistake', 'writing', 'user_chat', 'assistant_chat'
     lang = Column(String(5), index=True)  # 'en', 'ja', etc.
 
+
+# summary tables kept current by the writers in crud/crud_async and repaired by tasks.reconcile_stats (see stats.py)
+class LeaderboardRoundStats(Base):
+    __tablename__ = "leaderboard_round_stats"
+
+    # a player without a school or program is stored under "" and 0
+    leaderboard_id = Column(Integer, primary_key=True, autoincrement=False)
+    school = Column(String(100), primary_key=True)
+    user_type = Column(String(25), primary_key=True)
+    program_id = Column(Integer, primary_key=True, autoincrement=False)
+
+    n_rounds = Column(Integer, nullable=False, server_default="0")
+    # completed generations; max_score only grows until the next reconciliation
+    n_generations = Column(Integer, nullable=False, server_default="0")
+    score_sum = Column(Integer, nullable=False, server_default="0")
+    max_score = Column(Integer, nullable=False, server_default="0")
+    rank_a = Column(Integer, nullable=False, server_default="0")
+    rank_b = Column(Integer, nullable=False, server_default="0")
+    rank_c = Column(Integer, nullable=False, server_default="0")
+    rank_d = Column(Integer, nullable=False, server_default="0")
+    rank_e = Column(Integer, nullable=False, server_default="0")
+    rank_f = Column(Integer, nullable=False, server_default="0")
+
+class PlayerStats(Base):
+    __tablename__ = "player_stats"
+
+    player_id = Column(Integer, primary_key=True, autoincrement=False)
+    leaderboard_id = Column(Integer, primary_key=True, autoincrement=False)
+
+    n_rounds = Column(Integer, nullable=False, server_default="0")
+    n_generations = Column(Integer, nullable=False, server_default="0")
+    score_sum = Column(Integer, nullable=False, server_default="0")
+    max_score = Column(Integer, nullable=False, server_default="0")
+
+class ChatStats(Base):
+    __tablename__ = "chat_stats"
+
+    chat_id = Column(Integer, primary_key=True, autoincrement=False)
+
+    n_messages = Column(Integer, nullable=False, server_default="0")
+    n_user_messages = Column(Integer, nullable=False, server_default="0")
+    n_assistant_messages = Column(Integer, nullable=False, server_default="0")
+    n_hints = Column(Integer, nullable=False, server_default="0")
+    n_evaluations = Column(Integer, nullable=False, server_default="0")
+
+class SchoolUserStats(Base):
+    __tablename__ = "school_user_stats"
+
+    school = Column(String(100), primary_key=True)
+    # 0 counts the whole school
+    course_id = Column(Integer, primary_key=True, autoincrement=False)
+
+    n_users = Column(Integer, nullable=False, server_default="0")
+    n_active_users = Column(Integer, nullable=False, server_default="0")
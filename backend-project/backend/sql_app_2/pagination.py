@@ -0,0 +1,93 @@
+"""Keyset pagination for the list endpoints.
+
+A page is the `limit` rows that follow a sort key, not the rows after an offset, so a deep
+page costs the same as the first one. Every listing sorts descending on an ordering that
+ends in a unique id:
+
+- `id`: (id)
+- `total_score`: (total_score, id)
+- `published_at`: (published_at, leaderboard id, school link id)
+
+Responses carry opaque tokens in `X-Next-Cursor` (older rows, after the last row) and
+`X-Prev-Cursor` (newer rows, before the first row). Pass one back as `cursor`. For the `id`
+ordering, `before_id` and `after_id` do the same with a plain id.
+"""
+import base64, binascii, datetime, json
+from typing import Callable, List, NamedTuple, Optional, Sequence
+
+from fastapi import HTTPException, Response
+
+BEFORE = "before"
+AFTER = "after"
+
+# how each ordering's key is read back from JSON
+ORDERS = {
+    "id": (int,),
+    "total_score": (int, int),
+    "published_at": (datetime.datetime.fromisoformat, int, int),
+}
+
+
+class Keyset(NamedTuple):
+    """Key values of the row a page starts after (`before`) or ends before (`after`)."""
+    before: Optional[list] = None
+    after: Optional[list] = None
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime.datetime) else value
+
+
+def encode(order: str, direction: str, key: Sequence) -> str:
+    payload = json.dumps({"o": order, "d": direction, "k": [_json_value(v) for v in key]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode(token: str, order: str) -> Keyset:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        parsers = ORDERS[payload["o"]]
+        if payload["o"] != order or payload["d"] not in (BEFORE, AFTER) or len(payload["k"]) != len(parsers):
+            raise ValueError
+        key = [parse(value) for parse, value in zip(parsers, payload["k"])]
+    except (binascii.Error, KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Invalid cursor for order_by={order}")
+    return Keyset(before=key) if payload["d"] == BEFORE else Keyset(after=key)
+
+
+def keyset(order: str, cursor: Optional[str] = None, before_id: Optional[int] = None, after_id: Optional[int] = None) -> Keyset:
+    if cursor is not None:
+        return decode(cursor, order)
+    if before_id is None and after_id is None:
+        return Keyset()
+    if order != "id":
+        raise HTTPException(status_code=400, detail="before_id and after_id need order_by=id; use cursor instead")
+    if before_id is not None:
+        return Keyset(before=[before_id])
+    return Keyset(after=[after_id])
+
+
+def set_cursors(response: Response, order: str, rows: List, key: Callable, limit: int, page: Keyset = Keyset()) -> None:
+    """Next/previous page tokens for `rows`; `key(row)` gives the row's sort key."""
+    if not rows:
+        return
+    # a full page may have more rows behind it; a short one after `after` is the newest page
+    if len(rows) >= limit or page.after is not None:
+        response.headers["X-Next-Cursor"] = encode(order, BEFORE, key(rows[-1]))
+    if page.before is not None or page.after is not None and len(rows) >= limit:
+        response.headers["X-Prev-Cursor"] = encode(order, AFTER, key(rows[0]))
+
+
+def round_key(db_round) -> list:
+    return [db_round.id]
+
+
+def generation_key(order: str) -> Callable:
+    if order == "total_score":
+        return lambda row: [row[0].total_score, row[0].id]
+    return lambda row: [row[0].id]
+
+
+def leaderboard_key(row) -> list:
+    leaderboard, school = row
+    return [leaderboard.published_at, leaderboard.id, school.id]
@@ -0,0 +1,182 @@
+"""Composable statements for the leaderboard, round and generation listings.
+
+A listing starts from a base select() and adds one step per filter whose argument was given;
+list and count variants share the steps, so a new filter is one more step instead of another
+copy of every branch. The steps are lambda statements: SQLAlchemy caches each step by its
+code location, so a statement is built and compiled once per combination of filters and
+later calls only bind the values.
+
+`page` sorts and pages a statement by an `Ordering` (see pagination). The keyset conditions
+use the bind parameters key_0, key_1..., so they are compiled once as well.
+"""
+from typing import List, Optional
+
+from sqlalchemy import and_, bindparam, func, lambda_stmt, or_, select
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.sql.lambdas import StatementLambdaElement
+
+from . import models
+
+
+def _key_beyond(columns, key, descending: bool):
+    # (a, b) < (x, y) spelled out as a < x OR (a = x AND b < y), which MySQL turns into index ranges
+    *head, last = zip(columns, key)
+    column, value = last
+    condition = column < value if descending else column > value
+    for column, value in reversed(head):
+        beyond = column < value if descending else column > value
+        condition = or_(beyond, and_(column == value, condition))
+    return condition
+
+
+class Ordering:
+    """Descending sort on `columns`, which must end in a unique id."""
+
+    def __init__(self, *columns):
+        self.columns = columns
+        key = [bindparam(f"key_{i}") for i in range(len(columns))]
+        self.before = _key_beyond(columns, key, descending=True)
+        self.after = _key_beyond(columns, key, descending=False)
+        self.desc = tuple(column.desc() for column in columns)
+        self.asc = tuple(column.asc() for column in columns)
+
+
+LEADERBOARD_ORDER = Ordering(models.Leaderboard.published_at, models.Leaderboard.id, models.School_Leaderboard.id)
+ROUND_ORDER = Ordering(models.Round.id)
+GENERATION_ORDERS = {
+    "id": Ordering(models.Generation.id),
+    "total_score": Ordering(models.Generation.total_score, models.Generation.id),
+}
+
+
+def page(
+        db: Session,
+        stmt: StatementLambdaElement,
+        order: Ordering,
+        limit: int,
+        skip: int = 0,
+        before: Optional[list] = None,
+        after: Optional[list] = None,
+        scalars: bool = False,
+) -> List:
+    """`before` is the key of the last row of the previous page, `after` the key of the first
+    row of the next one. Without either the page starts at `skip`."""
+    key = after if after is not None else before
+    if key is not None:
+        condition = order.after if after is not None else order.before
+        stmt += lambda s: s.where(condition)
+        skip = 0
+    sort = order.asc if after is not None else order.desc
+    stmt += lambda s: s.order_by(*sort).offset(skip).limit(limit)
+
+    result = db.execute(stmt, {f"key_{i}": value for i, value in enumerate(key or ())})
+    rows = result.scalars().all() if scalars else result.all()
+    # `after` reads upwards from the key; the page is returned newest first like the others
+    return rows[::-1] if after is not None else rows
+
+
+def leaderboards(
+        school_name: Optional[str] = None,
+        course_id: Optional[int] = None,
+        published_at_start=None,
+        published_at_end=None,
+        is_public: Optional[bool] = None,
+        created_by_id: Optional[int] = None,
+) -> StatementLambdaElement:
+    stmt = lambda_stmt(lambda: select(
+        models.Leaderboard,
+        models.School_Leaderboard,
+    ).select_from(
+        models.School_Leaderboard,
+    ).join(
+        models.Leaderboard,
+        models.Leaderboard.id == models.School_Leaderboard.leaderboard_id,
+    ).options(
+        selectinload(models.Leaderboard.scene),
+        selectinload(models.Leaderboard.story),
+        selectinload(models.Leaderboard.created_by),
+        selectinload(models.Leaderboard.vocabularies),
+        selectinload(models.Leaderboard.original_image),
+    ))
+    if school_name:
+        stmt += lambda s: s.where(models.School_Leaderboard.school == school_name)
+    if course_id:
+        stmt += lambda s: s.where(models.School_Leaderboard.course_id == course_id)
+    if is_public is not None:
+        stmt += lambda s: s.where(models.Leaderboard.is_public == is_public)
+    if created_by_id is not None:
+        stmt += lambda s: s.where(models.Leaderboard.created_by_id == created_by_id)
+    if published_at_start is not None:
+        stmt += lambda s: s.where(models.Leaderboard.published_at >= published_at_start)
+    if published_at_end is not None:
+        stmt += lambda s: s.where(models.Leaderboard.published_at <= published_at_end)
+    return stmt
+
+
+def _round_filters(
+        stmt: StatementLambdaElement,
+        player_id: Optional[int] = None,
+        leaderboard_id: Optional[int] = None,
+        program_id: Optional[int] = None,
+        is_completed: Optional[bool] = None,
+        school_name: Optional[str] = None,
+        students_only: bool = False,
+) -> StatementLambdaElement:
+    # school_name and students_only need models.User in the statement
+    if program_id:
+        stmt += lambda s: s.where(models.Round.program_id == program_id)
+    if leaderboard_id:
+        stmt += lambda s: s.where(models.Round.leaderboard_id == leaderboard_id)
+    if player_id:
+        stmt += lambda s: s.where(models.Round.player_id == player_id)
+    if is_completed is not None:
+        stmt += lambda s: s.where(models.Round.is_completed == is_completed)
+    if school_name:
+        stmt += lambda s: s.where(models.User.school == school_name)
+    if students_only:
+        stmt += lambda s: s.where(models.User.user_type == "student")
+    return stmt
+
+
+def rounds(**filters) -> StatementLambdaElement:
+    return _round_filters(lambda_stmt(lambda: select(models.Round)), **filters)
+
+
+def rounds_with_players(**filters) -> StatementLambdaElement:
+    """(Round, User) rows."""
+    return _round_filters(lambda_stmt(lambda: select(
+        models.Round,
+        models.User,
+    ).join(
+        models.User,
+        models.Round.player_id == models.User.id,
+    )), **filters)
+
+
+def count_rounds_with_players(**filters) -> StatementLambdaElement:
+    return _round_filters(lambda_stmt(lambda: select(
+        func.count(models.Round.id),
+    ).select_from(
+        models.Round,
+    ).join(
+        models.User,
+        models.Round.player_id == models.User.id,
+    )), **filters)
+
+
+def generations(
+        player_id: Optional[int] = None,
+        leaderboard_id: Optional[int] = None,
+        program_id: Optional[int] = None,
+) -> StatementLambdaElement:
+    """Completed (Generation, Round) rows."""
+    stmt = lambda_stmt(lambda: select(
+        models.Generation,
+        models.Round,
+    ).join(
+        models.Round,
+        models.Generation.round_id == models.Round.id,
+    ).where(
+        models.Generation.is_completed == True,
+    ))
+    return _round_filters(stmt, player_id=player_id, leaderboard_id=leaderboard_id, program_id=program_id)
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field, field_validator
 
 import datetime
-from typing import Optional, List, Tuple, Any
+from typing import Optional, List, Tuple, Any, Dict
 
 class TaskStatus(BaseModel):
     id: str
@@ -325,6 +325,7 @@ class Score(ScoreCreate):
 class GenerationComplete(BaseModel):
     id: int
 
+    correct_sentence: Optional[str] = None
     grammar_errors: Optional[str] = None
     spelling_errors: Optional[str] = None
     evaluation_id: Optional[int] = None
@@ -517,6 +518,7 @@ class LeaderboardOut(LeaderboardBase):
         orm_mode = True
 
 class SchoolOut(BaseModel):
+    id: Optional[int]=None
     school: str
     course_id: Optional[int]=None
 
@@ -581,6 +583,27 @@ class Task(BaseModel):
     id: str
     generation_id: Optional[int]=None
     leaderboard_id: Optional[int]=None
+    name: Optional[str]=None
+    status: Optional[str]=None
+    progress: Optional[int]=None
+    total: Optional[int]=None
+
+class TaskUpdate(BaseModel):
+    id: str
+    status: Optional[str]=None
+    progress: Optional[int]=None
+    total: Optional[int]=None
+
+class TaskProgress(BaseModel):
+    id: str
+    name: Optional[str]=None
+    status: Optional[str]=None
+    progress: Optional[int]=None
+    total: Optional[int]=None
+    updated_at: Optional[datetime.datetime]=None
+
+    class Config:
+        orm_mode = True
 
 class UserActionBase(BaseModel):
     user_id: int
@@ -588,6 +611,7 @@ class UserActionBase(BaseModel):
     related_id: Optional[int]=None
     sent_at : Optional[datetime.datetime]=None
     received_at : Optional[datetime.datetime]=None
+    responded_at : Optional[datetime.datetime]=None
 
 class UserActionCreate(BaseModel):
     action: str
@@ -608,12 +632,19 @@ class UsersStats(BaseModel):
     n_active_users: int
 
 class ChatStats(BaseModel):
-    n_messages: int
-    n_user_messages: int
-    n_assistant_messages: int
+    n_messages: int = 0
+    n_user_messages: int = 0
+    n_assistant_messages: int = 0
+    n_hints: int = 0
+    n_evaluations: int = 0
 
 class LeaderboardStats(BaseModel):
     n_rounds: int
+    n_generations: int = 0
+    average_score: Optional[float] = None
+    max_score: int = 0
+    # generations per rank, A to F
+    rank_distribution: Optional[Dict[str, int]] = None
 
 class LeaderboardsStats(BaseModel):
     n_leaderboards: int
@@ -667,6 +698,7 @@ class LeaderboardAnalysis(BaseModel):
     writing_word_cloud_id: Optional[int] = None
     user_chat_word_cloud_id: Optional[int] = None
     assistant_chat_word_cloud_id: Optional[int] = None
+    word_cloud_tasks: List[TaskProgress] = []
 
 # class for analysis - crud operations
 class WordCloudItemCreate(BaseModel):
@@ -683,6 +715,7 @@ class WordCloudUpdate(BaseModel):
     id: int
     last_updated: Optional[datetime.datetime] = None
     latest_generation_id: Optional[int] = None
+    latest_completed_at: Optional[datetime.datetime] = None
     items: List[WordCloudItemCreate] = []
 
 class LeaderboardAnalysisCreate(BaseModel):
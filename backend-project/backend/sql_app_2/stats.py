@@ -0,0 +1,253 @@
+"""Summary tables behind the stats endpoints.
+
+Each stats endpoint reads one row, or a primary-key range of a few rows, instead of a
+COUNT(*) over joins:
+
+- LeaderboardRoundStats: rounds, completed generations, score sum/max and rank counts per
+  leaderboard, player school, player type and program
+- PlayerStats: the same per player and leaderboard
+- ChatStats: messages, hints and evaluations per chat (one chat per round)
+- SchoolUserStats: users per school, and per course within it
+
+The writers in crud and crud_async execute the statements built here in the same
+transaction as the rows they write, so a summary commits or rolls back with its source.
+Round and message counters and the generation score columns are incremental upserts. The
+user counts are recounted for the school that changed, since user writes are rare.
+
+`reconcile` recomputes every table from its source tables and repairs the rows that drifted
+(deleted rounds or users, a score rewritten outside crud, a player who changed school...).
+tasks.reconcile_stats runs it nightly.
+"""
+import logging
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import case, delete, func, literal, select, tuple_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+RANKS = ("A", "B", "C", "D", "E", "F")
+RECONCILE_BATCH = 1000
+
+_school = func.coalesce(models.User.school, "")
+_user_type = func.coalesce(models.User.user_type, "")
+_program = func.coalesce(models.Round.program_id, 0)
+_score = func.coalesce(models.Generation.total_score, 0)
+
+
+def execute(db: Session, statements: Iterable) -> None:
+    for statement in statements:
+        db.execute(statement)
+
+
+def _add(table, columns: Iterable[str], inserted) -> dict:
+    return {column: getattr(table, column) + getattr(inserted, column) for column in columns}
+
+
+def round_started(player_id: int, leaderboard_id: int, program_id: Optional[int]) -> List:
+    leaderboard_row = mysql_insert(models.LeaderboardRoundStats).from_select(
+        ["leaderboard_id", "school", "user_type", "program_id", "n_rounds"],
+        select(literal(leaderboard_id), _school, _user_type, literal(program_id or 0), literal(1)).
+        where(models.User.id == player_id),
+    )
+    player_row = mysql_insert(models.PlayerStats).values(player_id=player_id, leaderboard_id=leaderboard_id, n_rounds=1)
+    return [
+        leaderboard_row.on_duplicate_key_update(n_rounds=models.LeaderboardRoundStats.n_rounds + 1),
+        player_row.on_duplicate_key_update(n_rounds=models.PlayerStats.n_rounds + 1),
+    ]
+
+
+def generation_counted(generation_id: int, sign: int = 1) -> List:
+    """Add (sign=1) or take back (sign=-1) the score of a completed generation."""
+    ranks = [case((models.Generation.rank == rank, sign), else_=0) for rank in RANKS]
+    leaderboard_row = mysql_insert(models.LeaderboardRoundStats).from_select(
+        ["leaderboard_id", "school", "user_type", "program_id", "n_generations", "score_sum", "max_score"]
+        + [f"rank_{rank.lower()}" for rank in RANKS],
+        select(models.Round.leaderboard_id, _school, _user_type, _program, literal(sign), _score * sign, _score, *ranks).
+        select_from(models.Generation).
+        join(models.Round, models.Generation.round_id == models.Round.id).
+        join(models.User, models.User.id == models.Round.player_id).
+        where(models.Generation.id == generation_id),
+    )
+    player_row = mysql_insert(models.PlayerStats).from_select(
+        ["player_id", "leaderboard_id", "n_generations", "score_sum", "max_score"],
+        select(models.Round.player_id, models.Round.leaderboard_id, literal(sign), _score * sign, _score).
+        select_from(models.Generation).
+        join(models.Round, models.Generation.round_id == models.Round.id).
+        where(models.Generation.id == generation_id),
+    )
+    score_columns = ["n_generations", "score_sum"]
+    return [
+        leaderboard_row.on_duplicate_key_update(
+            **_add(models.LeaderboardRoundStats, score_columns + [f"rank_{rank.lower()}" for rank in RANKS], leaderboard_row.inserted),
+            max_score=func.greatest(models.LeaderboardRoundStats.max_score, leaderboard_row.inserted.max_score),
+        ),
+        player_row.on_duplicate_key_update(
+            **_add(models.PlayerStats, score_columns, player_row.inserted),
+            max_score=func.greatest(models.PlayerStats.max_score, player_row.inserted.max_score),
+        ),
+    ]
+
+
+def generation_updated(db_generation: models.Generation, values: dict):
+    """(before, after) statements around an update of `db_generation` with `values`.
+
+    Only completed generations count. `before` takes back the old score and must run
+    before the UPDATE; `after` adds the new one and must run after it is flushed.
+    """
+    was_completed = bool(db_generation.is_completed)
+    is_completed = bool(values.get("is_completed", was_completed))
+    rescored = "total_score" in values or "rank" in values
+    before = generation_counted(db_generation.id, -1) if was_completed and (rescored or not is_completed) else []
+    after = generation_counted(db_generation.id, 1) if is_completed and (rescored or not was_completed) else []
+    return before, after
+
+
+def messages_added(chat_id: int, messages: Iterable) -> List:
+    """`messages` are Message rows or MessageBase schemas."""
+    messages = list(messages)
+    if not messages:
+        return []
+    counts = {
+        "n_messages": len(messages),
+        "n_user_messages": sum(message.sender == "user" for message in messages),
+        "n_assistant_messages": sum(message.sender == "assistant" for message in messages),
+        "n_hints": sum(bool(message.is_hint) for message in messages),
+        "n_evaluations": sum(bool(message.is_evaluation) for message in messages),
+    }
+    row = mysql_insert(models.ChatStats).values(chat_id=chat_id, **counts)
+    return [row.on_duplicate_key_update(**_add(models.ChatStats, counts, row.inserted))]
+
+
+def school_users(school: Optional[str], course_id: Optional[int] = None) -> List:
+    """Recount the users of `school`, or of one of its courses."""
+    users = select(
+        literal(school or ""),
+        literal(course_id or 0),
+        func.count(models.User.id),
+        func.coalesce(func.sum(case((models.User.is_active == True, 1), else_=0)), 0),
+    ).where(models.User.school == school if school else _school == "")
+    if course_id:
+        users = users.join(models.CourseUser, models.CourseUser.user_id == models.User.id).\
+            where(models.CourseUser.course_id == course_id)
+    row = mysql_insert(models.SchoolUserStats).from_select(
+        ["school", "course_id", "n_users", "n_active_users"], users,
+    )
+    return [row.on_duplicate_key_update(n_users=row.inserted.n_users, n_active_users=row.inserted.n_active_users)]
+
+
+def user_courses(db: Session, user_id: int) -> List[int]:
+    return [course_id for (course_id,) in db.query(models.CourseUser.course_id).filter(models.CourseUser.user_id == user_id)]
+
+
+# the true values of every summary row, keyed like the table
+def _leaderboard_rounds_source():
+    return select(
+        models.Round.leaderboard_id,
+        _school,
+        _user_type,
+        _program,
+        func.count(func.distinct(models.Round.id)),
+        func.count(models.Generation.id),
+        func.coalesce(func.sum(_score), 0),
+        func.coalesce(func.max(models.Generation.total_score), 0),
+        *[func.coalesce(func.sum(case((models.Generation.rank == rank, 1), else_=0)), 0) for rank in RANKS],
+    ).select_from(models.Round).\
+        join(models.User, models.User.id == models.Round.player_id).\
+        outerjoin(models.Generation, (models.Generation.round_id == models.Round.id) & (models.Generation.is_completed == True)).\
+        where(models.Round.leaderboard_id.isnot(None)).\
+        group_by(models.Round.leaderboard_id, _school, _user_type, _program)
+
+
+def _players_source():
+    return select(
+        models.Round.player_id,
+        models.Round.leaderboard_id,
+        func.count(func.distinct(models.Round.id)),
+        func.count(models.Generation.id),
+        func.coalesce(func.sum(_score), 0),
+        func.coalesce(func.max(models.Generation.total_score), 0),
+    ).select_from(models.Round).\
+        outerjoin(models.Generation, (models.Generation.round_id == models.Round.id) & (models.Generation.is_completed == True)).\
+        where(models.Round.player_id.isnot(None)).\
+        where(models.Round.leaderboard_id.isnot(None)).\
+        group_by(models.Round.player_id, models.Round.leaderboard_id)
+
+
+def _chats_source():
+    return select(
+        models.Message.chat_id,
+        func.count(models.Message.id),
+        func.sum(case((models.Message.sender == "user", 1), else_=0)),
+        func.sum(case((models.Message.sender == "assistant", 1), else_=0)),
+        func.sum(case((models.Message.is_hint == True, 1), else_=0)),
+        func.sum(case((models.Message.is_evaluation == True, 1), else_=0)),
+    ).where(models.Message.chat_id.isnot(None)).\
+        group_by(models.Message.chat_id)
+
+
+def _school_users_source(db: Session):
+    active = func.sum(case((models.User.is_active == True, 1), else_=0))
+    schools = db.execute(
+        select(_school, literal(0), func.count(models.User.id), active).group_by(_school)
+    ).all()
+    courses = db.execute(
+        select(_school, models.CourseUser.course_id, func.count(models.User.id), active).
+        join(models.CourseUser, models.CourseUser.user_id == models.User.id).
+        group_by(_school, models.CourseUser.course_id)
+    ).all()
+    return schools + courses
+
+
+SUMMARIES = {
+    models.LeaderboardRoundStats: lambda db: db.execute(_leaderboard_rounds_source()).all(),
+    models.PlayerStats: lambda db: db.execute(_players_source()).all(),
+    models.ChatStats: lambda db: db.execute(_chats_source()).all(),
+    models.SchoolUserStats: _school_users_source,
+}
+
+
+def _reconcile_table(db: Session, table, source_rows) -> int:
+    key_columns = [column.name for column in table.__table__.primary_key.columns]
+    columns = [column.name for column in table.__table__.columns]
+    value_columns = [name for name in columns if name not in key_columns]
+
+    expected = {}
+    for row in source_rows:
+        # MySQL returns SUM() as a Decimal
+        values = dict(zip(columns, (int(value) if isinstance(value, Decimal) else value for value in row)))
+        expected[tuple(values[name] for name in key_columns)] = values
+    stored = {
+        tuple(row[name] for name in key_columns): dict(row)
+        for row in db.execute(select(table.__table__)).mappings()
+    }
+
+    changed = [values for key, values in expected.items() if stored.get(key) != values]
+    removed = [key for key in stored if key not in expected]
+    for start in range(0, len(changed), RECONCILE_BATCH):
+        rows = mysql_insert(table).values(changed[start:start + RECONCILE_BATCH])
+        db.execute(rows.on_duplicate_key_update(**{name: getattr(rows.inserted, name) for name in value_columns}))
+    key = tuple_(*[getattr(table, name) for name in key_columns])
+    for start in range(0, len(removed), RECONCILE_BATCH):
+        db.execute(delete(table).where(key.in_(removed[start:start + RECONCILE_BATCH])))
+    return len(changed) + len(removed)
+
+
+def reconcile(db: Session) -> Dict[str, int]:
+    """Rewrite the summary rows that differ from their source; returns repaired rows per table.
+
+    Run it when few rounds are being played: an increment committed between the recount
+    and the repair of its row would be lost until the next run.
+    """
+    repaired = {}
+    for table, source in SUMMARIES.items():
+        repaired[table.__tablename__] = _reconcile_table(db, table, source(db))
+        db.commit()
+    drifted = {name: count for name, count in repaired.items() if count}
+    if drifted:
+        logger.warning(f"Stats reconciliation repaired {drifted}")
+    return repaired
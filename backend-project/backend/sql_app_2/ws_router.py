@@ -1,25 +1,26 @@
 import logging.config
 from fastapi import Depends, APIRouter, HTTPException, responses, status, WebSocket, WebSocketDisconnect, Request
 from fastapi.templating import Jinja2Templates
-import os
 import zoneinfo
-from threading import RLock
 
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import parse_obj_as
 from sqlalchemy.orm import Session
-import datetime, json, asyncio #, yappi
+from sqlalchemy.ext.asyncio import AsyncSession
+import datetime, asyncio #, yappi
+from types import SimpleNamespace
 import numpy as np
-from cachetools import TTLCache
 
-from . import crud, schemas
+from . import caches, crud, crud_async, schemas
 from tasks import app as celery_app
-from tasks import generateDescription2, generate_interpretation2, calculate_score_gpt
-from .database import SessionLocal2, engine2
+from tasks import generateDescription2, generate_interpretation2, calculate_score_gpt, request_word_cloud_refresh
+from .database import SessionLocal2, engine2, AsyncSessionLocal2
+from .action_buffer import user_actions
 
-from .dependencies import sentence, openai_chatbot
+from .dependencies import sentence, openai_chatbot, round_events, round_session
 from .authentication import authenticate_user, authenticate_user_2, create_access_token, oauth2_scheme, SECRET_KEY_WS, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, create_refresh_token, JWTError, jwt, create_ws_token
 from util import *
+import instrumentation
 
 from typing import Annotated, Optional
 from contextlib import asynccontextmanager
@@ -34,42 +35,37 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal2() as adb:
+        yield adb
+
 router = APIRouter(
     prefix="/ws",
 )
 
 JST = zoneinfo.ZoneInfo("Asia/Tokyo")
 
-WS_USER_CACHE_TTL = int(os.getenv("WS_USER_CACHE_TTL", os.getenv("USER_CACHE_TTL", "10")))
-WS_USER_CACHE_MAXSIZE = int(os.getenv("WS_USER_CACHE_MAXSIZE", os.getenv("USER_CACHE_MAXSIZE", "2048")))
-
-ws_user_cache = TTLCache(maxsize=WS_USER_CACHE_MAXSIZE, ttl=WS_USER_CACHE_TTL)
-ws_user_cache_lock = RLock()
-
-
-def _get_cached_user(username: str) -> Optional[schemas.User]:
-    with ws_user_cache_lock:
-        return ws_user_cache.get(username)
-
-
-def _cache_user(username: str, user: schemas.User) -> None:
-    with ws_user_cache_lock:
-        ws_user_cache[username] = user
+# span and metric names of the round socket; anything else the client sends is "unknown"
+WS_ACTIONS = ("hint", "change_display_name", "submit", "evaluate", "end")
 
 
-async def _load_user_by_username(db: Session, username: str) -> Optional[schemas.User]:
-    cached_user = _get_cached_user(username)
-    if cached_user:
-        return cached_user
+async def _load_user_by_username(username: str) -> Optional[schemas.User]:
+    # the REST routes share this cache, so a login or profile change is seen here too
+    inactive_user = None
 
-    db_user = await asyncio.to_thread(crud.get_user_by_username, db, username=username)
-    if db_user is None:
+    async def load():
+        nonlocal inactive_user
+        async with AsyncSessionLocal2() as adb:
+            db_user = await crud_async.get_user_by_username(adb, username=username)
+        if db_user is None:
+            return None
+        user_schema = schemas.User.model_validate(db_user, from_attributes=True)
+        if user_schema.is_active:
+            return user_schema
+        inactive_user = user_schema
         return None
 
-    user_schema = schemas.User.model_validate(db_user, from_attributes=True)
-    if user_schema.is_active:
-        _cache_user(username, user_schema)
-    return user_schema
+    return await caches.user_cache.get_or_load(username, load) or inactive_user
 
 async def get_current_user_ws(db: Annotated[Session, Depends(get_db)],token: str):
     credentials_exception = HTTPException(
@@ -92,7 +88,7 @@ async def get_current_user_ws(db: Annotated[Session, Depends(get_db)],token: str
             detail="Token has expired",
             headers={"WWW-Authenticate": "Bearer"},
         )
-        user = await _load_user_by_username(db, token_data.username)
+        user = await _load_user_by_username(token_data.username)
         if user is None:
             raise credentials_exception
         elif user.is_active:
@@ -105,12 +101,94 @@ async def get_current_user_ws(db: Annotated[Session, Depends(get_db)],token: str
     else:
         raise credentials_exception
 
+def _image_ref(websocket: WebSocket, kind: str, owner_id: int, db_image) -> Optional[dict]:
+    """Small pointer to an image; clients fetch the bytes once from the cacheable HTTP endpoint."""
+    if db_image is None:
+        return None
+    return {
+        "id": db_image.id,
+        "url": f"{websocket.scope.get('root_path', '')}/{kind}_image/{owner_id}",
+        "etag": f'"{db_image.storage_key}"' if db_image.storage_key else None,
+    }
+
+def _round_event_message(websocket: WebSocket, event: dict) -> dict:
+    """Client view of a worker event; payloads carry what the message needs so no query is made."""
+    generation = {"id": event["generation_id"]}
+    if event["event"] == round_events.INTERPRETATION_READY:
+        generation["interpreted_image"] = _image_ref(
+            websocket, "interpreted", event["generation_id"], SimpleNamespace(**event["interpreted_image"])
+        )
+    elif event["event"] == round_events.SCORE_READY:
+        generation["image_similarity"] = event.get("image_similarity")
+        generation["total_score"] = event.get("total_score")
+        generation["rank"] = event.get("rank")
+    return {"event": event["event"], "generation": generation}
+
+async def _listen_round_events(websocket: WebSocket, round_id: int, send_lock: asyncio.Lock) -> Optional[round_events.RoundEventListener]:
+    """Push worker results into the socket as they commit; without Redis the round still works."""
+    async def forward(event: dict) -> None:
+        async with send_lock:
+            await websocket.send_json(_round_event_message(websocket, event))
+
+    try:
+        return await round_events.RoundEventListener(round_id, forward).start()
+    except Exception as e:
+        logger1.warning(f"Round events unavailable for round {round_id}: {e}")
+        return None
+
+async def _load_round_session(db_round, db_chat, db_leaderboard, player_id: int) -> round_session.RoundSession:
+    """Shared state of the round; rebuilt from the chat when no worker saved it."""
+    session = await round_session.load(db_round.id)
+    if session and session.player_id == player_id and session.generation_id == db_round.last_generation_id:
+        return session
+    prev_res_ids = [
+        msg.response_id for msg in db_chat.messages if msg.response_id is not None
+    ]
+    return round_session.RoundSession(
+        round_id=db_round.id,
+        player_id=player_id,
+        generation_id=db_round.last_generation_id,
+        prev_res_id=prev_res_ids[-1] if prev_res_ids else db_leaderboard.response_id,
+        prev_res_ids=prev_res_ids,
+    )
+
+def _round_chatbot(db_round, db_leaderboard, session: round_session.RoundSession) -> openai_chatbot.Hint_Chatbot:
+    return openai_chatbot.Hint_Chatbot(
+        model_name=db_round.model,
+        system_prompt=openai_chatbot.hint_system_prompt(db_leaderboard),
+        leaderboard_id=db_leaderboard.id,
+        first_res_id=db_leaderboard.response_id,
+        prev_res_id=session.prev_res_id,
+        prev_res_ids=session.prev_res_ids,
+    )
+
+async def _save_round_session(session: round_session.RoundSession, db_generation, generated_time: int, chatbot_obj) -> None:
+    session.generation_id = db_generation.id
+    session.generated_time = generated_time
+    session.prev_res_id = chatbot_obj.prev_res_id
+    session.prev_res_ids = list(chatbot_obj.prev_res_ids)
+    await round_session.save(session)
+
+async def _schedule_word_cloud_refresh(db_round) -> None:
+    """Debounced incremental word cloud update; analysis must never break a student's round."""
+    if db_round.program_id is None:
+        return
+    try:
+        await asyncio.to_thread(
+            request_word_cloud_refresh,
+            leaderboard_id=db_round.leaderboard_id,
+            program_id=db_round.program_id,
+        )
+    except Exception as e:
+        logger1.warning(f"Word cloud refresh not scheduled: {e}")
+
 @router.websocket("/{leaderboard_id}")
 async def round_websocket(
     websocket: WebSocket,
     leaderboard_id: int,
     token: str,
     db: Session = Depends(get_db),
+    adb: AsyncSession = Depends(get_async_db),
 ):
     current_user = await get_current_user_ws(db=db, token=token)
     if not current_user:
@@ -123,10 +201,12 @@ async def round_websocket(
     db_round = None
     db_generation = None
     chatbot_obj = None
-    chain_result = None
+    session = None
+    event_listener = None
+    action_span = None
+    send_lock = asyncio.Lock()
     # accept the websocket connection and record in database
-    crud.create_user_action(
-        db=db,
+    await user_actions.record(
         user_action=schemas.UserActionBase(
             user_id=player_id,
             action="connect websocket",
@@ -137,19 +217,19 @@ async def round_websocket(
     await websocket.accept()
     try:
         user_action = await websocket.receive_json()
-        db_user_action = crud.create_user_action(
-            db=db,
+        received_at = datetime.datetime.now(tz=JST)
+        # recorded on receipt, so an action whose handler fails is still logged
+        await user_actions.record(
             user_action=schemas.UserActionBase(
                 user_id=player_id,
                 action=user_action["action"],
-                received_at=start_time,
-                sent_at=start_time,
+                received_at=received_at,
+                sent_at=received_at,
             )
         )
     except WebSocketDisconnect:
         # client disconnected immediately after connecting; record and exit gracefully
-        crud.create_user_action(
-            db=db,
+        await user_actions.record(
             user_action=schemas.UserActionBase(
                 user_id=player_id,
                 action="disconnect websocket",
@@ -200,24 +280,16 @@ async def round_websocket(
         )
 
         if unfinished_rounds:
-            db_round = crud.get_round(
-                db=db,
+            db_round = await crud_async.get_round(
+                db=adb,
                 round_id=unfinished_rounds[0].id,
             )
             db_leaderboard = crud.get_leaderboard(db=db, leaderboard_id=leaderboard_id)
 
-            db_generation = crud.get_generation(db=db, generation_id=db_round.last_generation_id)
+            db_generation = await crud_async.get_generation(db=adb, generation_id=db_round.last_generation_id)
             db_chat = crud.get_chat(db=db, chat_id=db_round.chat_history)
-            prev_res_ids = [
-                msg.response_id for msg in db_chat.messages if msg.response_id is not None
-            ]
-            chatbot_obj = openai_chatbot.Hint_Chatbot(
-                model_name=db_round.model,
-                vocabularies=db_leaderboard.vocabularies,
-                first_res_id=db_leaderboard.response_id,
-                prev_res_id=prev_res_ids[-1] if prev_res_ids else db_leaderboard.response_id,
-                prev_res_ids=prev_res_ids
-            )
+            session = await _load_round_session(db_round, db_chat, db_leaderboard, player_id)
+            chatbot_obj = _round_chatbot(db_round, db_leaderboard, session)
 
             db_score = crud.get_score(db=db, generation_id=db_generation.id)
 
@@ -226,8 +298,8 @@ async def round_websocket(
                 duration += db_generation.duration
             else:
                 generated_time = db_generation.generated_time + 1
-                db_generation = crud.create_generation(
-                    db=db,
+                db_generation = await crud_async.create_generation(
+                    db=adb,
                     round_id=db_round.id,
                     generation=schemas.GenerationCreate(
                         round_id=db_round.id,
@@ -242,7 +314,7 @@ async def round_websocket(
                 "feedback": db_program.feedback,
                 "leaderboard": {
                     "id": leaderboard_id,
-                    "image": db_round.leaderboard.original_image.image,
+                    "image": _image_ref(websocket, "original", leaderboard_id, db_round.leaderboard.original_image),
                 },
                 "round": {
                     "id": db_round.id,
@@ -254,7 +326,7 @@ async def round_websocket(
                 },
                 "generation": {
                     "id": db_generation.id,
-                    "interpreted_image": db_generation.interpreted_image.image if db_generation.interpreted_image else None,
+                    "interpreted_image": _image_ref(websocket, "interpreted", db_generation.id, db_generation.interpreted_image),
                     "generated_time": db_generation.generated_time,
                     "sentence": db_generation.sentence,
                     "correct_sentence": db_generation.correct_sentence,
@@ -277,24 +349,16 @@ async def round_websocket(
                 },
             }
         elif finished_rounds:
-            db_round = crud.get_round(
-                db=db,
+            db_round = await crud_async.get_round(
+                db=adb,
                 round_id=finished_rounds[0].id,
             )
             db_leaderboard = crud.get_leaderboard(db=db, leaderboard_id=leaderboard_id)
 
-            db_generation = crud.get_generation(db=db, generation_id=db_round.last_generation_id)
+            db_generation = await crud_async.get_generation(db=adb, generation_id=db_round.last_generation_id)
             db_chat = crud.get_chat(db=db, chat_id=db_round.chat_history)
-            prev_res_ids = [
-                msg.response_id for msg in db_chat.messages if msg.response_id is not None
-            ]
-            chatbot_obj = openai_chatbot.Hint_Chatbot(
-                model_name=db_round.model,
-                vocabularies=db_leaderboard.vocabularies,
-                first_res_id=db_leaderboard.response_id,
-                prev_res_id=prev_res_ids[-1] if prev_res_ids else db_leaderboard.response_id,
-                prev_res_ids=prev_res_ids
-            )
+            session = await _load_round_session(db_round, db_chat, db_leaderboard, player_id)
+            chatbot_obj = _round_chatbot(db_round, db_leaderboard, session)
             generated_time = db_generation.generated_time
 
             db_score = crud.get_score(db=db, generation_id=db_generation.id)
@@ -304,7 +368,7 @@ async def round_websocket(
                 "feedback": db_program.feedback,
                 "leaderboard": {
                     "id": leaderboard_id,
-                    "image": db_round.leaderboard.original_image.image,
+                    "image": _image_ref(websocket, "original", leaderboard_id, db_round.leaderboard.original_image),
                 },
                 "round": {
                     "id": db_round.id,
@@ -316,7 +380,7 @@ async def round_websocket(
                 },
                 "generation": {
                     "id": db_generation.id,
-                    "interpreted_image": db_generation.interpreted_image.image if db_generation.interpreted_image else None,
+                    "interpreted_image": _image_ref(websocket, "interpreted", db_generation.id, db_generation.interpreted_image),
                     "generated_time": db_generation.generated_time,
                     "sentence": db_generation.sentence,
                     "correct_sentence": db_generation.correct_sentence,
@@ -348,53 +412,28 @@ async def round_websocket(
         db_leaderboard = crud.get_leaderboard(db, leaderboard_id=leaderboard_id)
         db_score = None
 
-        if db_program is None:
-            db_round = crud.create_round(
-                db=db,
-                leaderboard_id=leaderboard_id,
-                user_id=player_id,
-                model_name=obj.model,
-                created_at=obj.created_at,
-            )
-
-        else:
-            db_round = crud.create_round(
-                db=db,
-                leaderboard_id=leaderboard_id,
-                user_id=player_id,
-                program_id=db_program.id,
-                model_name=obj.model,
-                created_at=obj.created_at,
-            )
-
-        db_generation = crud.create_generation(
-            db=db,
-            round_id=db_round.id,
-            generation=schemas.GenerationCreate(
-                round_id=db_round.id,
-                sentence='',
-                generated_time=0,
-                created_at=start_time,
-            )
-        )
-
-        db_message = crud.create_message(
-            db=db,
+        db_round, db_generation, db_message = await crud_async.start_round(
+            db=adb,
+            leaderboard_id=leaderboard_id,
+            user_id=player_id,
+            program_id=db_program.id if db_program else None,
+            model_name=obj.model,
+            created_at=obj.created_at,
+            generation_created_at=start_time,
             message=schemas.MessageBase(
                 content="画像を説明する際にヒントが使えます。下の『Averyへのメッセージ🤖』に質問したい内容を入力してくださいね！",
                 sender="assistant",
                 created_at=datetime.datetime.now(tz=JST),
                 is_hint=False
             ),
-            chat_id=db_round.chat_history
-        )['message']
+        )
 
-        chatbot_obj = openai_chatbot.Hint_Chatbot(
-            model_name=obj.model,
-            vocabularies=db_leaderboard.vocabularies,
-            first_res_id=db_leaderboard.response_id,
-            prev_res_id=db_leaderboard.response_id
+        session = round_session.RoundSession(
+            round_id=db_round.id,
+            player_id=player_id,
+            prev_res_id=db_leaderboard.response_id,
         )
+        chatbot_obj = _round_chatbot(db_round, db_leaderboard, session)
 
         generated_time = 0
 
@@ -403,7 +442,7 @@ async def round_websocket(
             "feedback": db_program.feedback,
             "leaderboard": {
                 "id": leaderboard_id,
-                "image": db_round.leaderboard.original_image.image,
+                "image": _image_ref(websocket, "original", leaderboard_id, db_round.leaderboard.original_image),
             },
             "round": {
                 "id": db_round.id,
@@ -413,7 +452,7 @@ async def round_websocket(
             },
             "generation": {
                 "id": db_generation.id,
-                "interpreted_image": db_generation.interpreted_image.image if db_generation.interpreted_image else None,
+                "interpreted_image": _image_ref(websocket, "interpreted", db_generation.id, db_generation.interpreted_image),
                 "generated_time": db_generation.generated_time,
                 "correct_sentence": db_generation.correct_sentence,
                 "is_completed": db_generation.is_completed,
@@ -435,14 +474,9 @@ async def round_websocket(
 
     await websocket.send_json(send_data)
 
-    crud.update_user_action(
-        db=db,
-        user_action=schemas.UserActionUpdate(
-            id=db_user_action.id,
-            related_id=db_generation.id if db_generation else None,
-            sent_at=datetime.datetime.now(tz=JST),
-        )
-    )
+    if session is not None:
+        await _save_round_session(session, db_generation, generated_time, chatbot_obj)
+        event_listener = await _listen_round_events(websocket, db_round.id, send_lock)
 
     try:
         # yappi.clear_stats()
@@ -450,24 +484,27 @@ async def round_websocket(
         # yappi.start()
         while True:
             user_action = await websocket.receive_json()
-
-            db_user_action = crud.create_user_action(
-                db=db,
+            received_at = datetime.datetime.now(tz=JST)
+            await user_actions.record(
                 user_action=schemas.UserActionBase(
                     user_id=player_id,
                     action=user_action["action"],
                     related_id=db_generation.id if db_generation else None,
-                    received_at=datetime.datetime.now(tz=JST),
-                    sent_at=datetime.datetime.now(tz=JST),
+                    received_at=received_at,
+                    sent_at=received_at,
                 )
             )
+            # LLM, task dispatch and DB spans of this action become its children
+            action_span = instrumentation.OpenSpan(
+                user_action["action"] if user_action["action"] in WS_ACTIONS else "unknown", "ws", activate=True,
+            )
 
             # if user asks for a hint
             if user_action["action"] == "hint":
                 db_messages = []
                 obj = parse_obj_as(schemas.MessageReceive, user_action['obj'])
-                crud.create_message(
-                    db=db,
+                await crud_async.create_message(
+                    db=adb,
                     message=schemas.MessageBase(
                         content=obj.content,
                         sender="user",
@@ -477,18 +514,15 @@ async def round_websocket(
                     chat_id=db_round.chat_history
                 )
 
-                # run in threadpool to avoid blocking event loop
-                # chatbot_obj.nextResponse: ask_for_hint, new_messages, base64_image
-                hint = await asyncio.to_thread(
-                    chatbot_obj.nextResponse,
+                hint = await chatbot_obj.anextResponse(
                     obj.content,
                     [],
-                    db_round.leaderboard.original_image.image,
+                    image=db_round.leaderboard.original_image,
                 )
 
                 db_messages.append(
-                    crud.create_message(
-                        db=db,
+                    await crud_async.create_message(
+                        db=adb,
                         message=schemas.MessageBase(
                             content=hint,
                             sender="assistant",
@@ -497,7 +531,7 @@ async def round_websocket(
                             response_id=chatbot_obj.prev_res_id
                         ),
                         chat_id=db_round.chat_history
-                    )['message']
+                    )
                 )
 
                 send_data = {
@@ -518,8 +552,8 @@ async def round_websocket(
 
             elif user_action["action"] == "change_display_name":
                 obj = parse_obj_as(schemas.RoundUpdateName, user_action['obj'])
-                db_round = crud.update_round_display_name(
-                    db=db,
+                db_round = await crud_async.update_round_display_name(
+                    db=adb,
                     round_update=obj
                 )
 
@@ -540,27 +574,27 @@ async def round_websocket(
                 ]
 
                 if db_generation.correct_sentence is None:
-                    db_generation = crud.update_generation0(
-                        db=db,
+                    db_generation = await crud_async.update_generation0(
+                        db=adb,
                         generation=obj,
                         generation_id=db_generation.id
                     )
                 elif obj.sentence.strip() in sentences:
-                    db_generation = crud.get_generation(db=db, generation_id=db_generation.id)
+                    db_generation = await crud_async.get_generation(db=adb, generation_id=db_generation.id)
                     status = 3
                 else:
                     generated_time += 1
                     obj.generated_time = generated_time
-                    db_generation = crud.create_generation(
-                        db=db,
+                    db_generation = await crud_async.create_generation(
+                        db=adb,
                         round_id=db_round.id,
                         generation=obj,
+                        db_round=db_round,
                     )
 
                 if status != 3:
                     try:
-                        status, correct_sentence, spelling_mistakes, grammar_mistakes=await asyncio.to_thread(
-                            sentence.checkSentence,
+                        status, correct_sentence, spelling_mistakes, grammar_mistakes=await sentence.acheckSentence(
                             db_generation.sentence
                         )
                     except Exception as e:
@@ -569,36 +603,22 @@ async def round_websocket(
 
                 # Allow Romaji temporary
                 if status == 0 or status == 1:
-                    crud.update_generation3(
-                        db=db,
+                    duration += (datetime.datetime.now(tz=JST) - start_time).total_seconds()
+
+                    # mistakes, duration and correction go out in one UPDATE
+                    db_generation = await crud_async.update_generation3(
+                        db=adb,
                         generation=schemas.GenerationComplete(
                             id=db_generation.id,
-                            grammar_errors=str(grammar_mistakes),
-                            spelling_errors=str(spelling_mistakes),
-                            n_grammar_errors=len(grammar_mistakes),
-                            n_spelling_errors=len(spelling_mistakes),
-                            updated_grammar_errors=True,
+                            correct_sentence=correct_sentence,
+                            grammar_errors=sentence.mistakes_to_json(grammar_mistakes),
+                            spelling_errors=sentence.mistakes_to_json(spelling_mistakes),
+                            duration=int(duration),
                             is_completed=False
                         )
                     )
-
-                    duration += (datetime.datetime.now(tz=JST) - start_time).total_seconds()
-
-                    crud.update_generation_duration(
-                        db=db,
-                        generation_id=db_generation.id,
-                        duration=duration
-                    )
                     duration = 0
 
-                    db_generation = crud.update_generation1(
-                        db=db,
-                        generation=schemas.GenerationCorrectSentence(
-                            id=db_generation.id,
-                            correct_sentence=correct_sentence
-                        )
-                    )
-
                     messages = [
                         schemas.MessageBase(
                             content="""回答を記録しました。📝
@@ -642,6 +662,10 @@ async def round_websocket(
                     else:
                         chain_result = None
 
+                    if chain_result is not None:
+                        session.chain_id = chain_result.id
+                        session.chain_generation_id = db_generation.id
+
 
                 elif status == 1:
                     messages = [
@@ -675,22 +699,17 @@ async def round_websocket(
                 else:
                     messages = []
 
-                db_messages = []
-
-                for message in messages:
-                    db_messages.append(
-                        crud.create_message(
-                            db=db,
-                            message=message,
-                            chat_id=db_round.chat_history
-                        )['message']
-                    )
+                db_messages = await crud_async.create_messages(
+                    db=adb,
+                    messages=messages,
+                    chat_id=db_round.chat_history
+                )
 
                 # prepare data to send
                 send_data = {
                     "leaderboard": {
                         "id": leaderboard_id,
-                        "image": db_round.leaderboard.original_image.image,
+                        "image": _image_ref(websocket, "original", leaderboard_id, db_round.leaderboard.original_image),
                     },
                     "round": {
                         "id": db_round.id,
@@ -721,6 +740,19 @@ async def round_websocket(
                 send_data = {}
             elif user_action["action"] == "evaluate":
 
+                # wait for the worker instead of reading the Celery result, which may not be ready
+                pending_events = []
+                if "IMG" in db_program.feedback and db_generation.interpreted_image_id is None:
+                    pending_events.append(round_events.INTERPRETATION_READY)
+                if "AWS" in db_program.feedback and db_generation.score is None:
+                    pending_events.append(round_events.SCORE_READY)
+                # only wait when a chain was started for this generation (by any worker)
+                if pending_events and event_listener is not None and session.chain_generation_id == db_generation.id:
+                    missing = await event_listener.wait(db_generation.id, pending_events)
+                    if missing:
+                        logger1.warning(f"Generation {db_generation.id} still waiting for {sorted(missing)}")
+                    db_generation = await crud_async.get_generation(adb, generation_id=db_generation.id)
+
                 if "IMG" in db_program.feedback and db_generation.interpreted_image is None:
                     # If the interpreted image is not generated, log an error
                     logger1.error(f"Interpreted image not found for generation {db_generation.id}")
@@ -738,21 +770,6 @@ async def round_websocket(
                             'content_score': db_score.content_score,
                             'total_score': db_generation.total_score,
                         }
-                    elif locals().get('chain_result'):
-                        # Get the result from the chain
-                        chain_score_result = [
-                            json.loads(result) for result in chain_result.result
-                        ]
-                        scores_dict = {
-                            'grammar_score': chain_score_result[1].get('grammar_score', 0),
-                            'spelling_score': chain_score_result[1].get('spelling_score', 0),
-                            'vividness_score': chain_score_result[1].get('vividness_score', 0),
-                            'convention': chain_score_result[1].get('convention', 0),
-                            'structure_score': chain_score_result[1].get('structure_score', 0),
-                            'content_score': chain_score_result[1].get('content_score', 0),
-                            'total_score': chain_score_result[0].get('total_score', 0),
-                        }
-                        image_similarity = chain_score_result[1].get('image_similarity', 0)
                     else:
                         raise HTTPException(status_code=500, detail="No score found")
                 else:
@@ -768,8 +785,8 @@ async def round_websocket(
                         id=db_generation.id,
                         is_completed=True
                     )
-                    crud.update_generation3(
-                        db=db,
+                    await crud_async.update_generation3(
+                        db=adb,
                         generation=generation_com
                     )
 
@@ -807,8 +824,8 @@ async def round_websocket(
                             correct_sentence=db_generation.correct_sentence,
                         )
 
-                        db_messages.append(crud.create_message(
-                            db=db,
+                        db_messages.append(await crud_async.create_message(
+                            db=adb,
                             message=schemas.MessageBase(
                                 content=score_message,
                                 sender="assistant",
@@ -817,17 +834,16 @@ async def round_websocket(
                                 is_evaluation=True,
                             ),
                             chat_id=db_round.chat_history
-                        )['message'])
+                        ))
 
                     if "AWE" in db_program.feedback:
-                        evaluation = await asyncio.to_thread(
-                            chatbot_obj.get_short_result,
-                            db_generation.sentence,
-                            db_generation.correct_sentence,
-                            db_round.leaderboard.original_image.image,
-                            db_generation.grammar_errors,
-                            db_generation.spelling_errors,
-                            descriptions
+                        evaluation = await chatbot_obj.aget_short_result(
+                            sentence=db_generation.sentence,
+                            correct_sentence=db_generation.correct_sentence,
+                            image=db_round.leaderboard.original_image,
+                            grammar_errors=db_generation.grammar_errors,
+                            spelling_errors=db_generation.spelling_errors,
+                            descriptions=descriptions,
                         )
                     else:
                         evaluation = None
@@ -848,8 +864,8 @@ async def round_websocket(
                             recommended_vocab=recommended_vocab
                         )
 
-                        db_evaluate_msg = crud.create_message(
-                            db=db,
+                        db_evaluate_msg = await crud_async.create_message(
+                            db=adb,
                             message=schemas.MessageBase(
                                 content=evaluation_message,
                                 sender="assistant",
@@ -860,7 +876,7 @@ async def round_websocket(
                                 responses_id=chatbot_obj.prev_res_id
                             ),
                             chat_id=db_round.chat_history
-                        )['message']
+                        )
 
                         db_messages.append(db_evaluate_msg)
 
@@ -870,16 +886,18 @@ async def round_websocket(
                         evaluation_id=db_evaluate_msg.id if db_evaluate_msg else None
                     )
 
-                    db_generation = crud.update_generation3(
-                        db=db,
+                    db_generation = await crud_async.update_generation3(
+                        db=adb,
                         generation=generation_com,
                     )
 
+                    await _schedule_word_cloud_refresh(db_round)
+
                 # prepare data to send
                 send_data = {
                     "leaderboard": {
                         "id": leaderboard_id,
-                        "image": db_leaderboard.original_image.image,
+                        "image": _image_ref(websocket, "original", leaderboard_id, db_leaderboard.original_image),
                     },
                     "round": {
                         "id": db_round.id,
@@ -901,7 +919,7 @@ async def round_websocket(
                     },
                     "generation": {
                         "id": db_generation.id,
-                        "interpreted_image": db_generation.interpreted_image.image if db_generation.interpreted_image else None,
+                        "interpreted_image": _image_ref(websocket, "interpreted", db_generation.id, db_generation.interpreted_image),
                         "image_similarity": image_similarity,
                         "evaluation_msg": db_evaluate_msg.content if 'AWE' in db_program.feedback else None
                     }
@@ -909,10 +927,11 @@ async def round_websocket(
 
             # if user requests to end the round
             elif user_action["action"] == "end":
+                db_round = await crud_async.get_round(adb, round_id=db_round.id)
                 duration = np.sum([g.duration for g in db_round.generations if g.is_completed])
 
-                db_round = crud.complete_round(
-                    db=db,
+                db_round = await crud_async.complete_round(
+                    db=adb,
                     round_id=db_round.id,
                     round=schemas.RoundComplete(
                         id=db_round.id,
@@ -926,7 +945,7 @@ async def round_websocket(
                 send_data = {
                     "leaderboard": {
                         "id": leaderboard_id,
-                        "image": db_leaderboard.original_image.image,
+                        "image": _image_ref(websocket, "original", leaderboard_id, db_leaderboard.original_image),
                     },
                     "round": {
                         "id": db_round.id,
@@ -938,28 +957,26 @@ async def round_websocket(
                     },
                 }
 
-                chatbot_obj.kill()
+                await chatbot_obj.akill()
+                await round_session.delete(db_round.id)
             else:
                 send_data = {}
                 logger1.error(f"Unknown action received: {user_action['action']}")
             # send details to the user
-            await websocket.send_json(send_data)
+            async with send_lock:
+                await websocket.send_json(send_data)
 
-            crud.update_user_action(
-                db=db,
-                user_action=schemas.UserActionUpdate(
-                    id=db_user_action.id,
-                    related_id=db_generation.id if db_generation else None,
-                    sent_at=datetime.datetime.now(tz=JST),
-                )
-            )
+            if user_action["action"] != "end":
+                await _save_round_session(session, db_generation, generated_time, chatbot_obj)
+
+            action_span.end()
+            action_span = None
 
     except WebSocketDisconnect:
         disconnect_time = datetime.datetime.now(tz=JST)
 
         # record disconnect time
-        crud.create_user_action(
-            db=db,
+        await user_actions.record(
             user_action=schemas.UserActionBase(
                 user_id=player_id,
                 action="disconnect websocket",
@@ -975,11 +992,15 @@ async def round_websocket(
         except:
             pass
     finally:
+        if action_span is not None:
+            action_span.end()
+        if event_listener is not None:
+            await event_listener.aclose()
         disconnect_time = datetime.datetime.now(tz=JST)
         if start_time and db_generation and not db_generation.is_completed:
             duration += (disconnect_time - start_time).total_seconds()
-            crud.update_generation_duration(
-                db=db,
+            await crud_async.update_generation_duration(
+                db=adb,
                 generation_id=db_generation.id,
                 duration=duration
             )
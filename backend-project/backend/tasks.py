@@ -4,9 +4,12 @@ from fastapi import HTTPException
 from datetime import timezone, datetime
 from typing import Union, List, Annotated, Optional
 
-from sql_app_2.dependencies import sentence as sentence2, score as score2, dictionary as dictionary2, gen_image as gen_image2, openai_chatbot as openai_chatbot2
-from sql_app_2 import crud as crud2, schemas as schemas2, database as database2
-from util import computing_time_tracker , encode_image
+from sql_app_2.dependencies import sentence as sentence2, score as score2, dictionary as dictionary2, gen_image as gen_image2, openai_chatbot as openai_chatbot2, llm_scheduler as llm_scheduler2, image_similarity as image_similarity2
+from sql_app_2 import crud as crud2, schemas as schemas2, database as database2, analysis as analysis2, stats as stats2
+from sql_app_2.dependencies.redis_client import get_redis
+from sql_app_2.dependencies import round_events as round_events2
+from util import encode_image
+import instrumentation
 from sql_app_2.database import SessionLocal2, engine2
 
 import torch, asyncio
@@ -64,13 +67,20 @@ app = create_celery_app(
     backend_url=os.environ.get('RESULT_BACKEND', 'redis://localhost:7876'),
 )
 
+instrumentation.instrument_celery()
+instrumentation.instrument_sessions()
+
 app.conf.timezone = 'Asia/Tokyo'
 
+# submissions within this window are folded into one incremental word cloud refresh
+WORD_CLOUD_DEBOUNCE_SECONDS = int(os.getenv("WORD_CLOUD_DEBOUNCE_SECONDS", "60"))
+WORD_CLOUD_LOCK_TIMEOUT = int(os.getenv("WORD_CLOUD_LOCK_TIMEOUT", "1800"))
+
 app.conf.beat_schedule = {
-    'check_error_task': {
-        'task': 'tasks.check_error_task',
-        'schedule': crontab(minute=0, hour=5),
-    }
+    'reconcile_stats': {
+        'task': 'tasks.reconcile_stats',
+        'schedule': crontab(minute=30, hour=4),
+    },
 }
 
 class AlchemyEncoder(json.JSONEncoder):
@@ -98,10 +108,12 @@ def generateDescription2(
     try:
         db=SessionLocal2()
 
-        response_id, contents = sentence2.generateSentence(
-            base64_image=image,
-            story=story
-        )
+        # descriptions are prepared ahead of class, so they must not crowd out students' calls
+        with llm_scheduler2.priority_scope(llm_scheduler2.BATCH):
+            response_id, contents = sentence2.generateSentence(
+                base64_image=image,
+                story=story
+            )
 
         db_descriptions = []
 
@@ -148,10 +160,11 @@ def calculate_score_gpt(
     
     if items is None:
         raise HTTPException(status_code=400, detail="Invalid items")
-    if isinstance(items, tuple):
+    if isinstance(items, (tuple, list)):
         generation = items[0]
     elif 'id' in items:
         generation = items
+    db_round = None
     try:
         
         db=SessionLocal2()
@@ -165,12 +178,14 @@ def calculate_score_gpt(
         
         cb = openai_chatbot2.Hint_Chatbot(
             model_name=db_round.model,
+            leaderboard_id=db_round.leaderboard_id,
             first_res_id=db_round.leaderboard.response_id,
+            priority=generation.get('priority', llm_scheduler2.INTERACTIVE),
         )
 
         scores = cb.scoring(
             sentence=db_generation.sentence,
-            base64_image=db_round.leaderboard.original_image.image,
+            image=db_round.leaderboard.original_image,
         )
 
         if scores is None:
@@ -202,11 +217,19 @@ def calculate_score_gpt(
                 is_completed=False
             )
         )
-        if "IMG" in db_round.program.feedback:
+        similarity_method = image_similarity2.method_for(db_round.program.feedback)
+        if "IMG" in db_round.program.feedback and similarity_method == "llm":
             image_similarity = cb.image_similarity(
-                image1_base64=db_round.leaderboard.original_image.image,
-                image2_base64=db_generation.interpreted_image.image,
+                image1=db_round.leaderboard.original_image,
+                image2=db_generation.interpreted_image,
             )
+        elif "IMG" in db_round.program.feedback:
+            with instrumentation.span(similarity_method, "similarity"):
+                image_similarity = image_similarity2.compare(
+                    db_round.leaderboard.original_image,
+                    db_generation.interpreted_image,
+                    similarity_method,
+                )
         else:
             image_similarity = 0
 
@@ -218,12 +241,23 @@ def calculate_score_gpt(
             )
         )
 
+        round_events2.publish(
+            db_round.id,
+            db_generation.id,
+            round_events2.SCORE_READY,
+            total_score=db_generation.total_score,
+            rank=db_generation.rank,
+            image_similarity=db_score.image_similarity,
+        )
+
         output = [json.dumps(db_generation, cls=AlchemyEncoder),
                  json.dumps(db_score, cls=AlchemyEncoder)]
         return output
 
     except Exception as e:
         print(f"Calculate score error: {e}")
+        if db_round is not None:
+            round_events2.publish(db_round.id, generation['id'], round_events2.SCORE_FAILED)
     finally:
         if db:
             db.close()
@@ -233,27 +267,30 @@ def generate_interpretation2(
     generation_id: int,
     sentence: str,
     at: datetime, 
+    priority: str = llm_scheduler2.INTERACTIVE,
 ):
     
     db=None
+    round_id=None
     try:
         db=SessionLocal2()
 
         db_generation = crud2.get_generation(db, generation_id=generation_id)
+        round_id = db_generation.round_id
         if db_generation.interpreted_image_id is not None:
             return {
                 'id': db_generation.id,
                 'at': at,
+                'priority': priority,
             }
         db_leaderboard = crud2.get_leaderboard(db, leaderboard_id=db_generation.round.leaderboard_id)
-        t = computing_time_tracker("Generate interpretation")
         try:
-            image = gen_image2.generate_interpretion(
-                sentence=sentence, 
-                model="gpt-image-2",
-                style=db_leaderboard.scene.prompt
-            )
-            t.stop_timer()
+            with llm_scheduler2.priority_scope(priority), instrumentation.span("generate_interpretion"):
+                image = gen_image2.generate_interpretion(
+                    sentence=sentence, 
+                    model="gpt-image-2",
+                    style=db_leaderboard.scene.prompt
+                )
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
         
@@ -273,12 +310,145 @@ def generate_interpretation2(
             )
         )
 
+        round_events2.publish(
+            round_id,
+            generation_id,
+            round_events2.INTERPRETATION_READY,
+            interpreted_image={
+                'id': db_interpreted_image.id,
+                'storage_key': db_interpreted_image.storage_key,
+            },
+        )
+
         return {
             'id': db_generation.id,
             'at': at,
+            'priority': priority,
         }
     except Exception as e:
         print(f"Generate interpretation error: {e}")
+        if round_id is not None:
+            round_events2.publish(round_id, generation_id, round_events2.INTERPRETATION_FAILED)
+    finally:
+        if db:
+            db.close()
+
+@app.task(name='tasks.reconcile_stats', ignore_result=False)
+def reconcile_stats():
+    db = SessionLocal2()
+    try:
+        return stats2.reconcile(db)
+    finally:
+        db.close()
+
+@app.task(name='tasks.build_word_cloud', bind=True, ignore_result=False, track_started=True)
+def build_word_cloud(
+    self,
+    leaderboard_id: int,
+    program_id: int,
+    cloud_type: str,
+    lang: str = 'en',
+):
+    name = analysis2.word_cloud_task_name(program_id, cloud_type, lang)
+    task_id = self.request.id
+    # one build per cloud at a time, otherwise two workers would add the same chunk twice
+    lock = get_redis().lock(f"lock:{leaderboard_id}:{name}", timeout=WORD_CLOUD_LOCK_TIMEOUT, blocking_timeout=0)
+    if not lock.acquire(blocking=False):
+        raise self.retry(countdown=WORD_CLOUD_DEBOUNCE_SECONDS, max_retries=None)
+
+    db = None
+    try:
+        # the debounce window closes once the build starts reading
+        get_redis().delete(f"debounce:{leaderboard_id}:{name}")
+        db = SessionLocal2()
+        if task_id and crud2.get_task(db, task_id=task_id) is None:
+            crud2.create_task(db, task=schemas2.Task(id=task_id, leaderboard_id=leaderboard_id, name=name))
+
+        def on_progress(done, total):
+            if task_id:
+                crud2.update_task(db, task=schemas2.TaskUpdate(id=task_id, status='started', progress=done, total=total))
+
+        with llm_scheduler2.priority_scope(llm_scheduler2.BATCH):
+            db_word_cloud = analysis2.refresh_word_cloud(
+                db=db,
+                leaderboard_id=leaderboard_id,
+                program_id=program_id,
+                cloud_type=cloud_type,
+                lang=lang,
+                on_progress=on_progress,
+            )
+        if task_id:
+            crud2.update_task(db, task=schemas2.TaskUpdate(id=task_id, status='success'))
+        return {
+            'word_cloud_id': db_word_cloud.id,
+            'latest_generation_id': db_word_cloud.latest_generation_id,
+        }
+    except Exception as e:
+        print(f"Build word cloud error: {e}")
+        if db and task_id:
+            db.rollback()
+            crud2.update_task(db, task=schemas2.TaskUpdate(id=task_id, status='failure'))
+        raise
     finally:
         if db:
-            db.close()
\ No newline at end of file
+            db.close()
+        try:
+            lock.release()
+        except Exception:
+            pass
+
+def request_word_cloud_refresh(
+    leaderboard_id: int,
+    program_id: int,
+    cloud_type: Optional[str] = None,
+    lang: Optional[str] = None,
+    countdown: Optional[int] = None,
+):
+    """Schedule builds for a leaderboard's clouds, at most one per cloud per debounce window.
+
+    Without cloud_type/lang every cloud that has been built before is refreshed.
+    Returns the Task rows of the builds that are pending or running.
+    """
+    countdown = WORD_CLOUD_DEBOUNCE_SECONDS if countdown is None else countdown
+    db = SessionLocal2()
+    try:
+        if cloud_type and lang:
+            targets = [(cloud_type, lang)]
+        else:
+            db_leaderboard_analysis = crud2.read_leaderboard_analysis(db, leaderboard_id=leaderboard_id, program_id=program_id)
+            if not db_leaderboard_analysis:
+                return []
+            links = crud2.read_leaderboard_analysis_word_cloud(
+                db,
+                leaderboard_analysis_id=db_leaderboard_analysis.id,
+                cloud_type=None,
+                lang=None,
+                require_num=len(analysis2.CLOUD_TYPES) * 2,
+            ) or []
+            targets = sorted({(link.type, link.lang) for link in links})
+
+        redis_client = get_redis()
+        for target_type, target_lang in targets:
+            name = analysis2.word_cloud_task_name(program_id, target_type, target_lang)
+            if not redis_client.set(f"debounce:{leaderboard_id}:{name}", 1, nx=True, ex=countdown + WORD_CLOUD_DEBOUNCE_SECONDS):
+                continue
+            result = build_word_cloud.apply_async(
+                kwargs={
+                    'leaderboard_id': leaderboard_id,
+                    'program_id': program_id,
+                    'cloud_type': target_type,
+                    'lang': target_lang,
+                },
+                countdown=countdown,
+            )
+            crud2.create_task(db, task=schemas2.Task(
+                id=result.id,
+                leaderboard_id=leaderboard_id,
+                name=name,
+                status='pending',
+                progress=0,
+                total=0,
+            ))
+        return crud2.get_active_tasks(db, leaderboard_id=leaderboard_id, name_prefix=f"word_cloud:{program_id}:")
+    finally:
+        db.close()
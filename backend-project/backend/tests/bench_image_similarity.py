@@ -0,0 +1,118 @@
+"""Local image similarity against the scores the chat model gave.
+
+Run from the backend directory against a database with scored rounds:
+
+    python tests/bench_image_similarity.py --limit 200 --clip --llm 20
+
+Takes the newest --limit generations that have an interpreted image and a stored
+image_similarity, which came from the LLM method. For each local method it prints the time
+per pair and the Pearson and Spearman correlation with the stored scores. --llm N calls the
+chat model again for the first N pairs to time it (this is billed).
+"""
+import argparse, os, statistics, sys, time
+
+import numpy as np
+
+sys.path.append(os.getcwd())
+from sql_app_2 import models
+from sql_app_2.database import SessionLocal2
+from sql_app_2.dependencies import image_similarity, openai_chatbot
+
+
+def scored_pairs(db, limit: int):
+    rows = db.query(models.Generation).\
+        join(models.Score, models.Generation.score_id == models.Score.id).\
+        filter(models.Generation.interpreted_image_id.isnot(None)).\
+        filter(models.Score.image_similarity.isnot(None)).\
+        filter(models.Score.image_similarity > 0).\
+        order_by(models.Generation.id.desc()).\
+        limit(limit).all()
+    return [
+        (db_generation.round.leaderboard.original_image, db_generation.interpreted_image, db_generation.score.image_similarity)
+        for db_generation in rows
+    ]
+
+
+def spearman(x, y) -> float:
+    rank_x = np.argsort(np.argsort(x))
+    rank_y = np.argsort(np.argsort(y))
+    return float(np.corrcoef(rank_x, rank_y)[0, 1])
+
+
+def report(name: str, seconds: list, predicted: list, expected: list):
+    ms = statistics.mean(seconds) * 1000
+    if len(predicted) > 2 and np.std(predicted) > 0:
+        pearson = float(np.corrcoef(predicted, expected)[0, 1])
+        print(f"{name:>10}: {ms:8.2f} ms/pair  pearson {pearson:6.3f}  spearman {spearman(predicted, expected):6.3f}")
+    else:
+        print(f"{name:>10}: {ms:8.2f} ms/pair")
+
+
+def time_local(pairs):
+    expected, seconds = [], []
+    predicted = {"phash": [], "histogram": [], "ssim": [], "local": []}
+    for original, interpreted, llm_score in pairs:
+        # clear the cache so every pair pays for decoding, as a cold worker would
+        image_similarity.feature_cache.clear()
+        start = time.perf_counter()
+        scores = image_similarity.components(
+            image_similarity.image_features(original), image_similarity.image_features(interpreted)
+        )
+        seconds.append(time.perf_counter() - start)
+        expected.append(llm_score)
+        for name in predicted:
+            predicted[name].append(scores[name])
+    for name, values in predicted.items():
+        report(name, seconds, values, expected)
+
+
+def time_clip(pairs):
+    image_similarity.image_embedding(pairs[0][0])  # load the model outside the timings
+    expected, seconds, predicted = [], [], []
+    for original, interpreted, llm_score in pairs:
+        image_similarity.feature_cache.clear()
+        start = time.perf_counter()
+        predicted.append(image_similarity.compare(original, interpreted, "clip"))
+        seconds.append(time.perf_counter() - start)
+        expected.append(llm_score)
+    report("clip", seconds, predicted, expected)
+
+
+def time_llm(pairs):
+    cb = openai_chatbot.Hint_Chatbot(model_name="gpt-4o-mini")
+    seconds, predicted, expected = [], [], []
+    for original, interpreted, llm_score in pairs:
+        start = time.perf_counter()
+        value = cb.image_similarity(original, interpreted)
+        seconds.append(time.perf_counter() - start)
+        if value is not None:
+            predicted.append(value)
+            expected.append(llm_score)
+    # agreement of the model with its own earlier answers
+    report("llm", seconds, predicted, expected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--clip", action="store_true", help="also time CLIP embeddings (needs transformers)")
+    parser.add_argument("--llm", type=int, default=0, help="call the chat model again for this many pairs")
+    args = parser.parse_args()
+
+    db = SessionLocal2()
+    try:
+        pairs = scored_pairs(db, args.limit)
+        if not pairs:
+            sys.exit("No generations with an interpreted image and an LLM similarity score")
+        print(f"{len(pairs)} pairs, {image_similarity.IMAGE_SIMILARITY_SIZE}px, weights {image_similarity.IMAGE_SIMILARITY_WEIGHTS}")
+        time_local(pairs)
+        if args.clip:
+            time_clip(pairs)
+        if args.llm:
+            time_llm(pairs[:args.llm])
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
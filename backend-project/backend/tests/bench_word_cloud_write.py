@@ -0,0 +1,126 @@
+"""Round trips and time for one word cloud refresh: per-item writes vs. the bulk upsert path.
+
+Run against a scratch database from the backend directory:
+
+    python tests/bench_word_cloud_write.py --words 2000 --generations 200
+
+Both paths write into throwaway word clouds that are deleted afterwards. Links need
+real generations, so the newest --generations generations in the database are used.
+"""
+import argparse, random, string, sys, os, time
+
+from sqlalchemy import event
+
+sys.path.append(os.getcwd())
+from sql_app_2 import crud, models, schemas
+from sql_app_2.database import SessionLocal2, engine2
+
+CLOUD_TYPE = 'writing'
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+
+def make_refresh(n_words: int, generation_ids: list, words_per_generation: int = 8):
+    words = [''.join(random.choices(string.ascii_lowercase, k=8)) for _ in range(n_words)]
+    generation_token = {
+        gen_id: {word: 1 for word in random.sample(words, min(words_per_generation, n_words))}
+        for gen_id in generation_ids
+    }
+    items = [schemas.WordCloudItemCreate(word=word, frequency=random.randint(1, 5), color="ffffff") for word in words]
+    return items, generation_token
+
+
+def legacy_refresh(db, word_cloud_id: int, items, generation_token):
+    """The per-item path that crud.update_word_cloud used before the bulk upsert."""
+    for item in items:
+        db_item = db.query(models.WritingWordCloudItem).\
+            filter(models.WritingWordCloudItem.word_cloud_id == word_cloud_id).\
+            filter(models.WritingWordCloudItem.word == item.word).first()
+        if db_item is None:
+            db.add(models.WritingWordCloudItem(
+                word=item.word, frequency=item.frequency, color=item.color, word_cloud_id=word_cloud_id
+            ))
+        else:
+            db_item.frequency += item.frequency
+        db.commit()
+    for gen_id, tokens in generation_token.items():
+        for word in tokens:
+            db_item = crud.get_word_cloud_item_by_word(db, word=word, word_cloud_id=word_cloud_id, cloud_type=CLOUD_TYPE)
+            link = db.query(models.WritingWordCloudItemGeneration).filter(
+                models.WritingWordCloudItemGeneration.word_cloud_item_id == db_item.id,
+                models.WritingWordCloudItemGeneration.generation_id == gen_id
+            ).first()
+            if link is None:
+                db.add(models.WritingWordCloudItemGeneration(word_cloud_item_id=db_item.id, generation_id=gen_id))
+                db.commit()
+
+
+def bulk_refresh(db, word_cloud_id: int, items, generation_token):
+    crud.update_word_cloud(
+        db=db,
+        cloud_type=CLOUD_TYPE,
+        word_cloud=schemas.WordCloudUpdate(id=word_cloud_id, items=items),
+        generation_token=generation_token,
+    )
+
+
+def drop_word_cloud(db, word_cloud_id: int):
+    item_ids = db.query(models.WritingWordCloudItem.id).filter(models.WritingWordCloudItem.word_cloud_id == word_cloud_id)
+    db.query(models.WritingWordCloudItemGeneration).\
+        filter(models.WritingWordCloudItemGeneration.word_cloud_item_id.in_(item_ids.scalar_subquery())).\
+        delete(synchronize_session=False)
+    db.query(models.WritingWordCloudItem).filter(models.WritingWordCloudItem.word_cloud_id == word_cloud_id).delete(synchronize_session=False)
+    db.query(models.WordCloud).filter(models.WordCloud.id == word_cloud_id).delete(synchronize_session=False)
+    db.commit()
+
+
+def run(name, refresh, items, generation_token, counter):
+    db = SessionLocal2()
+    try:
+        db_word_cloud = models.WordCloud(latest_generation_id=0)
+        db.add(db_word_cloud)
+        db.commit()
+        start_count, start_time = counter.count, time.perf_counter()
+        refresh(db, db_word_cloud.id, items, generation_token)
+        elapsed = time.perf_counter() - start_time
+        statements = counter.count - start_count
+        print(f"{name:>8}: {statements:7d} statements  {elapsed:8.2f}s")
+        drop_word_cloud(db, db_word_cloud.id)
+        return statements, elapsed
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, default=2000)
+    parser.add_argument("--generations", type=int, default=200)
+    parser.add_argument("--skip-legacy", action="store_true", help="only time the bulk path")
+    args = parser.parse_args()
+
+    db = SessionLocal2()
+    generation_ids = [gen_id for gen_id, in db.query(models.Generation.id).order_by(models.Generation.id.desc()).limit(args.generations)]
+    db.close()
+    if not generation_ids:
+        sys.exit("No generations in the database to link against")
+
+    items, generation_token = make_refresh(args.words, generation_ids)
+    n_links = sum(len(tokens) for tokens in generation_token.values())
+    print(f"{args.words} words, {n_links} links, chunk size {crud.WORD_CLOUD_UPSERT_CHUNK}")
+
+    counter = StatementCounter(engine2)
+    bulk = run("bulk", bulk_refresh, items, generation_token, counter)
+    if not args.skip_legacy:
+        legacy = run("legacy", legacy_refresh, items, generation_token, counter)
+        print(f"speedup: {legacy[1] / bulk[1]:.1f}x, {legacy[0] / max(bulk[0], 1):.0f}x fewer statements")
+
+
+if __name__ == "__main__":
+    main()
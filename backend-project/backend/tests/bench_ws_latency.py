@@ -0,0 +1,82 @@
+"""p99 latency of round WebSocket actions and of a hot GET route under 200 open sockets.
+
+Run against a running server from the backend directory (test accounts as for
+tests/load_round_ws.py; --users needs that many accounts):
+
+    python tests/bench_ws_latency.py --url http://localhost:8000 --users 200 --seconds 60
+
+Every student keeps reconnecting and sends resume + change_display_name, which touch the
+database but no LLM. Meanwhile one prober requests GET /generation/{id} back to back; its
+latency shows how long a request waits behind database work of the sockets. A blocking
+query on the event loop shows up in both tails.
+"""
+import argparse, asyncio, sys, time
+
+import httpx
+
+from load_round_ws import Student
+
+
+def percentiles(latencies: list) -> str:
+    if not latencies:
+        return "no samples"
+    latencies = sorted(latencies)
+    pick = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
+    return f"n={len(latencies):6d}  p50 {pick(0.50):7.1f} ms  p95 {pick(0.95):7.1f} ms  p99 {pick(0.99):7.1f} ms  max {latencies[-1] * 1000:7.1f} ms"
+
+
+async def probe(client: httpx.AsyncClient, headers: dict, generation_id: int, deadline: float) -> list:
+    latencies = []
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await client.get(f"/sqlapp2/generation/{generation_id}", headers=headers)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return latencies
+
+
+async def run(url: str, users: int, seconds: float, p99_budget_ms: float) -> bool:
+    limits = httpx.Limits(max_connections=users * 2 + 10, max_keepalive_connections=users * 2 + 10)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        students = [Student(client, f"test_acc{i}") for i in range(1, users + 1)]
+        await asyncio.gather(*(student.login() for student in students))
+        await asyncio.gather(*(student.run(time.perf_counter() + 5) for student in students))
+
+        response = await client.post("/sqlapp2/token", data={"username": students[0].username, "password": "hogehoge"})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        response = await client.get("/sqlapp2/generations/", params={"limit": 1}, headers=headers)
+        response.raise_for_status()
+        generation_id = response.json()[0][0]["id"]
+
+        for student in students:
+            student.latencies.clear()
+            student.errors = 0
+        deadline = time.perf_counter() + seconds
+        probe_latencies, *_ = await asyncio.gather(
+            probe(client, headers, generation_id, deadline),
+            *(student.run(deadline) for student in students),
+        )
+
+    socket_latencies = [latency for student in students for latency in student.latencies]
+    errors = sum(student.errors for student in students)
+    print(f"{users} sockets, {seconds:.0f}s, {errors} errors")
+    print(f"ws actions      {percentiles(socket_latencies)}")
+    print(f"GET generation  {percentiles(probe_latencies)}")
+
+    p99 = sorted(socket_latencies)[int(len(socket_latencies) * 0.99)] * 1000 if socket_latencies else float("inf")
+    return errors == 0 and p99 <= p99_budget_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--p99-budget-ms", type=float, default=500, help="exit non-zero above this p99")
+    args = parser.parse_args()
+    if not asyncio.run(run(args.url, args.users, args.seconds, args.p99_budget_ms)):
+        sys.exit(f"p99 above {args.p99_budget_ms:.0f} ms or errors")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import pytest, httpx
+from contextlib import contextmanager
 from pytest_asyncio import is_async_test
 
 @pytest.fixture(scope="class")
@@ -52,6 +53,49 @@ def login_guest(request):
 
     return request.cls.access_token
 
+class QueryCounter:
+    """SQL statements sent by the app's engines between `reset` and `count`.
+
+    Inserts into user_actions are flushed by a background task, not the request, so
+    they are left out.
+    """
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith("INSERT INTO USER_ACTIONS"):
+            self.statements.append(statement)
+
+    def reset(self):
+        self.statements.clear()
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+@pytest.fixture
+def query_counter():
+    from sqlalchemy import event
+    from sql_app_2.database import engine2, async_engine2
+
+    counter = QueryCounter()
+    engines = [engine2, async_engine2.sync_engine]
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", counter)
+    yield counter
+    for engine in engines:
+        event.remove(engine, "before_cursor_execute", counter)
+
+@pytest.fixture
+def max_queries(query_counter):
+    """`with max_queries(5): client.get(...)` fails if the block runs more than 5 statements."""
+    @contextmanager
+    def check(limit: int):
+        query_counter.reset()
+        yield query_counter
+        assert query_counter.count <= limit, f"{query_counter.count} queries, expected at most {limit}:\n" + "\n".join(query_counter.statements)
+    return check
+
 # Configure the default asyncio loop scope
 @pytest.fixture(scope="class")
 def asyncio_default_loop_scope():
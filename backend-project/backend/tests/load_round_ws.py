@@ -0,0 +1,167 @@
+"""Round WebSocket throughput with 1, 2, 4, ... gunicorn workers.
+
+Needs MySQL and Redis as for the server, and the test accounts from
+tests/test_play2_bulk_access.py (test_acc1..N / hogehoge) with a playable leaderboard.
+Run from the backend directory:
+
+    python tests/load_round_ws.py --workers 1,2,4,8 --users 100 --seconds 30
+
+For each worker count a server is started with gunicorn.conf.py on --port. Every simulated
+student reconnects for each step like the Gradio client does: resume the round and rename
+it, on a new socket every time. That lands each reconnect on an arbitrary worker, so the
+run also checks that round state survives a change of process. No step calls an LLM.
+Pass --url to measure an already running deployment instead. The client is one asyncio
+process; if its CPU is saturated before the server's, the curve flattens for that reason.
+"""
+import argparse, asyncio, json, os, statistics, subprocess, sys, time
+
+import httpx
+from httpx_ws import aconnect_ws
+
+PASSWORD = "hogehoge"
+
+
+class Student:
+    def __init__(self, client: httpx.AsyncClient, username: str):
+        self.client = client
+        self.username = username
+        self.latencies = []
+        self.errors = 0
+
+    async def login(self):
+        response = await self.client.post("/sqlapp2/token", data={"username": self.username, "password": PASSWORD})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        response = await self.client.get("/sqlapp2/leaderboards/", headers=headers)
+        response.raise_for_status()
+        self.leaderboard_id = response.json()[0][0]['id']
+
+        response = await self.client.post("/sqlapp2/ws_token", headers=headers)
+        response.raise_for_status()
+        ws_url = str(self.client.base_url).replace("http", "ws", 1).rstrip("/")
+        self.url = f"{ws_url}/sqlapp2/ws/{self.leaderboard_id}?token={response.json()['ws_token']}"
+        self.resume = {
+            "action": "resume",
+            "obj": {
+                "leaderboard_id": self.leaderboard_id,
+                "program": "inlab_test",
+                "model": "gpt-4o-mini",
+                "created_at": "2025-04-06T00:00:00Z",
+            },
+        }
+
+    async def _action(self, ws, data) -> dict:
+        start = time.perf_counter()
+        await ws.send_text(json.dumps(data))
+        while True:
+            reply = json.loads(await ws.receive_text())
+            # results of earlier rounds may still be pushed; they are not replies
+            if "event" not in reply:
+                break
+        self.latencies.append(time.perf_counter() - start)
+        return reply
+
+    async def run(self, deadline: float):
+        step = 0
+        while time.perf_counter() < deadline:
+            try:
+                async with aconnect_ws(self.url, self.client) as ws:
+                    reply = await self._action(ws, self.resume)
+                    round_id = reply["round"]["id"]
+                    reply = await self._action(ws, {
+                        "action": "change_display_name",
+                        "obj": {"id": round_id, "display_name": f"{self.username} {step}"},
+                    })
+                    assert reply["round"]["id"] == round_id, reply
+                step += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"{self.username}: {e!r}", file=sys.stderr)
+                await asyncio.sleep(1)
+
+
+async def measure(url: str, users: int, seconds: float) -> dict:
+    limits = httpx.Limits(max_connections=users * 2, max_keepalive_connections=users * 2)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        students = [Student(client, f"test_acc{i}") for i in range(1, users + 1)]
+        await asyncio.gather(*(student.login() for student in students))
+
+        # an unmeasured warm-up creates the rounds and the workers' pools, so only resumes are timed
+        await asyncio.gather(*(student.run(time.perf_counter() + 5) for student in students))
+        for student in students:
+            student.latencies.clear()
+            student.errors = 0
+
+        start = time.perf_counter()
+        await asyncio.gather(*(student.run(start + seconds) for student in students))
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for student in students for latency in student.latencies)
+    return {
+        "actions": len(latencies),
+        "throughput": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) * 1000 if latencies else float("nan"),
+        "p95": latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else float("nan"),
+        "errors": sum(student.errors for student in students),
+    }
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    env = {**os.environ, "WEB_CONCURRENCY": str(workers), "GUNICORN_BIND": f"127.0.0.1:{port}"}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/sqlapp2/", timeout=2).status_code < 500:
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(1)
+    server.terminate()
+    raise RuntimeError(f"server with {workers} workers did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4,8", help="comma separated worker counts")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--url", help="measure this running server instead of starting one")
+    parser.add_argument("--min-efficiency", type=float, default=0.75,
+                        help="fail if throughput per worker at the largest count drops below this share of 1 worker")
+    args = parser.parse_args()
+
+    if args.url:
+        result = asyncio.run(measure(args.url, args.users, args.seconds))
+        print(f"{result['throughput']:8.1f} actions/s  p50 {result['p50']:6.1f} ms  p95 {result['p95']:6.1f} ms  errors {result['errors']}")
+        return
+
+    counts = [int(n) for n in args.workers.split(",")]
+    results = {}
+    print(f"{args.users} students, {args.seconds:.0f}s per run")
+    print(f"{'workers':>7} {'actions/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7} {'efficiency':>10}")
+    for workers in counts:
+        server = start_server(workers, args.port)
+        try:
+            results[workers] = asyncio.run(measure(f"http://127.0.0.1:{args.port}", args.users, args.seconds))
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+        result = results[workers]
+        base = results[counts[0]]["throughput"] / counts[0]
+        efficiency = result["throughput"] / (base * workers)
+        result["efficiency"] = efficiency
+        print(f"{workers:>7} {result['throughput']:>10.1f} {result['p50']:>8.1f} {result['p95']:>8.1f} {result['errors']:>7} {efficiency:>10.0%}")
+
+    largest = results[counts[-1]]
+    if largest["efficiency"] < args.min_efficiency or any(r["errors"] for r in results.values()):
+        sys.exit(f"scaling below {args.min_efficiency:.0%} or errors at {counts[-1]} workers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""llm_scheduler, on its own with a fake clock and through the real call sites.
+
+The call sites pass the API's own `model=` next to the scheduler's model key, so the last
+tests catch a scheduler signature that swallows it. The OpenAI clients run with their own
+retries off, so the scheduler tests cover the limits, priorities and retries that replace them.
+"""
+import asyncio, os, sys
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+sys.path.append(os.getcwd())
+from sql_app_2.dependencies import get_embedding, llm_scheduler, sentence
+
+
+class FakeClock:
+    """Stands in for `time` in llm_scheduler; sleeping moves the clock instead of blocking."""
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_scheduler, "time", clock)
+    # no jitter unless a test asks for it
+    monkeypatch.setattr(llm_scheduler, "random", SimpleNamespace(uniform=lambda low, high: low))
+    monkeypatch.setattr(llm_scheduler, "LLM_RATE_LIMITS", {"m": {"rpm": 60, "tpm": 6000}})
+    monkeypatch.setattr(llm_scheduler, "scheduler", llm_scheduler.LLMScheduler())
+    return clock
+
+
+def rate_limit_error(headers):
+    response = httpx.Response(429, headers=headers, request=httpx.Request("POST", "https://api.openai.com/v1/responses"))
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+def failing_once(error, result="ok"):
+    calls = []
+
+    def fn():
+        calls.append(None)
+        if len(calls) == 1:
+            raise error
+        return result
+    return fn, calls
+
+
+def test_drained_bucket_makes_the_next_call_wait(clock):
+    for _ in range(60):
+        llm_scheduler.call("m", lambda: None)
+    assert clock.sleeps == []
+
+    start = clock.now
+    llm_scheduler.call("m", lambda: None)
+    # 60 requests/min refill one request per second
+    assert clock.now - start == pytest.approx(1.0)
+
+
+def test_tokens_per_minute_bucket_limits_large_requests(clock):
+    llm_scheduler.call("m", lambda: None, est_tokens=6000)
+    start = clock.now
+    llm_scheduler.call("m", lambda: None, est_tokens=3000)
+    # 6000 tokens/min refill 100 tokens per second
+    assert clock.now - start == pytest.approx(30.0)
+
+
+async def test_queued_interactive_call_goes_before_batch(clock, monkeypatch):
+    yield_once = asyncio.sleep
+
+    async def sleep(seconds):
+        # the test moves the clock itself, so both callers see the same refill
+        await yield_once(0)
+    monkeypatch.setattr(llm_scheduler, "asyncio", SimpleNamespace(sleep=sleep))
+    monkeypatch.setattr(llm_scheduler, "LLM_BATCH_RESERVE", 0.0)
+    limiter = llm_scheduler.scheduler._limiter("m")
+    limiter.requests.level = 0.0
+
+    admitted = []
+
+    async def record(priority):
+        admitted.append(priority)
+
+    # the batch call queues first, so only the priority rule can let the other one pass it
+    batch = asyncio.create_task(llm_scheduler.acall("m", record, llm_scheduler.BATCH, priority=llm_scheduler.BATCH))
+    interactive = asyncio.create_task(llm_scheduler.acall("m", record, llm_scheduler.INTERACTIVE, priority=llm_scheduler.INTERACTIVE))
+    for _ in range(5):
+        await yield_once(0)
+    assert admitted == []
+    assert llm_scheduler.scheduler.snapshot()["waiting_interactive"] == 1
+
+    clock.now += 1.0
+    for _ in range(5):
+        await yield_once(0)
+    assert admitted == [llm_scheduler.INTERACTIVE]
+
+    clock.now += 1.0
+    await asyncio.gather(batch, interactive)
+    assert admitted == [llm_scheduler.INTERACTIVE, llm_scheduler.BATCH]
+
+
+def test_rate_limit_waits_for_retry_after(clock):
+    fn, calls = failing_once(rate_limit_error({"retry-after": "7"}))
+    assert llm_scheduler.call("m", fn) == "ok"
+    assert len(calls) == 2
+    assert clock.sleeps == [7.0]
+
+
+def test_backoff_without_retry_after_is_jittered(clock, monkeypatch):
+    bounds = []
+
+    def uniform(low, high):
+        bounds.append((low, high))
+        return high / 2
+    monkeypatch.setattr(llm_scheduler, "random", SimpleNamespace(uniform=uniform))
+    fn, calls = failing_once(rate_limit_error({}))
+    assert llm_scheduler.call("m", fn) == "ok"
+    # full jitter: anywhere between 0 and the exponential step
+    assert bounds == [(0, llm_scheduler.LLM_BACKOFF_BASE)]
+    assert clock.sleeps == [llm_scheduler.LLM_BACKOFF_BASE / 2]
+
+
+def test_empty_retry_budget_raises_instead_of_retrying(clock):
+    llm_scheduler.scheduler._retry_budget = 0.0
+    fn, calls = failing_once(rate_limit_error({"retry-after": "1"}))
+    with pytest.raises(openai.RateLimitError):
+        llm_scheduler.call("m", fn)
+    assert len(calls) == 1
+    assert clock.sleeps == []
+
+
+def test_rate_limit_headers_lower_the_buckets(clock):
+    headers = httpx.Headers({
+        "x-ratelimit-limit-requests": "60",
+        "x-ratelimit-remaining-requests": "0",
+        "x-ratelimit-reset-requests": "2s",
+        "x-ratelimit-limit-tokens": "5000",
+        "x-ratelimit-remaining-tokens": "1200",
+        "x-ratelimit-reset-tokens": "10s",
+    })
+    # the headers belong to the model of the call in flight
+    llm_scheduler.call("m", lambda: llm_scheduler.observe_response(SimpleNamespace(headers=headers)))
+    limiter = llm_scheduler.scheduler._limiter("m")
+    assert limiter.requests.level == 0
+    assert (limiter.tokens.capacity, limiter.tokens.level) == (5000, 1200)
+
+    start = clock.now
+    llm_scheduler.call("m", lambda: None)
+    assert clock.now - start >= 2.0
+
+
+def fake_completion(**request):
+    checked = SimpleNamespace(status=0, corrected_passage=request["messages"][-1]["content"], spelling_mistakes=[], grammar_mistakes=[])
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(parsed=checked))], usage=None)
+
+
+class FakeClient:
+    def __init__(self, asynchronous=False):
+        self.requests = []
+
+        def parse(**request):
+            self.requests.append(request)
+            return fake_completion(**request)
+
+        async def aparse(**request):
+            return parse(**request)
+
+        def create_embedding(**request):
+            self.requests.append(request)
+            return SimpleNamespace(data=[SimpleNamespace(embedding=[0.1, 0.2])], usage=None)
+
+        self.beta = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(parse=aparse if asynchronous else parse)))
+        self.embeddings = SimpleNamespace(create=create_embedding)
+
+
+def test_check_sentence_passes_model_through(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(sentence, "get_openai", lambda: client)
+    status, corrected, _, _ = sentence.checkSentence("An old man crafted a duck.")
+    assert (status, corrected) == (0, "An old man crafted a duck.")
+    assert client.requests[0]["model"] == "gpt-4o"
+
+
+async def test_acheck_sentence_passes_model_through(monkeypatch):
+    client = FakeClient(asynchronous=True)
+    monkeypatch.setattr(sentence, "get_async_openai", lambda: client)
+    status, _, _, _ = await sentence.acheckSentence("An old man crafted a duck.")
+    assert status == 0
+    assert client.requests[0]["model"] == "gpt-4o"
+
+
+def test_embedding_passes_model_through(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(get_embedding, "get_openai", lambda: client)
+    assert get_embedding.get_embedding("a\nduck") == [0.1, 0.2]
+    assert client.requests == [{"input": ["a duck"], "model": "text-embedding-3-small"}]
+    assert llm_scheduler.scheduler.snapshot()["inflight"] == {llm_scheduler.INTERACTIVE: 0, llm_scheduler.BATCH: 0}
@@ -1,18 +1,34 @@
 import pytest
 from fastapi.testclient import TestClient
-import sys, os
+import sys, os, datetime
 sys.path.append(os.getcwd())
 from main import app 
 
 client = TestClient(app)
 
+ROUND_EVENTS = ("interpretation_ready", "score_ready", "interpretation_failed", "score_failed")
+
+# statements per action on the round socket (see conftest.QueryCounter)
+START_QUERY_BUDGET = 20
+SUBMIT_QUERY_BUDGET = 8
+
+def receive_reply(websocket, events: list):
+    """Next reply to an action; worker events pushed in between are collected in `events`."""
+    while True:
+        data = websocket.receive_json()
+        if "event" not in data:
+            return data
+        assert data["event"] in ROUND_EVENTS, data
+        assert "id" in data["generation"]
+        events.append(data)
+
 @pytest.mark.usefixtures("login")
 class TestPlay:
     username = os.getenv("ADMIN_USERNAME")
     password = os.getenv("ADMIN_PASSWORD")
     _client = client
         
-    async def test_websocket(self):
+    async def test_websocket(self, max_queries):
         # Get leaderboard id
         response = self._client.get("/sqlapp2/leaderboards/admin/", headers={"Authorization": f"Bearer {self.access_token}"})
         assert response.status_code == 200, response.json()
@@ -27,26 +43,29 @@ class TestPlay:
             f"/sqlapp2/ws/{leaderboard_id}?token={self.access_token}",
         ) as websocket:
             # Sent json data to the WebSocket to start the game
-            websocket.send_json(
-                {
-                    "action": "start",
-                    "program": "inlab_test",
-                    "obj": {
-                        "leaderboard_id": leaderboard_id,
+            with max_queries(START_QUERY_BUDGET) as queries:
+                websocket.send_json(
+                    {
+                        "action": "start",
                         "program": "inlab_test",
-                        "model": "gpt-4o-mini",
-                        "created_at": "2025-04-06T00:00:00Z",
+                        "obj": {
+                            "leaderboard_id": leaderboard_id,
+                            "program": "inlab_test",
+                            "model": "gpt-4o-mini",
+                            "created_at": "2025-04-06T00:00:00Z",
+                        }
                     }
-                }
-            )
+                )
 
-            # Receive json data from the WebSocket
-            data = websocket.receive_json()
+                # Receive json data from the WebSocket
+                data = websocket.receive_json()
+            print(f"start: {queries.count} queries")
             assert 'leaderboard' in data
             assert 'round' in data
             assert 'chat' in data
 
             leaderboard_image = data['leaderboard']['image']
+            assert 'url' in leaderboard_image and 'id' in leaderboard_image
             round = data['round']
             chat = data['chat']
 
@@ -69,19 +88,21 @@ class TestPlay:
             print(data['chat']['messages'])
 
             # Submit answer
-            websocket.send_json(
-                {
-                    "action": "submit",
-                    "program": "inlab_test",
-                    "obj": {
-                        "round_id": round['id'],
-                        "created_at": "2025-04-06T00:00:00Z",
-                        "generated_time": round['generated_time'],
-                        "sentence": "An old man crafted a wooden duck maciliously."
+            with max_queries(SUBMIT_QUERY_BUDGET) as queries:
+                websocket.send_json(
+                    {
+                        "action": "submit",
+                        "program": "inlab_test",
+                        "obj": {
+                            "round_id": round['id'],
+                            "created_at": "2025-04-06T00:00:00Z",
+                            "generated_time": round['generated_time'],
+                            "sentence": "An old man crafted a wooden duck maciliously."
+                        }
                     }
-                }
-            )
-            data = websocket.receive_json()
+                )
+                data = websocket.receive_json()
+            print(f"submit: {queries.count} queries")
 
             assert 'leaderboard' in data
             assert 'round' in data
@@ -99,7 +120,8 @@ class TestPlay:
                 }
             )
 
-            data = websocket.receive_json()
+            events = []
+            data = receive_reply(websocket, events)
 
             assert 'leaderboard' in data
             assert 'round' in data
@@ -112,6 +134,11 @@ class TestPlay:
             assert 'interpreted_image' in generation
             assert 'image_similarity' in generation
 
+            # the reply waits for the worker, so its results were pushed before it
+            if generation['interpreted_image'] is not None:
+                ready = [e for e in events if e['event'] == 'interpretation_ready']
+                assert not ready or ready[-1]['generation']['interpreted_image']['id'] == generation['interpreted_image']['id']
+
             # end the game
             websocket.send_json(
                 {
@@ -119,10 +146,103 @@ class TestPlay:
                 }
             )
 
-            data = websocket.receive_json()
+            data = receive_reply(websocket, events)
             assert 'leaderboard' in data
             assert 'round' in data
             assert 'chat' in data
             assert 'generation' in data
 
             
+
+    async def test_original_image_conditional_get(self):
+        response = self._client.get("/sqlapp2/leaderboards/admin/", headers={"Authorization": f"Bearer {self.access_token}"})
+        assert response.status_code == 200, response.json()
+        assert len(response.json()) > 0, "No leaderboard found."
+        leaderboard_id = response.json()[0]['id']
+
+        headers = {"Authorization": f"Bearer {self.access_token}"}
+        response = self._client.get(f"/sqlapp2/original_image/{leaderboard_id}", headers=headers)
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith("image/")
+        assert 'immutable' in response.headers['cache-control']
+        etag = response.headers['etag']
+        body = response.content
+
+        response = self._client.get(
+            f"/sqlapp2/original_image/{leaderboard_id}",
+            headers={**headers, "If-None-Match": etag},
+        )
+        assert response.status_code == 304
+        assert response.content == b""
+
+        response = self._client.get(
+            f"/sqlapp2/original_image/{leaderboard_id}",
+            headers={**headers, "Range": "bytes=0-15"},
+        )
+        assert response.status_code == 206
+        assert response.content == body[:16]
+        assert response.headers['content-range'] == f"bytes 0-15/{len(body)}"
+
+    async def test_leaderboards_shared_cache(self, max_queries):
+        from sql_app_2 import caches
+        headers = {"Authorization": f"Bearer {self.access_token}"}
+        # an explicit end date keeps the cache key stable across the two requests
+        params = {"published_at_end": (datetime.date.today() + datetime.timedelta(days=1)).strftime("%d%m%Y")}
+        response = self._client.get("/sqlapp2/leaderboards/", params=params, headers=headers)
+        assert response.status_code == 200, response.json()
+
+        # a worker that has not served the list yet reads it from Redis, not MySQL
+        caches.leaderboard_cache.local.clear()
+        with max_queries(0):
+            cached = self._client.get("/sqlapp2/leaderboards/", params=params, headers=headers)
+        assert cached.status_code == 200, cached.json()
+        assert cached.json() == response.json()
+
+    async def test_generations_cursor(self):
+        headers = {"Authorization": f"Bearer {self.access_token}"}
+        for order_by in ("id", "total_score"):
+            params = {"program": "overview", "order_by": order_by}
+            response = self._client.get("/sqlapp2/generations/", params={**params, "limit": 6}, headers=headers)
+            assert response.status_code == 200, response.json()
+            expected = [generation['id'] for generation, _ in response.json()]
+
+            # walk the same rows two at a time, then back one page
+            seen, pages, cursor = [], [], {}
+            while len(seen) < len(expected):
+                page = self._client.get("/sqlapp2/generations/", params={**params, "limit": 2, **cursor}, headers=headers)
+                assert page.status_code == 200, page.json()
+                pages.append(page)
+                seen += [generation['id'] for generation, _ in page.json()]
+                if "x-next-cursor" not in page.headers:
+                    break
+                cursor = {"cursor": page.headers["x-next-cursor"]}
+            assert seen[:len(expected)] == expected
+            if len(pages) > 1:
+                back = self._client.get("/sqlapp2/generations/", params={**params, "limit": 2, "cursor": pages[1].headers["x-prev-cursor"]}, headers=headers)
+                assert back.json() == pages[0].json()
+
+        response = self._client.get("/sqlapp2/generations/", params={"program": "overview", "cursor": "not-a-cursor"}, headers=headers)
+        assert response.status_code == 400
+
+    async def test_hot_endpoint_queries(self, max_queries):
+        headers = {"Authorization": f"Bearer {self.access_token}"}
+        response = self._client.get("/sqlapp2/generations/", params={"limit": 1}, headers=headers)
+        assert response.status_code == 200, response.json()
+        assert len(response.json()) > 0, "No generation found."
+        generation_id = response.json()[0][0]['id']
+
+        with max_queries(4):
+            response = self._client.get(f"/sqlapp2/generation/{generation_id}", headers=headers)
+        assert response.status_code == 200, response.json()
+        assert response.headers['server-timing'].startswith("db;dur=")
+
+        with max_queries(4):
+            response = self._client.get(f"/sqlapp2/generation/{generation_id}/score", headers=headers)
+        assert response.status_code == 200, response.json()
+
+        # once loaded, an image is served from the cache
+        response = self._client.get(f"/sqlapp2/interpreted_image/{generation_id}", headers=headers)
+        if response.status_code == 200:
+            with max_queries(0):
+                response = self._client.get(f"/sqlapp2/interpreted_image/{generation_id}", headers=headers)
+            assert response.status_code == 200
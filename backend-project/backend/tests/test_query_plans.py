@@ -0,0 +1,128 @@
+"""EXPLAIN the hot crud queries and fail when one of them falls back to a full table scan.
+
+Runs against the database the other tests use, after test_main.py and test_play2.py have
+seeded it. MySQL scans a small table whenever that looks cheaper than an index, so a scan
+(EXPLAIN type ALL) only fails when no index was considered at all, or when the table is
+estimated at more than EXPLAIN_SCAN_MAX_ROWS rows.
+"""
+import os, re, sys
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import event
+
+sys.path.append(os.getcwd())
+from sql_app_2 import crud, models
+from sql_app_2.database import SessionLocal2, engine2
+
+EXPLAIN_SCAN_MAX_ROWS = int(os.getenv("EXPLAIN_SCAN_MAX_ROWS", "1000"))
+# reference tables (scenes, stories, images...) are looked up by primary key and not checked
+HOT_TABLES = {"rounds", "generations", "leaderboards", "school_leaderboards", "messages", "user_actions"}
+
+pytestmark = pytest.mark.skipif(engine2.dialect.name != "mysql", reason="EXPLAIN output is MySQL specific")
+
+HOT_QUERIES = {
+    "rounds of a player on a leaderboard": lambda db, s: crud.get_rounds(db, player_id=s.player_id, leaderboard_id=s.leaderboard_id, is_completed=False),
+    "rounds of a leaderboard": lambda db, s: crud.get_rounds(db, leaderboard_id=s.leaderboard_id),
+    "rounds of a player": lambda db, s: crud.get_rounds(db, player_id=s.player_id),
+    "rounds of a program": lambda db, s: crud.get_rounds(db, program_id=s.program_id),
+    "generations of a leaderboard by score": lambda db, s: crud.get_generations(db, program_id=s.program_id, leaderboard_id=s.leaderboard_id, order_by="total_score"),
+    "generations of a player": lambda db, s: crud.get_generations(db, player_id=s.player_id),
+    "leaderboards of a course": lambda db, s: crud.get_leaderboards(db, school_name=s.school, course_id=s.course_id),
+    "leaderboard stats of a course": lambda db, s: crud.get_leaderboards_stats(db, school_name=s.school, course_id=s.course_id),
+    "stats of a chat": lambda db, s: crud.get_chat_stats(db, chat_id=s.chat_id),
+    "actions of a user": lambda db, s: crud.read_user_action(db, user_id=s.user_id, action_type=s.action),
+}
+
+
+@contextmanager
+def captured_selects():
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(engine2, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine2, "before_cursor_execute", capture)
+
+
+def full_scans(db, statement, parameters) -> list:
+    plan = db.connection().exec_driver_sql("EXPLAIN " + statement, parameters or None).mappings().all()
+    return [
+        row for row in plan
+        # SQLAlchemy aliases a table joined twice as <table>_1
+        if re.sub(r"_\d+$", "", row["table"] or "") in HOT_TABLES
+        and row["type"] == "ALL"
+        and (row["possible_keys"] is None or (row["rows"] or 0) > EXPLAIN_SCAN_MAX_ROWS)
+    ]
+
+
+@pytest.fixture(scope="module")
+def db():
+    db = SessionLocal2()
+    yield db
+    db.close()
+
+
+@pytest.fixture(scope="module")
+def sample(db):
+    db_round = db.query(models.Round).filter(models.Round.program_id.isnot(None)).order_by(models.Round.id.desc()).first()
+    db_link = db.query(models.School_Leaderboard).filter(models.School_Leaderboard.course_id.isnot(None)).first()
+    db_action = db.query(models.User_Action).order_by(models.User_Action.id.desc()).first()
+    if db_round is None or db_link is None or db_action is None:
+        pytest.skip("Seed the database with test_main.py and test_play2.py first")
+    return SimpleNamespace(
+        player_id=db_round.player_id,
+        leaderboard_id=db_round.leaderboard_id,
+        program_id=db_round.program_id,
+        chat_id=db_round.chat_history,
+        school=db_link.school,
+        course_id=db_link.course_id,
+        user_id=db_action.user_id,
+        action=db_action.action,
+    )
+
+
+def test_indexes_exist(db):
+    """The composite indexes in models.py are in the database (alembic upgrade head)."""
+    expected = {
+        (table.name, index.name)
+        for table in models.Base.metadata.sorted_tables
+        for index in table.indexes
+        if len(index.columns) > 1
+    }
+    existing = set(db.connection().exec_driver_sql(
+        "SELECT DISTINCT table_name, index_name FROM information_schema.statistics WHERE table_schema = DATABASE()"
+    ).all())
+    assert expected <= existing, f"Missing indexes: {sorted(expected - existing)}"
+
+
+@pytest.mark.parametrize("name", list(HOT_QUERIES))
+def test_no_full_scan(db, sample, name):
+    with captured_selects() as statements:
+        HOT_QUERIES[name](db, sample)
+    assert statements, f"{name} ran no SELECT"
+    for statement, parameters in statements:
+        scans = full_scans(db, statement, parameters)
+        assert not scans, f"{name} scans {[row['table'] for row in scans]}:\n{statement}"
+
+
+def test_listing_statements_are_cached(db, sample):
+    """Listings with the same filters and different values reuse one compiled statement."""
+    compiled = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        compiled.append(context.compiled)
+
+    event.listen(engine2, "before_cursor_execute", capture)
+    try:
+        for player_id in (sample.player_id, sample.player_id + 1):
+            crud.get_generations(db, player_id=player_id, order_by="total_score", before=[0, 1], limit=5)
+    finally:
+        event.remove(engine2, "before_cursor_execute", capture)
+    assert len(compiled) == 2 and compiled[0] is compiled[1]
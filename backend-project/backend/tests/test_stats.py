@@ -0,0 +1,64 @@
+"""The summary tables of sql_app_2/stats.py against the tables they summarize.
+
+Runs against the database the other tests use, after test_main.py and test_play2.py have
+seeded it. `stats.reconcile` returns the rows it had to repair, so a writer that forgets to
+update a summary shows up as a repaired row.
+"""
+import datetime, os, sys
+
+import pytest
+
+sys.path.append(os.getcwd())
+from sql_app_2 import crud, models, schemas, stats
+from sql_app_2.database import SessionLocal2, engine2
+
+pytestmark = pytest.mark.skipif(engine2.dialect.name != "mysql", reason="the summaries are written with MySQL upserts")
+
+
+@pytest.fixture(scope="module")
+def db():
+    db = SessionLocal2()
+    yield db
+    db.close()
+
+
+def test_reconcile_is_idempotent(db):
+    stats.reconcile(db)
+    assert not any(stats.reconcile(db).values())
+
+
+def test_writers_keep_stats_current(db):
+    db_round = db.query(models.Round).filter(models.Round.leaderboard_id.isnot(None)).order_by(models.Round.id.desc()).first()
+    if db_round is None:
+        pytest.skip("Seed the database with test_main.py and test_play2.py first")
+    stats.reconcile(db)
+
+    now = datetime.datetime.now()
+    new_round = crud.create_round(
+        db,
+        leaderboard_id=db_round.leaderboard_id,
+        user_id=db_round.player_id,
+        created_at=now,
+        program_id=db_round.program_id,
+    )
+    for sender, is_hint in (("assistant", False), ("user", True)):
+        crud.create_message(
+            db,
+            schemas.MessageBase(sender=sender, is_hint=is_hint, content="stats test", created_at=now),
+            chat_id=new_round.chat_history,
+        )
+    db_generation = crud.create_generation(
+        db,
+        round_id=new_round.id,
+        generation=schemas.GenerationCreate(round_id=new_round.id, sentence="A duck.", generated_time=0, created_at=now),
+    )
+    # scored by the worker, completed by the socket, then scored again
+    for values in (
+        {"total_score": 70, "rank": "B", "is_completed": False},
+        {"is_completed": True},
+        {"total_score": 95, "rank": "A", "is_completed": True},
+    ):
+        crud.update_generation3(db, schemas.GenerationComplete(id=db_generation.id, **values))
+
+    assert crud.get_chat_stats(db, chat_id=new_round.chat_history).n_hints == 1
+    assert not any(stats.reconcile(db).values())
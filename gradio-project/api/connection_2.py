@@ -321,16 +321,19 @@ class Play_Round_WS:
 
         # Get WebSocket token
         instance.url = f"{BACKEND_URL}ws/{leaderboard_id}?token={await instance.get_ws_token(request)}"
+        instance.auth = get_auth(request)
         
         return instance
         
     def __init__(self):
         self.ws = None
+        self.auth = None
         self.program = None
         self.resume_round = None
         self.url = None
         self._ws_context = None
         self._closed = False
+        self.events = []
 
     async def send_json(self, json_data):
         """Send JSON data to WebSocket with automatic reconnection"""
@@ -364,6 +367,11 @@ class Play_Round_WS:
 
                 # convert text data to json
                 json_data = json.loads(text_data)
+
+                # worker results are pushed between replies; keep them and wait for the reply
+                if "event" in json_data:
+                    self.events.append(json_data)
+                    continue
                 return json_data
             except json.JSONDecodeError as e:
                 logger.error(f"Invalid JSON received from WebSocket: {e}")
@@ -403,14 +411,13 @@ class Play_Round_WS:
                 
             response = await self.receive_json()
 
-        self.original_image = PILImage.open(
-            io.BytesIO(
-                base64.b64decode(
-                    response['leaderboard']['image']
-                )
-                
-            )
+        # the socket only carries a reference; the image itself comes from the cacheable HTTP endpoint
+        image_response = await http_client.get(
+            f"{BACKEND_URL}original_image/{leaderboard_id}",
+            auth=self.auth,
         )
+        image_response.raise_for_status()
+        self.original_image = PILImage.open(io.BytesIO(image_response.content))
         response = models.Response(**response)
         return response
     
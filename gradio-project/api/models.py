@@ -192,9 +192,14 @@ class LeaderboardUpdate(BaseModel):
     school: list[str]=[]
     vocabularies: list[VocabularyBase]=[]
 
+class ImageRef(BaseModel):
+    id: int
+    url: str
+    etag: Optional[str]=None
+
 class ResponseLeaderboard(BaseModel):
     id: int
-    image: str
+    image: Optional[ImageRef]=None
 
 class ResponseRound(BaseModel):
     id: int
@@ -203,7 +208,7 @@ class ResponseRound(BaseModel):
 
 class ResponseGeneration(BaseModel):
     id: int
-    interpreted_image: Optional[str]=None
+    interpreted_image: Optional[ImageRef]=None
     evaluation_msg: Optional[str]=None
     generated_time: Optional[int]=None
     sentence: Optional[str]=None